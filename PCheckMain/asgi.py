@@ -17,6 +17,20 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PCheckMain.settings')
 
 django_asgi_app = get_asgi_application()
 
+from django.conf import settings
+from main_app import broadcast
+
+# Background threads send to sockets through the server's loop
+broadcast.capture_server_loop()
+
+if settings.RUN_DEADLINE_SCHEDULER:
+    from main_app import scheduler
+    scheduler.start()
+
+if settings.RUN_REPORT_WORKER:
+    from main_app import report_jobs
+    report_jobs.start()
+
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
     'websocket': AuthMiddlewareStack(
@@ -75,11 +75,11 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main_app.middleware.LabStateNotModifiedMiddleware',  # 304 for unchanged status polls
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'account.middleware.ForceRoleSelectionMiddleware',
-    'main_app.middleware.BookingCleanupMiddleware',
     'main_app.middleware.NgrokSkipWarningMiddleware',  # Skip ngrok warning page
 ]
 
@@ -192,6 +192,24 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Fire session warnings, session expiry and suspension releases from a
+# scheduler thread inside the ASGI process (see main_app.scheduler). Turn off
+# when running `manage.py run_scheduler` as a separate daemon instead.
+RUN_DEADLINE_SCHEDULER = os.environ.get('RUN_DEADLINE_SCHEDULER', 'True').lower() in ('true', '1', 'yes')
+
+# Build background report jobs (exports, full analytics reports) in a worker
+# thread inside the ASGI process (see main_app.report_jobs). Turn off when
+# running `manage.py run_report_worker` as a separate process instead.
+RUN_REPORT_WORKER = os.environ.get('RUN_REPORT_WORKER', 'True').lower() in ('true', '1', 'yes')
+
+# Built report job files. Keep this outside MEDIA_ROOT: /media/ is served
+# without authentication, reports only through the staff download view.
+REPORTS_ROOT = os.environ.get('REPORTS_ROOT', str(BASE_DIR / 'var' / 'reports'))
+
+# Where `manage.py train_demand_forecaster` saves the booking demand model
+# that the forecast API loads (see main_app.forecasting).
+DEMAND_FORECAST_MODEL_PATH = os.environ.get('DEMAND_FORECAST_MODEL_PATH', str(BASE_DIR / 'var' / 'demand_forecaster.joblib'))
+
 # django-allauth configuration
 SITE_ID = 1
 
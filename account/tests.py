@@ -1,3 +1,91 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main_app import models, rollups
+from .models import Profile
+
+
+class DashboardQueryTests(TestCase):
+    """The staff dashboard runs a fixed number of queries, whatever the data size."""
+
+    # Queries the dashboard may run once its caches are warm.
+    QUERY_BUDGET = 20
+
+    def setUp(self):
+        staff = User.objects.create_superuser('staff', 'staff@example.com', 'pw')
+        Profile.objects.filter(user=staff).update(role='staff')
+        self.client.force_login(staff)
+        models.College.objects.bulk_create([models.College(name=f'College {i}') for i in range(5)])
+        self.colleges = list(models.College.objects.order_by('id'))
+        models.PC.objects.bulk_create([
+            models.PC(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in range(50)
+        ])
+        self.pcs = list(models.PC.objects.order_by('id'))
+        self.seeded = 0
+
+    def seed(self, count):
+        """Add ``count`` ended bookings (and the students and block bookings they point at)."""
+        start, self.seeded = self.seeded, self.seeded + count
+        now = timezone.now()
+        # bulk_create does not return primary keys on MySQL, so re-read the rows
+        User.objects.bulk_create([User(username=f'student-{start}-{i}') for i in range(max(1, count // 10))])
+        users = list(User.objects.filter(username__startswith=f'student-{start}-'))
+        Profile.objects.bulk_create([
+            Profile(user=user, role='student', college=self.colleges[i % len(self.colleges)])
+            for i, user in enumerate(users)
+        ])
+        models.FacultyBooking.objects.bulk_create([
+            models.FacultyBooking(faculty=users[0], college=self.colleges[i % len(self.colleges)], status='confirmed')
+            for i in range(max(1, count // 100))
+        ])
+        faculty_bookings = list(models.FacultyBooking.objects.filter(faculty=users[0]))
+
+        rng = random.Random(start)
+        statuses = ['confirmed', 'cancelled', 'confirmed']
+        bookings = []
+        for i in range(count):
+            began = now - timedelta(minutes=rng.randint(60, 60 * 24 * 60))
+            bookings.append(models.Booking(
+                user=users[i % len(users)],
+                pc=self.pcs[i % len(self.pcs)],
+                faculty_booking=faculty_bookings[i % len(faculty_bookings)] if i % 20 == 0 else None,
+                status=statuses[i % len(statuses)],
+                start_time=began,
+                end_time=began + timedelta(minutes=30),
+                duration=timedelta(minutes=30),
+                expiry=began + timedelta(minutes=30),
+            ))
+        models.Booking.objects.bulk_create(bookings, batch_size=1000)
+        # Backfill the rollups as the deploy step does, so no request
+        # starts a background backfill
+        rollups.refresh()
+        # Drop cached report sections, so the warm-up request recomputes them
+        # in place rather than in a background refresh
+        cache.clear()
+
+    def dashboard_queries(self):
+        """Queries of a dashboard request once the first request warmed its caches."""
+        self.client.get(reverse('main_app:dashboard'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('main_app:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.seed(100)
+        baseline = self.dashboard_queries()
+        self.assertLessEqual(baseline, self.QUERY_BUDGET)
 
-# Create your tests here.
+        self.seed(2000)
+        self.client.get(reverse('main_app:dashboard'))
+        with self.assertNumQueries(baseline):
+            self.client.get(reverse('main_app:dashboard'))
@@ -167,105 +167,91 @@ class ProfileUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
 @permission_required('account.view_dashboard', raise_exception=True)
 def dashboard(request):
     from main_app.models import Booking, PC, College
+    from main_app import occupancy
     from django.contrib.auth.models import User
     from datetime import timedelta
-    from django.db.models import Count, Avg, Sum
+    from django.db.models import Count, Avg, Q
+    from django.db.models.functions import ExtractHour, TruncDate
     from django.utils import timezone as tz
-    import calendar
     
-    # Total sessions and average duration
-    total_bookings = Booking.objects.filter(status='confirmed').count()
-    avg_duration = Booking.objects.filter(
-        status='confirmed', 
-        duration__isnull=False
-    ).aggregate(Avg('duration'))['duration__avg']
+    # Every statistic below is one grouped query, so the page costs the same
+    # number of queries however many bookings exist (see DashboardQueryTests)
+    now = tz.now()
+    
+    # Session counts and average duration
+    totals = Booking.objects.aggregate(
+        confirmed=Count('id', filter=Q(status='confirmed')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        pending=Count('id', filter=Q(status__isnull=True)),
+        avg_duration=Avg('duration', filter=Q(status='confirmed', duration__isnull=False)),
+    )
+    total_bookings = totals['confirmed']
     
     # Convert timedelta to minutes for display
     avg_duration_minutes = 0
-    if avg_duration:
-        avg_duration_minutes = int(avg_duration.total_seconds() / 60)
-    
-    # Peak usage hours (analyze by hour of the day)
-    peak_hours = {}
-    bookings = Booking.objects.filter(status='confirmed', start_time__isnull=False)
-    for booking in bookings:
-        hour = booking.start_time.hour
-        peak_hours[hour] = peak_hours.get(hour, 0) + 1
-    
-    sorted_hours = sorted(peak_hours.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    # College breakdown - count confirmed bookings by college
-    college_data = {}
-    for college in College.objects.all():
-        # Count regular bookings where user has a profile with this college
-        regular_count = Booking.objects.filter(
-            status='confirmed',
-            user__profile__college=college,
-            faculty_booking__isnull=True  # Exclude faculty bookings here
-        ).count()
-        
-        # Count unique faculty bookings for this college (to avoid double counting)
-        # Each faculty booking can have multiple PCs, but we count the booking once
-        faculty_booking_count = Booking.objects.filter(
-            status='confirmed',
-            faculty_booking__isnull=False,
-            faculty_booking__college=college
-        ).values('faculty_booking').distinct().count()
-        
-        college_data[college.name] = regular_count + faculty_booking_count
-    
-    # Successful vs canceled bookings
-    successful = Booking.objects.filter(status='confirmed').count()
-    canceled = Booking.objects.filter(status='cancelled').count()
-    pending = Booking.objects.filter(status__isnull=True).count()
-    
-    # Time-based statistics (last 30 days, timezone-aware)
-    thirty_days_ago = tz.now() - timedelta(days=30)
-    recent_bookings = Booking.objects.filter(
-        created_at__gte=thirty_days_ago
+    if totals['avg_duration']:
+        avg_duration_minutes = int(totals['avg_duration'].total_seconds() / 60)
+    
+    # Peak usage hours (local hour of the day the session started)
+    peak_hours = Booking.objects.filter(
+        status='confirmed', start_time__isnull=False
+    ).annotate(
+        hour=ExtractHour('start_time')
+    ).values('hour').annotate(count=Count('id')).order_by('-count', 'hour')[:5]
+    sorted_hours = [(row['hour'], row['count']) for row in peak_hours]
+    
+    # College breakdown - confirmed student bookings by the student's college,
+    # plus each faculty block booking once (it can hold several PCs)
+    regular_counts = dict(
+        Booking.objects.filter(
+            status='confirmed', faculty_booking__isnull=True, user__profile__college__isnull=False
+        ).values_list('user__profile__college').annotate(count=Count('id'))
+    )
+    faculty_counts = dict(
+        Booking.objects.filter(
+            status='confirmed', faculty_booking__college__isnull=False
+        ).values_list('faculty_booking__college').annotate(count=Count('faculty_booking', distinct=True))
     )
+    college_data = {
+        college.name: regular_counts.get(college.id, 0) + faculty_counts.get(college.id, 0)
+        for college in College.objects.all()
+    }
     
-    # Build daily stats using the same timezone-aware "now" reference
+    # Bookings created per local day over the last 30 days, newest first
+    today = tz.localdate()
+    daily_counts = dict(
+        Booking.objects.filter(
+            created_at__gte=now - timedelta(days=31)
+        ).annotate(
+            day=TruncDate('created_at')
+        ).values_list('day').annotate(count=Count('id'))
+    )
     daily_stats = {}
-    now = tz.now()
     for i in range(30):
-        date = now - timedelta(days=i)
-        count = Booking.objects.filter(
-            created_at__date=date.date()
-        ).count()
-        daily_stats[date.strftime('%Y-%m-%d')] = count
+        date = today - timedelta(days=i)
+        daily_stats[date.strftime('%Y-%m-%d')] = daily_counts.get(date, 0)
     
     # Get all PCs for display
     pc_list = PC.objects.all().order_by('name')
     
-    # Get active bookings (in_queue and confirmed)
-    from django.utils import timezone as tz
-    active_bookings = Booking.objects.filter(
-        status__in=['confirmed', None]
-    ).exclude(
-        status='cancelled'
-    ).select_related('user', 'pc', 'user__profile').order_by('-created_at')
-    
-    # Calculate time remaining for each active booking and count active confirmed sessions
-    now = tz.now()
-    active_confirmed_count = 0
+    # Sessions running right now, with their time remaining
+    active_bookings = list(
+        Booking.objects.filter(
+            status='confirmed', expiry__isnull=True, end_time__gt=now
+        ).filter(
+            Q(start_time__isnull=True) | Q(start_time__lte=now)
+        ).select_related('user', 'pc', 'user__profile').order_by('-created_at')
+    )
     for booking in active_bookings:
-        if booking.end_time and booking.status == 'confirmed':
-            remaining = booking.end_time - now
-            if remaining.total_seconds() > 0:
-                booking.time_remaining_minutes = int(remaining.total_seconds() / 60)
-                active_confirmed_count += 1
-            else:
-                booking.time_remaining_minutes = 0
-        else:
-            booking.time_remaining_minutes = None
+        booking.time_remaining_minutes = int((booking.end_time - now).total_seconds() / 60)
+    active_confirmed_count = len(active_bookings)
     
     # Get quick analytics stats from the analytics module
     try:
-        from main_app.analytics import PredictiveAnalytics
-        peak_usage = PredictiveAnalytics.predict_peak_usage_hours()
-        booking_trend = PredictiveAnalytics.predict_booking_trends()
-        violation_risks = PredictiveAnalytics.predict_user_violation_risk()
+        from main_app import report_cache
+        peak_usage = report_cache.get_section('predictive', 'peak_usage_hours')['value']
+        booking_trend = report_cache.get_section('predictive', 'booking_trends')['value']
+        violation_risks = report_cache.get_section('predictive', 'user_violation_risks')['value']
     except Exception as e:
         # Fallback if analytics fail
         peak_usage = {'peak_hours': []}
@@ -273,18 +259,19 @@ def dashboard(request):
         violation_risks = {'high_risk_users': []}
     
     # Get stats for the template
+    pc_counts = occupancy.get_counts()
     context = {
         'total_bookings': total_bookings,
         'avg_duration_minutes': avg_duration_minutes,
         'peak_hours': sorted_hours,
         'college_data': college_data,
-        'successful_bookings': successful,
-        'canceled_bookings': canceled,
-        'pending_bookings': pending,
+        'successful_bookings': totals['confirmed'],
+        'canceled_bookings': totals['cancelled'],
+        'pending_bookings': totals['pending'],
         'daily_stats': daily_stats,
         'total_users': User.objects.count(),
-        'total_pcs': PC.objects.count(),
-        'available_pcs': PC.objects.filter(booking_status='available').count(),
+        'total_pcs': pc_counts['total'],
+        'available_pcs': pc_counts['unbooked'],
         'pc_list': pc_list,
         'active_bookings': active_bookings,
         'active_confirmed_count': active_confirmed_count,
@@ -307,12 +294,8 @@ def sf_home(request):
             return redirect('account:complete-profile')
     
     # Get available PC count for display
-    from main_app import models
-    available_count = models.PC.objects.filter(
-        status='connected',
-        system_condition='active',
-        booking_status__in=['available', None]
-    ).count()
+    from main_app import occupancy
+    available_count = occupancy.get_counts()['available']
     
     context = {
         'available_count': available_count
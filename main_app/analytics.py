@@ -1,14 +1,82 @@
 """
 Analytics module for PCheck system with descriptive and predictive analytics.
 Provides insights into PC usage, violations, bookings, and system performance.
+
+Counts over a period are read from the hourly UsageRollup table (see
+main_app.rollups); only per-user breakdowns still query the raw rows.
+Distributions the rollups cannot answer (session lengths) are computed on
+columnar frames by main_app.analytics_engine.
 """
 
-from django.db.models import Count, Q, Avg, Sum, F
+import numpy as np
+from django.db import connections
+from django.db.models import Count, Q, Avg, Sum, F, DateField
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, Trunc
 from django.utils import timezone
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-import statistics
-from .models import Booking, Violation, PeripheralEvent, PC, User, FacultyBooking
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from .models import Booking, Violation, PeripheralEvent, User, FacultyBooking
+from . import analytics_engine, forecasting, occupancy, rollups, utilization
+
+
+def bucket_series(queryset, field, unit, value=None, start=None, end=None):
+    """
+    Group ``queryset`` by the local ``unit`` of ``field`` in the database.
+
+    ``unit`` is 'hour' (0-23), 'weekday' (1 = Monday .. 7 = Sunday), 'day'
+    (date) or 'week' (date of the ISO week's Monday, so weeks of different
+    years never share a key). DateTimeFields are bucketed in TIME_ZONE by the
+    database; DateFields and integer hour columns (UsageRollup) are used as
+    stored. ``value`` is the aggregate per bucket, Count('pk') by default.
+
+    The series is dense: every hour or weekday, and every day or week from
+    ``start`` to ``end`` (dates or datetimes; default the first and last
+    bucket found), with 0 for empty buckets.
+
+    Returns:
+        list: (bucket, value) pairs in bucket order
+    """
+    is_datetime = queryset.model._meta.get_field(field).get_internal_type() == 'DateTimeField'
+    tz_kwargs = {'tzinfo': timezone.get_default_timezone()} if is_datetime else {}
+    buckets = None
+    if unit == 'hour':
+        key = ExtractHour(field, **tz_kwargs) if is_datetime else F(field)
+        buckets = list(range(24))
+    elif unit == 'weekday':
+        key = ExtractIsoWeekDay(field, **tz_kwargs)
+        buckets = list(range(1, 8))
+    elif unit in ('day', 'week'):
+        key = Trunc(field, unit, output_field=DateField(), **tz_kwargs)
+    else:
+        raise ValueError(f"Unknown bucket unit: {unit}")
+
+    rows = queryset.order_by().annotate(bucket=key).values('bucket').annotate(
+        total=value if value is not None else Count('pk')
+    )
+    totals = {row['bucket']: row['total'] or 0 for row in rows}
+
+    if buckets is None:
+        first = _local_date(start) if start else min(totals, default=None)
+        last = _local_date(end) if end else max(totals, default=None)
+        if first is None or last is None:
+            return []
+        step = timedelta(days=1)
+        if unit == 'week':
+            first -= timedelta(days=first.weekday())
+            step = timedelta(days=7)
+        buckets = []
+        while first <= last:
+            buckets.append(first)
+            first += step
+
+    return [(bucket, totals.get(bucket, 0)) for bucket in buckets]
+
+
+def _local_date(value):
+    return timezone.localdate(value) if isinstance(value, datetime) else value
 
 
 class DescriptiveAnalytics:
@@ -23,57 +91,75 @@ class DescriptiveAnalytics:
             end_date = timezone.now()
         
         bookings = Booking.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
+        rollup = rollups.rows(start_date, end_date)
+        totals = rollup.aggregate(
+            total=Sum('bookings'),
+            confirmed=Sum('confirmed_bookings'),
+            cancelled=Sum('cancelled_bookings'),
+            timed=Sum('timed_bookings'),
+            minutes=Sum('booked_minutes'),
+        )
         
         stats = {
-            'total_bookings': bookings.count(),
-            'confirmed_bookings': bookings.filter(status='confirmed').count(),
-            'cancelled_bookings': bookings.filter(status='cancelled').count(),
+            'total_bookings': totals['total'] or 0,
+            'confirmed_bookings': totals['confirmed'] or 0,
+            'cancelled_bookings': totals['cancelled'] or 0,
             'avg_duration_minutes': None,
             'total_pc_hours': 0,
             'bookings_by_college': {},
-            'bookings_by_user': bookings.values('user__username').annotate(count=Count('id')).order_by('-count')[:10],
+            'bookings_by_user': list(bookings.values('user__username').annotate(count=Count('id')).order_by('-count')[:10]),
         }
         
         # Calculate average duration
-        durations = bookings.filter(duration__isnull=False).values_list('duration', flat=True)
-        if durations:
-            avg_seconds = sum(d.total_seconds() for d in durations) / len(durations)
-            stats['avg_duration_minutes'] = round(avg_seconds / 60, 2)
-            stats['total_pc_hours'] = sum(d.total_seconds() for d in durations) / 3600
+        if totals['timed']:
+            stats['avg_duration_minutes'] = round(totals['minutes'] / totals['timed'], 2)
+            stats['total_pc_hours'] = totals['minutes'] / 60
         
         # Bookings by college
-        college_bookings = bookings.filter(user__profile__college__isnull=False).values(
-            'user__profile__college__name'
-        ).annotate(count=Count('id')).order_by('-count')
-        stats['bookings_by_college'] = {b['user__profile__college__name']: b['count'] for b in college_bookings}
+        college_bookings = rollup.filter(college__isnull=False).values(
+            'college__name'
+        ).annotate(count=Sum('bookings')).filter(count__gt=0).order_by('-count')
+        stats['bookings_by_college'] = {b['college__name']: b['count'] for b in college_bookings}
         
         return stats
     
+    @staticmethod
+    def get_session_duration_statistics(start_date=None, end_date=None):
+        """Distribution of booked session lengths, overall and per college"""
+        if not start_date:
+            start_date = timezone.now() - timedelta(days=30)
+        if not end_date:
+            end_date = timezone.now()
+        
+        bookings = Booking.objects.filter(
+            created_at__gte=start_date, created_at__lte=end_date, duration__isnull=False
+        )
+        frame = analytics_engine.load_bookings(bookings, columns=('duration', 'college_id'))
+        return analytics_engine.duration_statistics(frame)
+    
     @staticmethod
     def get_pc_utilization():
-        """Get PC utilization metrics"""
-        pcs = PC.objects.all()
-        bookings = Booking.objects.filter(status='confirmed', end_time__gte=timezone.now() - timedelta(days=30))
-        
-        utilization = {
-            'total_pcs': pcs.count(),
-            'active_pcs': pcs.filter(system_condition='active', status='connected').count(),
-            'in_repair': pcs.filter(system_condition='repair').count(),
-            'disconnected': pcs.filter(status='disconnected').count(),
-            'available': pcs.filter(booking_status='available', system_condition='active', status='connected').count(),
-            'in_use': pcs.filter(booking_status='in_use').count(),
-            'in_queue': pcs.filter(booking_status='in_queue').count(),
+        """Get PC utilization metrics (avg_utilization_percent: see utilization.get_occupancy)"""
+        counts = occupancy.get_counts()
+        
+        stats = {
+            'total_pcs': counts['total'],
+            'active_pcs': counts['active'],
+            'in_repair': counts['in_repair'],
+            'disconnected': counts['disconnected'],
+            'available': counts['available'],
+            'in_use': counts['in_use'],
+            'in_queue': counts['in_queue'],
         }
         
-        # Calculate average utilization percentage
-        if bookings.exists():
-            utilization['avg_utilization_percent'] = round(
-                (utilization['active_pcs'] / max(utilization['total_pcs'], 1)) * 100, 2
-            )
-        else:
-            utilization['avg_utilization_percent'] = 0
+        # Occupied PC-minutes within booking hours over the last 30 days
+        today = timezone.localdate()
+        last_30_days = utilization.get_occupancy(today - timedelta(days=29), today)
+        stats['avg_utilization_percent'] = last_30_days['utilization_percent']
+        stats['occupied_pc_hours'] = last_30_days['occupied_pc_hours']
+        stats['peak_concurrent_pcs'] = last_30_days['peak_pcs']
         
-        return utilization
+        return stats
     
     @staticmethod
     def get_violation_statistics(start_date=None, end_date=None):
@@ -84,20 +170,27 @@ class DescriptiveAnalytics:
             end_date = timezone.now()
         
         violations = Violation.objects.filter(timestamp__gte=start_date, timestamp__lte=end_date)
+        levels = rollups.rows(start_date, end_date).aggregate(
+            minor=Sum('minor_violations'),
+            moderate=Sum('moderate_violations'),
+            major=Sum('major_violations'),
+        )
+        by_level = {level: count or 0 for level, count in levels.items()}
+        # Resolution changes after the fact, so it is counted from the raw rows
+        resolution = violations.aggregate(
+            resolved_count=Count('id', filter=Q(resolved=True)),
+            unresolved_count=Count('id', filter=Q(resolved=False)),
+        )
         
         stats = {
-            'total_violations': violations.count(),
-            'resolved_violations': violations.filter(resolved=True).count(),
-            'unresolved_violations': violations.filter(resolved=False).count(),
-            'violations_by_level': {
-                'minor': violations.filter(level='minor').count(),
-                'moderate': violations.filter(level='moderate').count(),
-                'major': violations.filter(level='major').count(),
-            },
+            'total_violations': sum(by_level.values()),
+            'resolved_violations': resolution['resolved_count'],
+            'unresolved_violations': resolution['unresolved_count'],
+            'violations_by_level': by_level,
             'violations_by_reason': {},
-            'repeat_offenders': violations.values('user__username').annotate(
+            'repeat_offenders': list(violations.values('user__username').annotate(
                 count=Count('id')
-            ).filter(count__gt=1).order_by('-count')[:10],
+            ).filter(count__gt=1).order_by('-count')[:10]),
             'suspended_users': violations.filter(status='suspended').values('user__username').distinct().count(),
         }
         
@@ -117,21 +210,28 @@ class DescriptiveAnalytics:
         
         faculty_bookings = FacultyBooking.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
         
+        totals = faculty_bookings.aggregate(
+            total=Count('id'),
+            confirmed=Count('id', filter=Q(status='confirmed')),
+            pending=Count('id', filter=Q(status='pending')),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+            devices=Sum('num_of_devices'),
+            avg_devices=Avg('num_of_devices'),
+        )
+        
         stats = {
-            'total_faculty_bookings': faculty_bookings.count(),
-            'confirmed': faculty_bookings.filter(status='confirmed').count(),
-            'pending': faculty_bookings.filter(status='pending').count(),
-            'cancelled': faculty_bookings.filter(status='cancelled').count(),
-            'total_devices_requested': faculty_bookings.aggregate(Sum('num_of_devices'))['num_of_devices__sum'] or 0,
+            'total_faculty_bookings': totals['total'],
+            'confirmed': totals['confirmed'],
+            'pending': totals['pending'],
+            'cancelled': totals['cancelled'],
+            'total_devices_requested': totals['devices'] or 0,
             'avg_devices_per_booking': None,
             'bookings_by_college': {},
         }
         
         # Average devices per booking
-        if faculty_bookings.exists():
-            stats['avg_devices_per_booking'] = round(
-                statistics.mean(faculty_bookings.values_list('num_of_devices', flat=True)), 2
-            )
+        if totals['avg_devices'] is not None:
+            stats['avg_devices_per_booking'] = round(float(totals['avg_devices']), 2)
         
         # Bookings by college
         college_bookings = faculty_bookings.values('college__name').annotate(
@@ -150,17 +250,23 @@ class DescriptiveAnalytics:
             end_date = timezone.now()
         
         events = PeripheralEvent.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
+        rollup = rollups.rows(start_date, end_date)
+        totals = rollup.aggregate(
+            total=Sum('peripheral_events'),
+            attached=Sum('peripheral_attachments'),
+            removed=Sum('peripheral_removals'),
+        )
         
         stats = {
-            'total_events': events.count(),
-            'devices_attached': events.filter(action='attached').count(),
-            'devices_removed': events.filter(action='removed').count(),
-            'most_affected_pcs': events.values('pc__name').annotate(
-                count=Count('id')
-            ).order_by('-count')[:10],
-            'most_common_devices': events.values('device_name').annotate(
+            'total_events': totals['total'] or 0,
+            'devices_attached': totals['attached'] or 0,
+            'devices_removed': totals['removed'] or 0,
+            'most_affected_pcs': list(rollup.values('pc__name').annotate(
+                count=Sum('peripheral_events')
+            ).filter(count__gt=0).order_by('-count')[:10]),
+            'most_common_devices': list(events.values('device_name').annotate(
                 count=Count('id')
-            ).order_by('-count')[:10],
+            ).order_by('-count')[:10]),
         }
         
         return stats
@@ -172,16 +278,11 @@ class PredictiveAnalytics:
     @staticmethod
     def predict_peak_usage_hours():
         """Predict peak PC usage hours based on historical data"""
-        bookings = Booking.objects.filter(
-            start_time__isnull=False,
-            status='confirmed',
-            created_at__gte=timezone.now() - timedelta(days=60)
+        # Hours are local (TIME_ZONE), by session start
+        sessions = bucket_series(
+            rollups.rows(timezone.now() - timedelta(days=60)), 'hour', 'hour', Sum('sessions_started')
         )
-        
-        hour_usage = defaultdict(int)
-        for booking in bookings:
-            hour = booking.start_time.hour
-            hour_usage[hour] += 1
+        hour_usage = {hour: count for hour, count in sessions if count}
         
         if not hour_usage:
             return {'peak_hours': [], 'hourly_distribution': {}}
@@ -198,18 +299,12 @@ class PredictiveAnalytics:
     @staticmethod
     def predict_peak_usage_days():
         """Predict peak PC usage days of the week"""
-        bookings = Booking.objects.filter(
-            start_time__isnull=False,
-            status='confirmed',
-            created_at__gte=timezone.now() - timedelta(days=90)
+        sessions = bucket_series(
+            rollups.rows(timezone.now() - timedelta(days=90)), 'date', 'weekday', Sum('sessions_started')
         )
         
         day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        day_usage = defaultdict(int)
-        
-        for booking in bookings:
-            day = booking.start_time.weekday()
-            day_usage[day] += 1
+        day_usage = {weekday - 1: count for weekday, count in sessions if count}
         
         if not day_usage:
             return {'peak_days': [], 'daily_distribution': {}}
@@ -263,14 +358,10 @@ class PredictiveAnalytics:
     @staticmethod
     def predict_pc_maintenance_needs():
         """Predict which PCs likely need maintenance based on event frequency"""
-        events = PeripheralEvent.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=60)
-        )
-        
-        pc_events = events.values('pc__id', 'pc__name').annotate(
-            event_count=Count('id'),
-            removed_count=Count('id', filter=Q(action='removed')),
-        ).order_by('-removed_count')
+        pc_events = rollups.rows(timezone.now() - timedelta(days=60)).values('pc__id', 'pc__name').annotate(
+            event_count=Sum('peripheral_events'),
+            removed_count=Sum('peripheral_removals'),
+        ).filter(event_count__gt=0).order_by('-removed_count')
         
         maintenance_needs = []
         for pc in pc_events:
@@ -296,25 +387,22 @@ class PredictiveAnalytics:
     @staticmethod
     def predict_booking_trends():
         """Predict future booking trends based on historical patterns"""
-        bookings = Booking.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=90)
-        )
+        end = timezone.now()
+        start = end - timedelta(days=90)
         
-        # Group by week
-        weekly_bookings = defaultdict(int)
-        for booking in bookings:
-            week = booking.created_at.isocalendar()[1]
-            weekly_bookings[week] += 1
+        # Group by week (keyed by the week's Monday, so weeks never collide across years)
+        weekly_bookings = bucket_series(rollups.rows(start, end), 'date', 'week', Sum('bookings'), start, end)
         
-        if len(weekly_bookings) < 2:
+        if sum(1 for _, count in weekly_bookings if count) < 2:
             return {'trend': 'insufficient_data', 'prediction': None}
         
-        weeks = sorted(weekly_bookings.keys())
-        values = [weekly_bookings[w] for w in weeks]
+        weeks = [week for week, _ in weekly_bookings]
+        values = [count for _, count in weekly_bookings]
         
         # Simple trend analysis
-        recent_avg = statistics.mean(values[-4:]) if len(values) >= 4 else statistics.mean(values)
-        older_avg = statistics.mean(values[:len(values)//2]) if len(values) >= 4 else recent_avg
+        values = np.asarray(values, dtype=float)
+        recent_avg = values[-4:].mean() if len(values) >= 4 else values.mean()
+        older_avg = values[:len(values)//2].mean() if len(values) >= 4 else recent_avg
         
         trend = 'stable'
         if recent_avg > older_avg * 1.1:
@@ -322,40 +410,49 @@ class PredictiveAnalytics:
         elif recent_avg < older_avg * 0.9:
             trend = 'decreasing'
         
-        # Forecast next week
-        if len(values) >= 2:
-            predicted_next_week = int(statistics.mean(values[-4:]))
-        else:
-            predicted_next_week = int(recent_avg)
+        # Forecast next week: the trained demand model when there is one,
+        # else the average of the last four weeks
+        try:
+            forecast = forecasting.get_forecast()
+            predicted_next_week = int(round(sum(day['predicted'] for day in forecast['daily'][:7])))
+            method = 'seasonal_model'
+        except forecasting.NotTrained:
+            predicted_next_week = int(values[-4:].mean())
+            method = 'four_week_average'
         
         return {
             'trend': trend,
             'current_weekly_average': int(recent_avg),
             'predicted_next_week_bookings': predicted_next_week,
+            'prediction_method': method,
             'historical_data_points': len(weeks),
         }
     
     @staticmethod
     def predict_resource_demand():
         """Predict future resource demand (devices needed for faculty bookings)"""
+        # Next 14 local days, starting today
+        today = timezone.localdate()
+        last_day = today + timedelta(days=13)
         faculty_bookings = FacultyBooking.objects.filter(
             start_datetime__gte=timezone.now(),
+            start_datetime__lt=rollups.day_bounds(last_day)[1],
             status__in=['pending', 'confirmed']
         )
         
         # Group by day
-        daily_demand = defaultdict(int)
-        for booking in faculty_bookings:
-            day = booking.start_datetime.date()
-            daily_demand[day] += booking.num_of_devices
+        daily_demand = bucket_series(
+            faculty_bookings, 'start_datetime', 'day', Sum('num_of_devices'), today, last_day
+        )
         
         upcoming_demand = []
-        for day in sorted(daily_demand.keys())[:14]:  # Next 14 days
-            upcoming_demand.append({
-                'date': day.isoformat(),
-                'devices_needed': daily_demand[day],
-                'day_of_week': day.strftime('%A'),
-            })
+        for day, devices in daily_demand:
+            if devices:
+                upcoming_demand.append({
+                    'date': day.isoformat(),
+                    'devices_needed': devices,
+                    'day_of_week': day.strftime('%A'),
+                })
         
         total_needed = sum(d['devices_needed'] for d in upcoming_demand)
         
@@ -368,21 +465,21 @@ class PredictiveAnalytics:
     @staticmethod
     def predict_user_behavior_change():
         """Predict changes in user booking behavior"""
+        rollup = rollups.rows()
+        
         # Get current month bookings
-        current_month_start = timezone.now().replace(day=1)
-        current_month_bookings = Booking.objects.filter(
-            created_at__gte=current_month_start,
-            status='confirmed'
-        ).count()
+        current_month_start = timezone.localdate().replace(day=1)
+        current_month_bookings = rollup.filter(
+            date__gte=current_month_start,
+        ).aggregate(count=Sum('confirmed_bookings'))['count'] or 0
         
         # Get last month bookings
         last_month_end = current_month_start - timedelta(days=1)
         last_month_start = last_month_end.replace(day=1)
-        last_month_bookings = Booking.objects.filter(
-            created_at__gte=last_month_start,
-            created_at__lte=last_month_end,
-            status='confirmed'
-        ).count()
+        last_month_bookings = rollup.filter(
+            date__gte=last_month_start,
+            date__lte=last_month_end,
+        ).aggregate(count=Sum('confirmed_bookings'))['count'] or 0
         
         change_percent = 0
         if last_month_bookings > 0:
@@ -406,10 +503,12 @@ class PredictiveAnalytics:
         """Detect anomalies in system usage"""
         anomalies = []
         
+        recent = rollups.rows(timezone.now() - timedelta(days=7))
+        
         # Check for unusual booking cancellation rate
-        recent_bookings = Booking.objects.filter(created_at__gte=timezone.now() - timedelta(days=7))
-        if recent_bookings.exists():
-            cancellation_rate = recent_bookings.filter(status='cancelled').count() / recent_bookings.count()
+        recent_bookings = recent.aggregate(total=Sum('bookings'), cancelled=Sum('cancelled_bookings'))
+        if recent_bookings['total']:
+            cancellation_rate = recent_bookings['cancelled'] / recent_bookings['total']
             if cancellation_rate > 0.3:
                 anomalies.append({
                     'type': 'high_cancellation_rate',
@@ -419,9 +518,9 @@ class PredictiveAnalytics:
                 })
         
         # Check for PC with excessive events
-        excessive_events = PeripheralEvent.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=7)
-        ).values('pc__name').annotate(count=Count('id')).filter(count__gt=20)
+        excessive_events = recent.values('pc__name').annotate(
+            count=Sum('peripheral_events')
+        ).filter(count__gt=20)
         
         for event in excessive_events:
             anomalies.append({
@@ -450,39 +549,92 @@ class PredictiveAnalytics:
         return {'detected_anomalies': anomalies}
 
 
+# Report sections are independent, so they run at the same time on one
+# process-wide pool; each worker thread uses its own database connection.
+SECTION_WORKERS = 6
+_section_pool = None
+_section_pool_lock = threading.Lock()
+
+
+def _get_section_pool():
+    global _section_pool
+    with _section_pool_lock:
+        if _section_pool is None:
+            _section_pool = ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix='analytics-section')
+        return _section_pool
+
+
 class AnalyticsSummary:
     """Comprehensive analytics summary combining descriptive and predictive insights"""
     
+    # (group, section, takes the report period, function). Period sections are
+    # called with (start_date, end_date); the others use their own windows.
+    SECTIONS = [
+        ('descriptive', 'bookings', True, DescriptiveAnalytics.get_booking_statistics),
+        ('descriptive', 'session_durations', True, DescriptiveAnalytics.get_session_duration_statistics),
+        ('descriptive', 'pc_utilization', False, DescriptiveAnalytics.get_pc_utilization),
+        ('descriptive', 'violations', True, DescriptiveAnalytics.get_violation_statistics),
+        ('descriptive', 'faculty_bookings', True, DescriptiveAnalytics.get_faculty_booking_statistics),
+        ('descriptive', 'peripheral_events', True, DescriptiveAnalytics.get_peripheral_events_summary),
+        ('predictive', 'peak_usage_hours', False, PredictiveAnalytics.predict_peak_usage_hours),
+        ('predictive', 'peak_usage_days', False, PredictiveAnalytics.predict_peak_usage_days),
+        ('predictive', 'user_violation_risks', False, PredictiveAnalytics.predict_user_violation_risk),
+        ('predictive', 'pc_maintenance_needs', False, PredictiveAnalytics.predict_pc_maintenance_needs),
+        ('predictive', 'booking_trends', False, PredictiveAnalytics.predict_booking_trends),
+        ('predictive', 'resource_demand', False, PredictiveAnalytics.predict_resource_demand),
+        ('predictive', 'user_behavior_changes', False, PredictiveAnalytics.predict_user_behavior_change),
+        ('predictive', 'anomalies', False, PredictiveAnalytics.anomaly_detection),
+    ]
+    
+    @staticmethod
+    def get_section(group, name, days=30):
+        """Compute one section of the report (see SECTIONS)"""
+        for section_group, section_name, uses_period, func in AnalyticsSummary.SECTIONS:
+            if (section_group, section_name) == (group, name):
+                if uses_period:
+                    end_date = timezone.now()
+                    return func(end_date - timedelta(days=days), end_date)
+                return func()
+        raise KeyError(f"Unknown analytics section: {group}.{name}")
+    
+    @staticmethod
+    def evaluate_sections(sections, days=30):
+        """
+        Compute several sections concurrently on the section pool.
+        
+        Args:
+            sections: (group, name) pairs
+        
+        Returns:
+            dict: (group, name) -> (value, seconds taken)
+        """
+        # Bring the rollups up to date once, before the workers read them
+        rollups.ensure_fresh()
+        
+        def evaluate(section):
+            started = time.perf_counter()
+            try:
+                value = AnalyticsSummary.get_section(*section, days)
+                return section, (value, round(time.perf_counter() - started, 4))
+            finally:
+                # The pool thread's own connection
+                connections.close_all()
+        
+        return dict(_get_section_pool().map(evaluate, sections))
+    
     @staticmethod
     def get_comprehensive_report(days=30):
-        """Get a comprehensive analytics report"""
-        start_date = timezone.now() - timedelta(days=days)
-        end_date = timezone.now()
-        
+        """Get a comprehensive analytics report (uncached, see main_app.report_cache)"""
         report = {
             'report_date': timezone.now().isoformat(),
             'period_days': days,
-            
-            # Descriptive Analytics
-            'descriptive': {
-                'bookings': DescriptiveAnalytics.get_booking_statistics(start_date, end_date),
-                'pc_utilization': DescriptiveAnalytics.get_pc_utilization(),
-                'violations': DescriptiveAnalytics.get_violation_statistics(start_date, end_date),
-                'faculty_bookings': DescriptiveAnalytics.get_faculty_booking_statistics(start_date, end_date),
-                'peripheral_events': DescriptiveAnalytics.get_peripheral_events_summary(start_date, end_date),
-            },
-            
-            # Predictive Analytics
-            'predictive': {
-                'peak_usage_hours': PredictiveAnalytics.predict_peak_usage_hours(),
-                'peak_usage_days': PredictiveAnalytics.predict_peak_usage_days(),
-                'user_violation_risks': PredictiveAnalytics.predict_user_violation_risk(),
-                'pc_maintenance_needs': PredictiveAnalytics.predict_pc_maintenance_needs(),
-                'booking_trends': PredictiveAnalytics.predict_booking_trends(),
-                'resource_demand': PredictiveAnalytics.predict_resource_demand(),
-                'user_behavior_changes': PredictiveAnalytics.predict_user_behavior_change(),
-                'anomalies': PredictiveAnalytics.anomaly_detection(),
-            },
+            'descriptive': {},
+            'predictive': {},
+            'section_timings': {},
         }
+        sections = [(group, name) for group, name, _, _ in AnalyticsSummary.SECTIONS]
+        for (group, name), (value, seconds) in AnalyticsSummary.evaluate_sections(sections, days).items():
+            report[group][name] = value
+            report['section_timings'][f'{group}.{name}'] = {'seconds': seconds, 'cached': False}
         
         return report
@@ -0,0 +1,204 @@
+"""
+Vectorized analytics engine on NumPy / pandas.
+
+Loads bookings as a compact columnar DataFrame: the SQL of a ``values_list``
+query is run in primary-key chunks (keyset pagination, so each query is an
+index range scan and no more than one chunk of tuples is held at a time) and
+each chunk is turned into typed columns right away. The raw database values
+are converted a column at a time, skipping the ORM's per-value converters,
+which cost more than the statistics themselves. Statistics are then computed
+with array operations instead of per-row Python loops.
+
+Columns of a bookings frame (load only the ones a statistic needs):
+
+- ``created``, ``start``, ``end``: datetime64 (UTC), NaT when unset
+- ``duration``: float32 minutes, NaN when unset
+- ``pc_id``, ``college_id``: int32, -1 when unset (college of the student)
+- ``status``: categorical, pending / confirmed / cancelled
+
+Counts and sums over a period come from the hourly rollups, which are
+faster; the engine answers what they cannot, such as the distribution of
+session lengths (DescriptiveAnalytics.get_session_duration_statistics).
+``manage.py benchmark_analytics`` compares it with row-at-a-time Python and
+with the rollups.
+"""
+
+import numpy as np
+import pandas as pd
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from .models import Booking, College
+
+CHUNK_SIZE = 20000
+
+STATUSES = ['pending', 'confirmed', 'cancelled']
+
+# Frame column -> values_list field
+FIELDS = {
+    'created': 'created_at',
+    'start': 'start_time',
+    'end': 'end_time',
+    'duration': 'duration',
+    'pc_id': 'pc_id',
+    'college_id': 'user__profile__college_id',
+    'status': 'status',
+}
+
+# Upper bounds (minutes, exclusive) of the session length histogram; the
+# last bucket is open-ended.
+DURATION_BUCKETS = [30, 60, 90, 120, 180]
+
+
+def load_bookings(queryset=None, columns=tuple(FIELDS), chunk_size=CHUNK_SIZE):
+    """Return ``columns`` of the bookings of ``queryset`` (all by default) as a columnar DataFrame."""
+    if queryset is None:
+        queryset = Booking.objects.all()
+    queryset = queryset.order_by('pk')
+    fields = ['pk'] + [FIELDS[column] for column in columns]
+
+    chunks = []
+    last_pk = None
+    connection = connections[queryset.db]
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        try:
+            sql, params = page.values_list(*fields)[:chunk_size].query.sql_with_params()
+        except EmptyResultSet:
+            break
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        chunks.append(_booking_chunk(rows, columns))
+        del rows
+        if len(chunks[-1]) < chunk_size:
+            break
+
+    if not chunks:
+        return _booking_chunk([], columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _booking_chunk(rows, columns):
+    raw = pd.DataFrame.from_records(rows, columns=['pk', *columns])
+    return pd.DataFrame({column: CONVERTERS[column](raw[column]) for column in columns})
+
+
+def _datetimes(column):
+    # Raw values are UTC: naive datetimes (MySQL), ISO strings (SQLite) or
+    # aware datetimes (PostgreSQL)
+    return pd.to_datetime(column, utc=True, format='ISO8601')
+
+
+def _minutes(column):
+    # DurationField is a bigint of microseconds, except on PostgreSQL (interval)
+    if column.dtype == object and column.map(lambda value: hasattr(value, 'total_seconds')).any():
+        seconds = pd.to_timedelta(column).dt.total_seconds()
+    else:
+        seconds = pd.to_numeric(column) / 1e6
+    return (seconds / 60).astype('float32')
+
+
+def _ids(column):
+    return pd.to_numeric(column).fillna(-1).astype('int32')
+
+
+def _statuses(column):
+    return pd.Categorical(column.fillna('pending'), categories=STATUSES)
+
+
+CONVERTERS = {
+    'created': _datetimes,
+    'start': _datetimes,
+    'end': _datetimes,
+    'duration': _minutes,
+    'pc_id': _ids,
+    'college_id': _ids,
+    'status': _statuses,
+}
+
+
+def booking_statistics(frame):
+    """
+    Booking counts, durations and per-college totals (``status``, ``duration``
+    and ``college_id`` columns).
+
+    Same keys and values as the counting part of
+    DescriptiveAnalytics.get_booking_statistics.
+    """
+    statuses = frame['status'].value_counts()
+    durations = frame['duration'].to_numpy()
+    timed = durations[~np.isnan(durations)]
+
+    colleges = frame['college_id'].to_numpy()
+    counts = np.bincount(colleges[colleges >= 0]) if len(frame) else np.array([], dtype='int64')
+    college_ids = sorted((int(pk) for pk in np.flatnonzero(counts)), key=lambda pk: -counts[pk])
+    names = dict(College.objects.filter(pk__in=college_ids).values_list('pk', 'name')) if college_ids else {}
+
+    return {
+        'total_bookings': int(len(frame)),
+        'confirmed_bookings': int(statuses.get('confirmed', 0)),
+        'cancelled_bookings': int(statuses.get('cancelled', 0)),
+        'avg_duration_minutes': round(float(timed.mean(dtype='float64')), 2) if timed.size else None,
+        'total_pc_hours': float(timed.sum(dtype='float64')) / 60 if timed.size else 0,
+        'bookings_by_college': {
+            names[college_id]: int(counts[college_id]) for college_id in college_ids if college_id in names
+        },
+    }
+
+
+def duration_statistics(frame):
+    """
+    Distribution of booked session lengths (``duration`` and ``college_id`` columns).
+
+    Returns:
+        dict: ``timed_bookings``, ``avg_minutes``, ``median_minutes``,
+        ``p90_minutes``, ``longest_minutes`` (None without timed bookings),
+        ``histogram`` (bookings per DURATION_BUCKETS range) and ``by_college``
+        (bookings, average and median minutes per college, most bookings first)
+    """
+    # float32 throughout, summed in float64: no full-size float64 or index
+    # arrays, so the peak stays near the size of the columns themselves
+    durations = frame['duration'].to_numpy()
+    timed = ~np.isnan(durations)
+    minutes = durations[timed]
+    colleges = frame['college_id'].to_numpy()[timed]
+    del durations, timed
+
+    edges = [0] + DURATION_BUCKETS
+    labels = [f'{low}-{high - 1}' for low, high in zip(edges, edges[1:])] + [f'{edges[-1]}+']
+    below = [0] + [int(np.count_nonzero(minutes < bound)) for bound in DURATION_BUCKETS] + [int(minutes.size)]
+    counts = np.diff(below)
+
+    by_college = []
+    totals = np.bincount(colleges[colleges >= 0]) if minutes.size else np.array([], dtype='int64')
+    college_ids = [int(pk) for pk in np.flatnonzero(totals)]
+    names = dict(College.objects.filter(pk__in=college_ids).values_list('pk', 'name')) if college_ids else {}
+    for college_id in sorted(college_ids, key=lambda pk: -totals[pk]):
+        if college_id not in names:
+            continue
+        values = minutes[colleges == college_id]
+        by_college.append({
+            'college': names[college_id],
+            'bookings': int(values.size),
+            'avg_minutes': round(float(values.mean(dtype='float64')), 2),
+            'median_minutes': round(float(np.median(values)), 2),
+        })
+
+    average = median = p90 = longest = None
+    if minutes.size:
+        average = round(float(minutes.mean(dtype='float64')), 2)
+        median, p90 = (round(float(value), 2) for value in np.percentile(minutes, [50, 90]))
+        longest = round(float(minutes.max()), 2)
+
+    return {
+        'timed_bookings': int(minutes.size),
+        'avg_minutes': average,
+        'median_minutes': median,
+        'p90_minutes': p90,
+        'longest_minutes': longest,
+        'histogram': [{'minutes': label, 'bookings': int(count)} for label, count in zip(labels, counts)],
+        'by_college': by_college,
+    }
@@ -0,0 +1,305 @@
+"""
+Booking state machine.
+
+This module is the only code that changes ``PC.booking_status``. Every
+transition updates the Booking row(s), then re-derives the PC's
+booking_status from its bookings (see pc_status) and queues the PCs for the
+single broadcast sent when the transaction commits (see broadcast), which also
+bumps the lab-state version. Views that only read PC status never write.
+
+Booking states:
+    pending   - status is NULL, waiting for staff approval (PC in_queue)
+    confirmed - session running until end_time (PC in_use)
+    cancelled - declined, ended early or cancelled by the user
+    expired   - confirmed booking whose end_time passed (expiry stamped)
+"""
+
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Booking, PC
+from . import broadcast, lab_state, pc_status, scheduler
+
+# Expiry sweeps run at most once per this many seconds (see expire_ended_bookings)
+SWEEP_INTERVAL = 15
+SWEEP_LOCK_KEY = 'pcheck:booking_state:sweep_lock'
+SWEEP_RESULT_KEY = 'pcheck:booking_state:sweep_result'
+
+# Longest wait for another request's lock on a PC row before giving up
+LOCK_WAIT_SECONDS = 3
+
+
+class InvalidTransition(Exception):
+    """Raised when a booking is asked to move to a state it cannot reach."""
+
+
+class SlotTaken(Exception):
+    """
+    Raised when a new booking would be a second live booking for a PC or a user.
+
+    ``slot`` is ``'pc'`` or ``'user'``, the unique live slot that was taken.
+    """
+
+    def __init__(self, slot):
+        super().__init__(f"A live booking already holds this {slot}.")
+        self.slot = slot
+
+
+def _create_live(create):
+    """
+    Run ``create`` (which inserts live bookings) in its own transaction.
+
+    The live slot unique constraints on Booking reject a second pending or
+    running booking for a PC or user. A session that ended but was not swept
+    yet still holds its slot, so on a conflict run the expiry sweep and, if
+    it expired anything, try once more before raising SlotTaken. A PC row
+    that stays locked longer than LOCK_WAIT_SECONDS also raises SlotTaken.
+    """
+    for attempt in range(2):
+        try:
+            with _atomic_with_lock_wait():
+                return create()
+        except IntegrityError as e:
+            if 'live_user_slot' in str(e):
+                slot = 'user'
+            elif 'live_pc_slot' in str(e):
+                slot = 'pc'
+            else:
+                raise
+            if attempt == 0 and expire_ended_bookings(force=True)['expired']:
+                continue
+            raise SlotTaken(slot) from e
+        except OperationalError as e:
+            if _is_lock_timeout(e):
+                # Someone else is reserving this PC right now
+                raise SlotTaken('pc') from e
+            raise
+
+
+@contextmanager
+def _atomic_with_lock_wait():
+    """transaction.atomic() with row lock waits capped at LOCK_WAIT_SECONDS."""
+    mysql = connection.vendor == 'mysql'
+    if mysql:
+        # Session-wide, so set it around the transaction and restore it after
+        with connection.cursor() as cursor:
+            cursor.execute('SET SESSION innodb_lock_wait_timeout = %s', [LOCK_WAIT_SECONDS])
+    try:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_WAIT_SECONDS}s'")
+            # SQLite locks the whole database and waits up to its busy timeout
+            yield
+    finally:
+        if mysql:
+            with connection.cursor() as cursor:
+                cursor.execute('SET SESSION innodb_lock_wait_timeout = DEFAULT')
+
+
+def _is_lock_timeout(error):
+    cause = error.__cause__
+    if connection.vendor == 'mysql':
+        return bool(error.args) and error.args[0] == 1205  # ER_LOCK_WAIT_TIMEOUT
+    if connection.vendor == 'postgresql':
+        # lock_not_available (psycopg2 / psycopg 3)
+        return '55P03' in (getattr(cause, 'pgcode', None), getattr(cause, 'sqlstate', None))
+    return False
+
+
+def sync_pcs(pc_ids, now=None, message=""):
+    """
+    Re-derive booking_status for the given PC ids from their bookings and
+    queue them for broadcast when the transaction commits.
+
+    ``message`` is the text sent with each PC, or a callable taking the PC.
+
+    Returns:
+        list: PCs whose booking_status changed
+    """
+    pc_ids = {pc_id for pc_id in pc_ids if pc_id}
+    if not pc_ids:
+        return []
+    pcs, changed = pc_status.reconcile_pc_statuses(PC.objects.filter(pk__in=pc_ids), now=now)
+    for pc in pcs:
+        text = message(pc) if callable(message) else message
+        broadcast.queue_pc_change(pc, text, pc.previous_booking_status)
+    return changed
+
+
+def _sync_and_broadcast(pc, message):
+    if not pc:
+        return
+    sync_pcs([pc.pk], message=message)
+
+
+def reserve(user, pc, duration):
+    """
+    Create a pending booking for ``pc`` and put the PC in the queue.
+
+    Runs in one transaction holding a row lock on the PC; the broadcast is
+    sent once it commits. Raises SlotTaken when the PC or the user already
+    has a live booking, or the PC stays locked by another reservation.
+    """
+    def create():
+        # Hold the PC row until commit, so reservations for one PC queue up
+        # here instead of racing on the insert
+        PC.objects.select_for_update().values_list('pk', flat=True).get(pk=pc.pk)
+        booking = Booking.objects.create(
+            user=user,
+            pc=pc,
+            start_time=timezone.now(),
+            duration=duration,
+        )
+        _sync_and_broadcast(pc, f"PC {pc.name} is now in queue")
+        return booking
+
+    return _create_live(create)
+
+
+def approve(booking):
+    """Start the session for a pending booking. Approving a confirmed booking is a no-op."""
+    if booking.status == 'confirmed':
+        return booking
+    if booking.status is not None:
+        raise InvalidTransition(f"Cannot approve a {booking.status} booking.")
+
+    with transaction.atomic():
+        booking.start_time = timezone.now()
+        # booking.duration is already a timedelta, so use it directly
+        booking.end_time = booking.start_time + booking.duration
+        booking.status = 'confirmed'
+        booking.save()
+        _sync_and_broadcast(booking.pc, f"PC {booking.pc.name} is now in use" if booking.pc else "")
+        transaction.on_commit(lambda: scheduler.schedule_booking(booking))
+    return booking
+
+
+def decline(booking):
+    """Decline a pending booking and free its PC."""
+    if booking.status is not None:
+        raise InvalidTransition(f"Cannot decline a {booking.status} booking.")
+
+    with transaction.atomic():
+        booking.status = 'cancelled'
+        booking.start_time = timezone.now()
+        booking.save()
+        _sync_and_broadcast(booking.pc, f"PC {booking.pc.name} is now available" if booking.pc else "")
+    return booking
+
+
+def cancel(booking):
+    """Cancel a pending booking or end a running session early."""
+    with transaction.atomic():
+        if booking.status != 'cancelled':
+            booking.status = 'cancelled'
+            booking.save()
+        _sync_and_broadcast(booking.pc, f"PC {booking.pc.name} is now available" if booking.pc else "")
+        transaction.on_commit(lambda: scheduler.schedule_booking(booking))
+    return booking
+
+
+# Ending a session early is the same transition as cancelling it.
+end_session = cancel
+
+
+def cancel_pending_for_pc(user, pc):
+    """Cancel ``user``'s pending booking on ``pc`` (legacy pc_id-only cancel)."""
+    with transaction.atomic():
+        Booking.objects.filter(user=user, pc=pc, status__isnull=True).update(
+            status='cancelled',
+            updated_at=timezone.now(),
+        )
+        _sync_and_broadcast(pc, f"PC {pc.name} is now available")
+
+
+def assign_faculty_pcs(faculty_booking, user, pcs, start_time, end_time):
+    """
+    Check a faculty block booking in: one confirmed booking per PC.
+
+    Raises SlotTaken when one of the PCs already has a live booking.
+
+    Returns:
+        list: the created Booking rows
+    """
+    def create():
+        bookings = [
+            Booking.objects.create(
+                user=user,
+                pc=pc,
+                faculty_booking=faculty_booking,
+                start_time=start_time,
+                end_time=end_time,
+                status='confirmed',
+            )
+            for pc in pcs
+        ]
+        sync_pcs(
+            [pc.pk for pc in pcs],
+            message=lambda pc: f"PC {pc.name} is now in use (bulk booking)",
+        )
+        transaction.on_commit(lambda: [scheduler.schedule_booking(booking) for booking in bookings])
+        return bookings
+
+    return _create_live(create)
+
+
+def expire_ended_bookings(now=None, force=False):
+    """
+    Expiry sweep: stamp ``expiry`` on bookings whose end_time passed and free their PCs.
+
+    Set-based, so the cost does not depend on how many bookings ended:
+    one SELECT for the affected PC ids, one UPDATE stamping every ended
+    booking, then one reconcile (SELECT + bulk UPDATE) over those PCs and any
+    PC still marked busy, which also repairs a booking_status that drifted.
+    The changed PCs go out as one broadcast when the transaction commits.
+
+    Idempotent, and rate-limited to one run per SWEEP_INTERVAL seconds across
+    callers: a call inside the interval does no database work and returns
+    the result of the last run with ``ran`` False. ``force`` skips the limit.
+
+    Returns:
+        dict: ``expired`` (bookings stamped), ``released`` (PCs whose
+        booking_status changed), ``pcs`` (those PCs as id / name /
+        booking_status), ``swept_at`` and ``ran``
+    """
+    if force:
+        cache.set(SWEEP_LOCK_KEY, True, SWEEP_INTERVAL)
+    elif not cache.add(SWEEP_LOCK_KEY, True, SWEEP_INTERVAL):
+        last = cache.get(SWEEP_RESULT_KEY) or {'expired': 0, 'released': 0, 'pcs': [], 'swept_at': None}
+        return dict(last, ran=False)
+
+    result = _sweep(now or timezone.now())
+    cache.set(SWEEP_RESULT_KEY, result, timeout=None)
+    return dict(result, ran=True)
+
+
+def _sweep(now):
+    with transaction.atomic():
+        ended = Booking.objects.filter(end_time__lt=now, expiry__isnull=True)
+        pc_ids = set(ended.filter(pc__isnull=False).values_list('pc_id', flat=True).distinct())
+        expired_count = ended.update(expiry=F('end_time'))
+
+        _, changed = pc_status.reconcile_pc_statuses(
+            PC.objects.filter(
+                Q(pk__in=pc_ids) | ~Q(booking_status='available') | Q(current_booking__isnull=False)
+            ).order_by('sort_number'),
+            now=now,
+        )
+        for pc in changed:
+            broadcast.queue_pc_change(
+                pc, f"PC {pc.name} is now {pc.booking_status.replace('_', ' ')}", pc.previous_booking_status
+            )
+        if expired_count and not changed:
+            # Nothing to broadcast, but session status readers must see the expiry
+            transaction.on_commit(lab_state.bump_version)
+
+    return {
+        'expired': expired_count,
+        'released': len(changed),
+        'pcs': [{'id': pc.id, 'name': pc.name, 'booking_status': pc.booking_status} for pc in changed],
+        'swept_at': now.isoformat(),
+    }
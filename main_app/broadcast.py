@@ -0,0 +1,198 @@
+"""
+Real-time PC status broadcasts to every browser connected to
+PCStatusBroadcastConsumer (group ``pc_status_updates``).
+
+Transitions are not sent one by one. queue_pc_change() collects the PCs
+changed inside a transaction and sends them once it commits, as a single
+``pc_status_batch`` message with every changed PC, one lab-state version and
+the available PC count, which comes from the occupancy counters that this
+module keeps up to date from each change.
+
+group_send() is how code outside a request (the deadline scheduler, the
+report worker) talks to sockets: the in-memory channel layer's queues belong
+to the ASGI server's event loop and are not thread-safe, so the send is
+handed to that loop instead of running on a private one.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import weakref
+
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from . import lab_state, occupancy
+
+_local = threading.local()
+
+# How long a background thread waits for the server loop to take a send.
+SEND_TIMEOUT_SECONDS = 5
+
+_server_loop = None
+
+
+def capture_server_loop(loop=None):
+    """
+    Remember the ASGI server's event loop; call once at startup (PCheckMain.asgi).
+
+    Without ``loop``, takes daphne's loop, which exists before the
+    application is imported. Returns the loop, or None outside daphne.
+    """
+    global _server_loop
+    if loop is None:
+        daphne_server = sys.modules.get('daphne.server')
+        loop = getattr(daphne_server, 'twisted_loop', None)
+    _server_loop = loop
+    return loop
+
+
+def group_send(group, message):
+    """
+    Send ``message`` to a channel layer group from any synchronous thread.
+
+    Inside the ASGI server the send runs on the server loop (see
+    capture_server_loop) and this waits for it; elsewhere, e.g. in a
+    management command with a shared channel layer, it runs in place.
+    Returns False when there is no channel layer.
+    """
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        return False
+    loop = _server_loop
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(
+            channel_layer.group_send(group, message), loop
+        ).result(SEND_TIMEOUT_SECONDS)
+    else:
+        async_to_sync(channel_layer.group_send)(group, message)
+    return True
+
+
+def pc_record_changed(pc_ids):
+    """
+    A PC was added, edited or deleted outside the booking state machine.
+
+    Its counters may have changed in ways a transition cannot describe, so
+    drop them (rebuilt on next use) and bump the lab version.
+    """
+    occupancy.invalidate()
+    lab_state.bump_version(pc_ids)
+
+
+class _Batch:
+    """PC changes waiting for their transaction to commit."""
+
+    def __init__(self):
+        self.changes = {}
+        # Before the batch's first change was written; see occupancy.apply_change
+        self.started = time.time()
+
+    def add(self, pc, message, previous_booking_status):
+        previous = self.changes.get(pc.pk)
+        if previous is not None:
+            # Keep the state from before the whole batch
+            previous_booking_status = previous['previous_booking_status']
+        self.changes[pc.pk] = {
+            'pc': pc,
+            'message': message,
+            'previous_booking_status': previous_booking_status,
+        }
+
+    def send(self):
+        if _current_batch() is self:
+            _local.batch = None
+        committed = time.time()
+        pcs = []
+        for change in self.changes.values():
+            pc = change['pc']
+            occupancy.apply_change(
+                (change['previous_booking_status'], pc.status, pc.system_condition),
+                (pc.booking_status, pc.status, pc.system_condition),
+                started=self.started,
+                committed=committed,
+            )
+            pcs.append({
+                'pc_id': pc.id,
+                'pc_name': pc.name,
+                'booking_status': pc.booking_status or 'available',
+                'status': pc.status,
+                'system_condition': pc.system_condition,
+                'message': change['message'],
+            })
+        if not pcs:
+            return
+
+        version = lab_state.bump_version([pc['pc_id'] for pc in pcs])
+        available_pcs_count = occupancy.get_counts()['available']
+        broadcast_pc_status_batch(pcs, available_pcs_count, version)
+
+
+def _current_batch():
+    ref = getattr(_local, 'batch', None)
+    return ref() if ref is not None else None
+
+
+def _transaction_batch():
+    """Return the batch of the current transaction, registering it on first use."""
+    batch = _current_batch()
+    # The thread only keeps a weak reference: the transaction's on_commit
+    # callback owns the batch. The batch clears itself once sent, and is
+    # dropped with the callback when its transaction (or savepoint) rolls
+    # back - start a new one then.
+    if batch is None:
+        batch = _Batch()
+        _local.batch = weakref.ref(batch)
+        transaction.on_commit(batch.send)
+    return batch
+
+
+def queue_pc_change(pc, message="", previous_booking_status=None):
+    """
+    Queue a PC's new state for broadcast when the current transaction commits.
+
+    ``pc`` must hold its current booking_status, status and system_condition.
+    ``previous_booking_status`` is the booking_status before the transition
+    (defaults to the current one) and keeps the occupancy counters up to date.
+    Several changes to one PC in a transaction collapse into the last one.
+    Outside a transaction the change is sent straight away.
+    """
+    if previous_booking_status is None:
+        previous_booking_status = pc.booking_status
+
+    if transaction.get_connection().in_atomic_block:
+        _transaction_batch().add(pc, message, previous_booking_status)
+    else:
+        batch = _Batch()
+        batch.add(pc, message, previous_booking_status)
+        batch.send()
+
+
+def broadcast_pc_status_batch(pcs, available_pcs_count, version):
+    """Helper function to broadcast a batch of PC status updates to all connected users"""
+    try:
+        names = ', '.join(f"{pc['pc_name']} -> {pc['booking_status']}" for pc in pcs)
+        print(f"📤 Broadcasting PC status update: {names}")
+
+        sent = group_send(
+            'pc_status_updates',
+            {
+                'type': 'pc_status_batch',
+                'pcs': pcs,
+                'available_pcs_count': available_pcs_count,
+                'version': version,
+            }
+        )
+        if sent:
+            print(f"✅ Broadcasted PC status update for {len(pcs)} PC(s)")
+    except Exception as e:
+        print(f"❌ Error broadcasting PC status update: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def broadcast_pc_status_update(pc, message=""):
+    """Helper function to broadcast one PC's current status to all connected users"""
+    pc.refresh_from_db()
+    queue_pc_change(pc, message)
@@ -1,6 +1,8 @@
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from . import lab_state, occupancy
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -233,7 +235,14 @@ class BookingStatusConsumer(AsyncWebsocketConsumer):
             traceback.print_exc()
 
 class PCStatusBroadcastConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for broadcasting PC status updates to all users"""
+    """
+    WebSocket consumer for broadcasting PC status updates to all users.
+
+    Sends a ``pc_status_snapshot`` on connect and stamps every update with the
+    lab-state version. A client that reconnects with ``?since=<version>`` (or
+    sends ``{"type": "resume", "since": <version>}``) only gets the PCs that
+    changed after that version, or a full snapshot when it is too old.
+    """
     async def connect(self):
         self.user = self.scope["user"]
         
@@ -243,26 +252,64 @@ class PCStatusBroadcastConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Join the global PC status broadcast group
+        # Join the global PC status broadcast group before taking the snapshot,
+        # so no update can fall between the two (the client drops older ones)
         self.group = "pc_status_updates"
         await self.channel_layer.group_add(self.group, self.channel_name)
         await self.accept()
         print(f"✅ PCStatusBroadcastConsumer: User {self.user.username} (ID: {self.user.id}) connected")
 
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since", [None])[0]
+        await self.send_snapshot(since)
+
     async def disconnect(self, close_code):
         if hasattr(self, 'group'):
             await self.channel_layer.group_discard(self.group, self.channel_name)
         print(f"❌ PCStatusBroadcastConsumer: User {getattr(self.user, 'username', 'unknown')} disconnected")
 
     async def receive(self, text_data):
-        # Users can send heartbeat or other messages
+        # Users can send heartbeat, or ask to catch up after missing updates
         try:
             data = json.loads(text_data)
             if data.get("type") == "heartbeat":
-                await self.send(text_data=json.dumps({"type": "heartbeat_ack"}))
+                version = await database_sync_to_async(lab_state.get_version)()
+                await self.send(text_data=json.dumps({"type": "heartbeat_ack", "version": version}))
+            elif data.get("type") == "resume":
+                await self.send_snapshot(data.get("since"))
         except json.JSONDecodeError:
             pass
 
+    async def send_snapshot(self, since=None):
+        """Send every PC, or only those changed after version ``since``."""
+        try:
+            since = int(since) if since is not None else None
+        except (TypeError, ValueError):
+            since = None
+        payload = await self.get_snapshot(since)
+        await self.send(text_data=json.dumps({"type": "pc_status_snapshot", **payload}))
+
+    @database_sync_to_async
+    def get_snapshot(self, since):
+        snapshot = lab_state.get_snapshot()
+        if since is None:
+            payload = {'version': snapshot['version'], 'full': True, 'pcs': snapshot['pcs']}
+        else:
+            payload = lab_state.delta_since(snapshot, since)
+        payload['available_pcs_count'] = occupancy.get_counts()['available']
+        return payload
+
+    async def pc_status_batch(self, event):
+        """Send every PC changed by one transaction in a single message"""
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "pc_status_batch",
+                "pcs": event.get("pcs", []),
+                "available_pcs_count": event.get("available_pcs_count", 0),
+                "version": event.get("version"),
+            }))
+        except Exception as e:
+            print(f"❌ Error broadcasting PC status batch: {e}")
+
     async def pc_status_update(self, event):
         """Broadcast PC status update to all connected users"""
         message_data = {
@@ -274,6 +321,7 @@ class PCStatusBroadcastConsumer(AsyncWebsocketConsumer):
             "system_condition": event.get("system_condition", "active"),  # active/repair
             "message": event.get("message", ""),
             "available_pcs_count": event.get("available_pcs_count", 0),
+            "version": event.get("version"),
         }
         print(f"📤 PCStatusBroadcastConsumer: Broadcasting PC status update")
         print(f"   PC: {event.get('pc_name')}, Status: {event.get('booking_status')}")
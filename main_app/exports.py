@@ -0,0 +1,206 @@
+"""
+Booking report exports.
+
+Rows are read in primary-key pages (keyset pagination) of values_list
+tuples, joined to the user, profile, college and PC in the same query, so an
+export runs one query per CHUNK_SIZE bookings and holds one page at a time
+whatever its range. MySQL drivers buffer a whole result set client-side, so
+paging in SQL rather than QuerySet.iterator() is what keeps memory flat
+there.
+
+stream_csv() turns the rows into CSV bytes for a StreamingHttpResponse,
+optionally gzip-compressed as they are produced. Under ASGI (daphne) Django
+collects a synchronous iterator into a list before sending it, so views wrap
+it in async_chunks() there.
+"""
+
+import csv
+import zlib
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from .models import Booking
+
+CHUNK_SIZE = 2000
+
+# Flush the CSV (and gzip) buffer once it holds this many bytes.
+STREAM_BUFFER_BYTES = 64 * 1024
+
+HEADER = ['Date', 'Time', 'User', 'PC Name', 'College', 'Status', 'Duration (minutes)']
+
+# Fixed windows of the original export (?period=)
+PERIOD_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 30}
+
+STATUSES = {'pending': None, 'confirmed': 'confirmed', 'cancelled': 'cancelled'}
+
+
+class InvalidExport(ValueError):
+    """Raised for export parameters that cannot be used."""
+
+
+def parse_params(params, now=None):
+    """
+    Read the export range and filters from request parameters.
+
+    ``from`` / ``to``: local dates (YYYY-MM-DD, ``to`` inclusive) or
+    datetimes (YYYY-MM-DDTHH:MM). Without them, ``period`` picks the last
+    day, week or month as before. Filters: ``status`` (pending, confirmed,
+    cancelled; comma separated), ``college`` and ``pc`` (ids), ``user``
+    (username).
+
+    Returns:
+        dict: ``start``, ``end`` (aware datetimes), ``filters`` and ``label``
+        (for the file name)
+    """
+    if now is None:
+        now = timezone.now()
+
+    if params.get('from') or params.get('to'):
+        start = _parse_bound(params.get('from'), 'from') if params.get('from') else None
+        end = _parse_bound(params.get('to'), 'to', end=True) if params.get('to') else now
+        if start is not None and end <= start:
+            raise InvalidExport('to must be after from')
+        label = '_'.join(
+            timezone.localtime(bound).strftime('%Y%m%d') for bound in (start, end) if bound is not None
+        )
+    else:
+        period = params.get('period', 'daily')
+        start = now - timedelta(days=PERIOD_DAYS.get(period, 1))
+        end = now
+        stamp = timezone.localtime(now).strftime('%Y%m%d')
+        label = f'{period}_{stamp}' if period in PERIOD_DAYS else stamp
+
+    filters = {}
+    if params.get('status'):
+        statuses = [status.strip().lower() for status in params['status'].split(',') if status.strip()]
+        unknown = [status for status in statuses if status not in STATUSES]
+        if unknown:
+            raise InvalidExport(f"Unknown status: {', '.join(unknown)}")
+        filters['status'] = statuses
+    for name in ('college', 'pc'):
+        if params.get(name):
+            try:
+                filters[name] = int(params[name])
+            except ValueError:
+                raise InvalidExport(f'{name} must be an id')
+    if params.get('user'):
+        filters['user'] = params['user']
+
+    return {'start': start, 'end': end, 'filters': filters, 'label': label}
+
+
+def _parse_bound(value, name, end=False):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidExport(f'{name} must be a date (YYYY-MM-DD) or datetime (YYYY-MM-DDTHH:MM)')
+    if len(value) <= len('YYYY-MM-DD'):
+        # A whole day; ``to`` includes it
+        parsed = datetime.combine(parsed.date() + timedelta(days=1 if end else 0), time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def bookings(start=None, end=None, filters=None):
+    """Bookings created in [start, end) matching ``filters`` (see parse_params)."""
+    queryset = Booking.objects.all()
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+    filters = filters or {}
+    if filters.get('status'):
+        wanted = [STATUSES[status] for status in filters['status']]
+        condition = Q(status__in=[status for status in wanted if status])
+        if None in wanted:
+            condition |= Q(status__isnull=True)
+        queryset = queryset.filter(condition)
+    if filters.get('college'):
+        queryset = queryset.filter(user__profile__college_id=filters['college'])
+    if filters.get('pc'):
+        queryset = queryset.filter(pc_id=filters['pc'])
+    if filters.get('user'):
+        queryset = queryset.filter(user__username=filters['user'])
+    return queryset
+
+
+def booking_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Yield the export row of each booking in ``queryset`` (HEADER order), in primary-key order."""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page.values_list(
+            'pk', 'created_at', 'user__first_name', 'user__last_name', 'pc__name',
+            'user__profile__college__name', 'status', 'duration',
+        )[:chunk_size])
+        for pk, created_at, first_name, last_name, pc_name, college, status, duration in rows:
+            created_at = timezone.localtime(created_at)
+            yield [
+                created_at.strftime('%Y-%m-%d'),
+                created_at.strftime('%H:%M:%S'),
+                f'{first_name} {last_name}'.strip(),
+                pc_name or 'N/A',
+                college or 'N/A',
+                status or 'Pending',
+                int(duration.total_seconds() / 60) if duration else 0,
+            ]
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+class _Buffer:
+    """File-like object that keeps what csv.writer writes until it is taken."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def take(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return text.encode('utf-8')
+
+
+def stream_csv(rows, header=HEADER, compress=False):
+    """Yield the CSV of ``rows`` as byte chunks of about STREAM_BUFFER_BYTES, gzip-compressed when asked."""
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    # 16 + MAX_WBITS: gzip container, so the output is a .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(data):
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.size >= STREAM_BUFFER_BYTES:
+            chunk = emit(buffer.take())
+            if chunk:
+                yield chunk
+    chunk = emit(buffer.take())
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+async def async_chunks(chunks):
+    """Async iterator over ``chunks``, pulling each one in the sync thread, so ASGI streams it as it comes."""
+    iterator = iter(chunks)
+    done = object()
+    while True:
+        chunk = await sync_to_async(next)(iterator, done)
+        if chunk is done:
+            return
+        yield chunk
@@ -0,0 +1,261 @@
+"""
+Booking demand forecaster.
+
+A seasonal count model of bookings per local hour, fitted offline on the
+hourly rollups by ``manage.py train_demand_forecaster`` (run it nightly) and
+saved to settings.DEMAND_FORECAST_MODEL_PATH. Requests never train: the
+saved model is loaded on first use, reloaded when the file changes, and its
+14-day forecast is computed once per model and day.
+
+Model: a scikit-learn PoissonRegressor on one indicator per hour of the week
+(168) plus a linear trend, with recent weeks weighted more (HALF_LIFE_WEEKS).
+Bookings vary more than a Poisson count, so the confidence bands are
+negative binomial quantiles with the dispersion measured on the training
+data.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from scipy import stats
+from sklearn import __version__ as sklearn_version
+from sklearn.linear_model import PoissonRegressor
+from . import rollups
+
+HORIZON_DAYS = 14
+CONFIDENCE = 0.9
+
+# Training uses at most this much history, and weighs a week half as much as
+# the one HALF_LIFE_WEEKS after it.
+HISTORY_WEEKS = 52
+HALF_LIFE_WEEKS = 8
+MIN_HISTORY_DAYS = 14
+
+# The most recent days held out to score the model before the final fit.
+BACKTEST_DAYS = 14
+
+_loaded = {'mtime': None, 'model': None}
+_forecasts = {}  # (model mtime, first day) -> forecast
+_lock = threading.Lock()
+
+
+class NotTrained(Exception):
+    """Raised when no trained model is saved yet."""
+
+
+def model_path():
+    return str(settings.DEMAND_FORECAST_MODEL_PATH)
+
+
+def hourly_bookings(first_day, last_day):
+    """Bookings per local hour from the rollups, as a (days, 24) array with 0 for empty hours."""
+    counts = np.zeros(((last_day - first_day).days + 1, 24))
+    rows = rollups.rows().filter(date__gte=first_day, date__lte=last_day).values('date', 'hour').annotate(
+        count=Sum('bookings')
+    )
+    for row in rows:
+        counts[(row['date'] - first_day).days, row['hour']] = row['count']
+    return counts
+
+
+def features(first_day, days, origin):
+    """Design matrix for ``days`` local days from ``first_day``, one row per hour."""
+    dates = [first_day + timedelta(days=i) for i in range(days)]
+    hour_of_week = np.array([day.weekday() * 24 + hour for day in dates for hour in range(24)])
+    matrix = np.zeros((days * 24, 7 * 24 + 1))
+    matrix[np.arange(days * 24), hour_of_week] = 1
+    # Trend in years since the start of the training data
+    matrix[:, -1] = np.repeat([(day - origin).days / 365 for day in dates], 24)
+    return matrix
+
+
+def fit(counts, first_day):
+    """
+    Fit the model on a (days, 24) array of hourly bookings starting at ``first_day``.
+
+    Returns:
+        dict: ``model``, ``dispersion`` and ``origin`` (see save/load)
+    """
+    days = len(counts)
+    x = features(first_day, days, first_day)
+    y = counts.reshape(-1)
+    age_weeks = np.repeat(np.arange(days)[::-1] / 7, 24)
+    weights = 0.5 ** (age_weeks / HALF_LIFE_WEEKS)
+
+    model = PoissonRegressor(alpha=1e-4, max_iter=1000)
+    model.fit(x, y, sample_weight=weights)
+
+    # Pearson dispersion: 1 for Poisson, above it when bookings are burstier
+    mu = model.predict(x)
+    expected = mu > 1e-6
+    dispersion = float(
+        np.sum(weights[expected] * (y[expected] - mu[expected]) ** 2 / mu[expected]) / np.sum(weights[expected])
+    )
+    return {'model': model, 'dispersion': max(dispersion, 1.0), 'origin': first_day}
+
+
+def predict(fitted, first_day, days):
+    """Expected bookings per hour and their CONFIDENCE bands, each a (days, 24) array."""
+    mu = fitted['model'].predict(features(first_day, days, fitted['origin']))
+    lower, upper = bands(mu, fitted['dispersion'])
+    return mu.reshape(days, 24), lower.reshape(days, 24), upper.reshape(days, 24)
+
+
+def bands(mu, dispersion):
+    """Central CONFIDENCE interval of counts with mean ``mu`` and variance ``dispersion * mu``."""
+    tail = (1 - CONFIDENCE) / 2
+    mu = np.maximum(np.asarray(mu, dtype=float), 1e-9)
+    if dispersion <= 1.0 + 1e-6:
+        return stats.poisson.ppf(tail, mu), stats.poisson.ppf(1 - tail, mu)
+    # Negative binomial with mean mu and variance dispersion * mu
+    n, p = mu / (dispersion - 1), 1 / dispersion
+    return stats.nbinom.ppf(tail, n, p), stats.nbinom.ppf(1 - tail, n, p)
+
+
+def train(today=None, history_weeks=HISTORY_WEEKS):
+    """
+    Fit on the rollups up to yesterday, save the model and return what was saved.
+
+    The last BACKTEST_DAYS are first held out to score the model against a
+    seasonal naive forecast (same hour one week earlier); the saved model is
+    then refitted on everything.
+    """
+    if today is None:
+        today = timezone.localdate()
+    last_day = today - timedelta(days=1)
+    first_day = max(
+        rollups.history_start() or today,
+        today - timedelta(weeks=history_weeks),
+    )
+    days = (last_day - first_day).days + 1
+    if days < MIN_HISTORY_DAYS:
+        raise NotTrained(f"Need at least {MIN_HISTORY_DAYS} days of bookings to train, have {max(days, 0)}")
+    counts = hourly_bookings(first_day, last_day)
+
+    backtest = None
+    if days >= BACKTEST_DAYS + 7 + MIN_HISTORY_DAYS:
+        train_days = days - BACKTEST_DAYS
+        held_out = counts[train_days:]
+        mu, lower, upper = predict(
+            fit(counts[:train_days], first_day), first_day + timedelta(days=train_days), BACKTEST_DAYS
+        )
+        naive = counts[train_days - 7:days - 7]
+        backtest = {
+            'days': BACKTEST_DAYS,
+            'mae': round(float(np.abs(mu - held_out).mean()), 4),
+            'seasonal_naive_mae': round(float(np.abs(naive - held_out).mean()), 4),
+            'band_coverage': round(float(((held_out >= lower) & (held_out <= upper)).mean()), 4),
+        }
+
+    saved = fit(counts, first_day)
+    saved.update({
+        'trained_at': timezone.now(),
+        'first_day': first_day,
+        'last_day': last_day,
+        'bookings': int(counts.sum()),
+        'backtest': backtest,
+        'sklearn_version': sklearn_version,
+    })
+    save(saved)
+    return saved
+
+
+def save(saved):
+    """Write the model next to its final path and move it in place, so readers never see half a file."""
+    path = model_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.tmp'
+    joblib.dump(saved, partial)
+    os.replace(partial, path)
+
+
+def load():
+    """Return the saved model, loading it on first use and again when the file changed. None when untrained."""
+    try:
+        mtime = os.stat(model_path()).st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _loaded['mtime'] != mtime:
+            try:
+                model = joblib.load(model_path())
+            except Exception as e:
+                print(f"❌ Could not load the demand forecaster: {e}")
+                return None
+            if model.get('sklearn_version') != sklearn_version:
+                print(f"⚠️ Demand forecaster was trained with scikit-learn {model.get('sklearn_version')}, "
+                      f"running {sklearn_version}; retrain it")
+            _loaded.update(mtime=mtime, model=model)
+            _forecasts.clear()
+        return _loaded['model']
+
+
+def get_forecast(first_day=None):
+    """
+    Hourly and daily booking demand for HORIZON_DAYS local days from
+    ``first_day`` (default today), with CONFIDENCE bands.
+
+    Raises NotTrained when no model is saved. Computed once per model and
+    day; later calls return the cached result.
+    """
+    saved = load()
+    if saved is None:
+        raise NotTrained("No demand forecaster trained yet; run `manage.py train_demand_forecaster`")
+    if first_day is None:
+        first_day = timezone.localdate()
+
+    key = (_loaded['mtime'], first_day)
+    forecast = _forecasts.get(key)
+    if forecast is None:
+        forecast = _build_forecast(saved, first_day)
+        with _lock:
+            if _loaded['model'] is saved:
+                _forecasts.clear()
+                _forecasts[key] = forecast
+    return forecast
+
+
+def _build_forecast(saved, first_day):
+    mu, lower, upper = predict(saved, first_day, HORIZON_DAYS)
+    daily_lower, daily_upper = bands(mu.sum(axis=1), saved['dispersion'])
+
+    hourly = []
+    daily = []
+    for i in range(HORIZON_DAYS):
+        day = first_day + timedelta(days=i)
+        for hour in range(24):
+            hourly.append({
+                'datetime': timezone.make_aware(datetime(day.year, day.month, day.day, hour)).isoformat(),
+                'date': day.isoformat(),
+                'hour': hour,
+                'predicted': round(float(mu[i, hour]), 3),
+                'lower': int(lower[i, hour]),
+                'upper': int(upper[i, hour]),
+            })
+        daily.append({
+            'date': day.isoformat(),
+            'day_of_week': day.strftime('%A'),
+            'predicted': round(float(mu[i].sum()), 2),
+            'lower': int(daily_lower[i]),
+            'upper': int(daily_upper[i]),
+        })
+
+    return {
+        'model': {
+            'type': 'seasonal Poisson regression (hour of week + trend)',
+            'trained_at': timezone.localtime(saved['trained_at']).isoformat(),
+            'trained_on': [saved['first_day'].isoformat(), saved['last_day'].isoformat()],
+            'dispersion': round(saved['dispersion'], 4),
+            'backtest': saved['backtest'],
+        },
+        'confidence': CONFIDENCE,
+        'horizon_days': HORIZON_DAYS,
+        'hourly': hourly,
+        'daily': daily,
+    }
@@ -0,0 +1,284 @@
+"""
+Versioned lab-state snapshot for status polling.
+
+Every PC or booking transition bumps a lab-wide version number. The PC status
+list (pre-serialized JSON) and the running sessions are cached against that
+version, so polling endpoints can answer ``If-None-Match`` with a 304 by
+comparing ETags built from the version alone, without a database query.
+
+Each bump also records which PCs changed, in an in-memory ring buffer backed
+by the PCStatusChange table, so ``get_all_pc_status?since=N`` can return only
+the PCs that changed after version N (see changes_since).
+
+pc_session_status, polled by every lab PC, reads a process-local copy of the
+snapshot's session table (see session_table), so a poll costs a dict lookup
+and no database or cache-deserialization work between transitions.
+
+The version and snapshots live in Django's cache. With the default per-process
+LocMemCache this is correct for the single daphne process the lab runs; more
+than one worker process needs a shared cache backend (CACHES) so they all see
+the same version.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.views.decorators.http import condition
+from .models import PC, PCStatusChange
+
+VERSION_KEY = 'pcheck:lab_state:version'
+SNAPSHOT_KEY = 'pcheck:lab_state:snapshot:{version}'
+SNAPSHOT_TIMEOUT = 60 * 60
+
+# Versions kept in memory / in the PCStatusChange table for ?since=N deltas.
+CHANGE_LOG_SIZE = 1000
+DURABLE_LOG_SIZE = 20000
+
+# Seconds before end_time at which pc_session_status starts warning.
+WARNING_WINDOW_SECONDS = 5 * 60
+
+
+def get_version():
+    """Return the current lab-state version, seeding it on first use."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a restarted process never reuses old versions
+        # (and therefore old ETags held by clients).
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+_change_log = deque(maxlen=CHANGE_LOG_SIZE)
+_change_log_lock = threading.Lock()
+
+
+def bump_version(pc_ids=()):
+    """
+    Advance the lab-state version and record the PCs that changed.
+
+    Call after a PC or booking change commits. ``pc_ids`` may be empty for
+    changes that do not alter any PC's status row (e.g. an extended session).
+    """
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+        version = cache.incr(VERSION_KEY)
+
+    pc_ids = sorted({pc_id for pc_id in pc_ids if pc_id})
+    with _change_log_lock:
+        _change_log.append((version, pc_ids))
+    try:
+        PCStatusChange.objects.create(version=version, pc_ids=pc_ids)
+        if version % 100 == 0:
+            PCStatusChange.objects.filter(version__lte=version - DURABLE_LOG_SIZE).delete()
+    except Exception as e:
+        # A missing row only turns deltas across this version into a full resync
+        print(f"⚠️ Could not record PC status change v{version}: {e}")
+    return version
+
+
+def changes_since(since, until):
+    """
+    Return the ids of PCs that changed in versions ``since`` < v <= ``until``.
+
+    Uses the in-memory ring buffer when it holds every one of those versions,
+    otherwise the PCStatusChange table.
+
+    Returns:
+        set: changed PC ids, or None when the range is not fully covered
+        (too old, from before a restart, or from another process) and the
+        caller must send a full resync
+    """
+    missing = until - since
+    if missing < 0 or missing > DURABLE_LOG_SIZE:
+        return None
+    if missing == 0:
+        return set()
+
+    with _change_log_lock:
+        entries = [pc_ids for version, pc_ids in _change_log if since < version <= until]
+    if len(entries) != missing:
+        entries = list(
+            PCStatusChange.objects.filter(version__gt=since, version__lte=until)
+            .values_list('pc_ids', flat=True)
+        )
+        if len(entries) != missing:
+            return None
+
+    changed = set()
+    for pc_ids in entries:
+        changed.update(pc_ids)
+    return changed
+
+
+def _build_snapshot(version):
+    now = timezone.now()
+    rows = PC.objects.order_by('sort_number').values(
+        'id', 'name', 'status', 'system_condition', 'booking_status',
+        'current_booking_id', 'current_booking__status', 'current_booking__expiry',
+        'current_booking__start_time', 'current_booking__end_time',
+    )
+    pcs = []
+    # Each PC's running session, joined in through PC.current_booking; whether
+    # it is still running is decided at request time, so the snapshot stays
+    # valid as the clock moves.
+    sessions = {}
+    for row in rows:
+        pcs.append({
+            'id': row['id'],
+            'name': row['name'],
+            'status': row['status'],
+            'system_condition': row['system_condition'],
+            'booking_status': row['booking_status'] or 'available',
+        })
+        running = (
+            row['current_booking__status'] == 'confirmed'
+            and row['current_booking__expiry'] is None
+            and row['current_booking__end_time'] is not None
+            and row['current_booking__end_time'] >= now
+        )
+        sessions.setdefault(row['name'].lower(), [])
+        if running:
+            sessions[row['name'].lower()].append((
+                row['current_booking_id'],
+                row['current_booking__start_time'],
+                row['current_booking__end_time'],
+            ))
+
+    return {
+        'version': version,
+        'pcs': pcs,
+        'pcs_json': json.dumps({'version': version, 'full': True, 'pcs': pcs}),
+        'sessions': sessions,
+    }
+
+
+def get_snapshot():
+    """
+    Return the snapshot for the current version, building it if needed.
+
+    Returns:
+        dict: ``version``, ``pcs`` (status rows), ``pcs_json`` (the
+        get_all_pc_status body) and ``sessions`` (lower-cased PC name ->
+        list of (booking_id, start_time, end_time))
+    """
+    # Read the version before querying: if a transition commits meanwhile the
+    # snapshot is stored under the old version and the next poll rebuilds it.
+    version = get_version()
+    key = SNAPSHOT_KEY.format(version=version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = _build_snapshot(version)
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def delta_since(snapshot, since):
+    """
+    Build the ``?since=N`` response body for get_all_pc_status.
+
+    Returns only the PCs that changed after version ``since`` (plus the ids of
+    deleted PCs), or the whole list with ``full: true`` when the change log no
+    longer covers that version.
+    """
+    changed = changes_since(since, snapshot['version'])
+    if changed is None:
+        return {'version': snapshot['version'], 'full': True, 'pcs': snapshot['pcs']}
+
+    pcs = [pc for pc in snapshot['pcs'] if pc['id'] in changed]
+    removed = sorted(changed - {pc['id'] for pc in pcs})
+    return {'version': snapshot['version'], 'full': False, 'pcs': pcs, 'removed': removed}
+
+
+# (version, sessions) copied out of the snapshot for this process. LocMemCache
+# unpickles the whole snapshot on every get; the session poll only needs this.
+_session_table = (None, {})
+
+
+def session_table():
+    """
+    Return ``(version, sessions)`` for the current lab version.
+
+    ``sessions`` maps the lower-cased name of every PC to a list of
+    (booking_id, start_time, end_time) for its running booking. The table is
+    replaced from the snapshot whenever a transition bumps the version, and
+    is otherwise served from memory.
+    """
+    global _session_table
+    version = get_version()
+    table = _session_table
+    if table[0] != version:
+        snapshot = get_snapshot()
+        table = (snapshot['version'], snapshot['sessions'])
+        _session_table = table
+    return table
+
+
+def current_session(sessions, pc_name, now=None):
+    """Return (booking_id, start_time, end_time) of the session running on ``pc_name``, or None."""
+    if now is None:
+        now = timezone.now()
+    for booking_id, start_time, end_time in sessions.get(pc_name.lower(), ()):
+        if (start_time is None or start_time <= now) and end_time >= now:
+            return booking_id, start_time, end_time
+    return None
+
+
+def pc_status_etag(request, *args, **kwargs):
+    """ETag for get_all_pc_status: changes only when the lab version does."""
+    return f'W/"lab-{get_version()}"'
+
+
+def pc_session_etag(request, *args, **kwargs):
+    """
+    ETag for pc_session_status.
+
+    Besides the lab version it includes the part of the answer that moves with
+    the clock: the booking and its remaining minutes, or the remaining seconds
+    inside the warning window, where every poll refreshes the warning.
+    """
+    pc_name = (request.GET.get('pc_name') or '').strip()
+    if not pc_name:
+        return None
+
+    version, sessions = session_table()
+    now = timezone.now()
+    if pc_name.lower() not in sessions:
+        state = 'missing'
+    else:
+        session = current_session(sessions, pc_name, now)
+        if session is None:
+            state = 'idle'
+        else:
+            booking_id, _, end_time = session
+            seconds_left = max(0, int((end_time - now).total_seconds()))
+            if 0 < seconds_left <= WARNING_WINDOW_SECONDS:
+                state = f'{booking_id}:s{seconds_left}'
+            else:
+                state = f'{booking_id}:m{(seconds_left + 59) // 60}'
+
+    digest = hashlib.md5(f'{pc_name.lower()}:{state}'.encode()).hexdigest()[:16]
+    return f'W/"lab-{version}-{digest}"'
+
+
+def conditional(etag_func, login_required=False):
+    """
+    Decorator: answer ``If-None-Match`` for a status view from ``etag_func``.
+
+    Wraps Django's ``condition`` and records the ETag function on the view so
+    LabStateNotModifiedMiddleware can send the 304 before the view runs.
+    ``login_required`` views are only short-circuited for authenticated
+    users.
+    """
+    def decorator(view_func):
+        view = condition(etag_func=etag_func)(view_func)
+        view.lab_state_etag = (etag_func, login_required)
+        return view
+    return decorator
@@ -0,0 +1,218 @@
+"""
+Management command that measures the analytics statistics at growing table
+sizes, reporting latency and peak memory. It only measures; the engine's
+results are checked against plain Python in main_app.tests.
+
+Booking statistics (counts, average duration, per-college totals):
+
+- ``row loop``: row-at-a-time Python over the bookings (how analytics.py
+  aggregated before the rollups and the vectorized engine)
+- ``engine``: analytics_engine, chunked values_list into NumPy / pandas
+- ``rollups``: DescriptiveAnalytics.get_booking_statistics over the hourly
+  rollups (what the reports use), after a backfill whose time is reported
+  separately
+
+Session length distribution (mean, median, p90, histogram, per college):
+
+- ``row loop``: Python lists and the statistics module
+- ``engine``: DescriptiveAnalytics.get_session_duration_statistics
+
+    python manage.py benchmark_analytics --rows 100000 1000000
+
+Rows are inserted inside a transaction that is rolled back at the end, so run
+it against a scratch database. Each implementation is timed on its own and
+then run again under tracemalloc for peak memory (tracemalloc sees both
+Python objects and NumPy buffers, but slows allocation-heavy code down).
+"""
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from account.models import Profile
+from main_app import analytics, analytics_engine, models, rollups
+
+PREFIX = 'benchmark-'
+
+
+class _Rollback(Exception):
+    pass
+
+
+def row_loop_statistics(queryset, chunk_size):
+    """Booking statistics computed one row at a time in Python."""
+    total = confirmed = cancelled = 0
+    durations = []
+    by_college = {}
+    for status, duration, college_id in queryset.values_list(
+        'status', 'duration', 'user__profile__college_id'
+    ).iterator(chunk_size=chunk_size):
+        total += 1
+        if status == 'confirmed':
+            confirmed += 1
+        elif status == 'cancelled':
+            cancelled += 1
+        if duration is not None:
+            durations.append(duration.total_seconds() / 60)
+        if college_id is not None:
+            by_college[college_id] = by_college.get(college_id, 0) + 1
+    names = dict(models.College.objects.filter(pk__in=list(by_college)).values_list('pk', 'name'))
+    return {
+        'total_bookings': total,
+        'confirmed_bookings': confirmed,
+        'cancelled_bookings': cancelled,
+        'avg_duration_minutes': round(statistics.mean(durations), 2) if durations else None,
+        'total_pc_hours': sum(durations) / 60,
+        'bookings_by_college': {
+            names[pk]: count for pk, count in sorted(by_college.items(), key=lambda item: -item[1])
+        },
+    }
+
+
+def engine_statistics(queryset, chunk_size):
+    frame = analytics_engine.load_bookings(
+        queryset, columns=('status', 'duration', 'college_id'), chunk_size=chunk_size
+    )
+    return analytics_engine.booking_statistics(frame)
+
+
+def row_loop_durations(queryset, chunk_size):
+    """Session length distribution computed one row at a time in Python."""
+    minutes = []
+    by_college = {}
+    for duration, college_id in queryset.filter(duration__isnull=False).values_list(
+        'duration', 'user__profile__college_id'
+    ).iterator(chunk_size=chunk_size):
+        value = duration.total_seconds() / 60
+        minutes.append(value)
+        if college_id is not None:
+            by_college.setdefault(college_id, []).append(value)
+    histogram = [0] * (len(analytics_engine.DURATION_BUCKETS) + 1)
+    for value in minutes:
+        histogram[sum(value >= bound for bound in analytics_engine.DURATION_BUCKETS)] += 1
+    minutes.sort()
+    names = dict(models.College.objects.filter(pk__in=list(by_college)).values_list('pk', 'name'))
+    return {
+        'timed_bookings': len(minutes),
+        'avg_minutes': statistics.mean(minutes) if minutes else None,
+        'median_minutes': statistics.median(minutes) if minutes else None,
+        'p90_minutes': statistics.quantiles(minutes, n=10, method='inclusive')[-1] if len(minutes) > 1 else None,
+        'histogram': histogram,
+        'by_college': [
+            (names[pk], len(values), statistics.mean(values), statistics.median(values))
+            for pk, values in sorted(by_college.items(), key=lambda item: -len(item[1]))
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure analytics statistics (row loop vs vectorized engine vs rollups): latency and peak memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000],
+                            help='Booking counts to benchmark at (default 100000 1000000)')
+        parser.add_argument('--chunk-size', type=int, default=analytics_engine.CHUNK_SIZE,
+                            help=f'Rows per values_list chunk (default {analytics_engine.CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        results = []
+        try:
+            with transaction.atomic():
+                seeded = 0
+                for rows in sorted(options['rows']):
+                    self.seed(seeded, rows)
+                    seeded = max(seeded, rows)
+                    self.stdout.write(f'-- {seeded} bookings')
+                    results.extend(self.run(seeded, chunk_size))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write('')
+        self.stdout.write(f"{'bookings':>10}  {'statistic':<18} {'implementation':<16} {'seconds':>9} {'peak MB':>9}")
+        for rows, statistic, name, seconds, peak in results:
+            self.stdout.write(f'{rows:>10}  {statistic:<18} {name:<16} {seconds:>9.3f} {peak / 2**20:>9.1f}')
+
+    def run(self, rows, chunk_size):
+        queryset = models.Booking.objects.filter(user__username__startswith=PREFIX)
+        end = timezone.now()
+        start = end - timedelta(days=120)
+        measured = [
+            ('booking statistics', 'row loop', lambda: row_loop_statistics(queryset, chunk_size)),
+            ('booking statistics', 'engine', lambda: engine_statistics(queryset, chunk_size)),
+            ('booking statistics', 'rollup backfill', lambda: rollups.refresh(backfill_from=rollups.history_start())),
+            ('booking statistics', 'rollups',
+             lambda: analytics.DescriptiveAnalytics.get_booking_statistics(start, end)),
+            ('session durations', 'row loop', lambda: row_loop_durations(queryset, chunk_size)),
+            ('session durations', 'engine',
+             lambda: analytics.DescriptiveAnalytics.get_session_duration_statistics(start, end)),
+        ]
+        results = []
+        for statistic, name, func in measured:
+            seconds, peak = self.measure(func)
+            self.stdout.write(f'   {statistic} / {name}: {seconds:.3f}s, {peak / 2**20:.1f} MB')
+            results.append((rows, statistic, name, seconds, peak))
+        return results
+
+    def measure(self, func):
+        started = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - started
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return seconds, peak
+
+    def seed(self, start, end):
+        """Insert bookings number ``start`` .. ``end`` spread over the last 90 days."""
+        count = end - start
+        if count <= 0:
+            return
+        colleges = list(models.College.objects.filter(name__startswith=PREFIX))
+        if not colleges:
+            models.College.objects.bulk_create([models.College(name=f'{PREFIX}{i}') for i in range(8)])
+            colleges = list(models.College.objects.filter(name__startswith=PREFIX))
+            models.PC.objects.bulk_create([
+                models.PC(name=f'{PREFIX}{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+                for i in range(60)
+            ])
+            # bulk_create does not return primary keys on MySQL, so re-read the rows
+            User.objects.bulk_create([User(username=f'{PREFIX}{i}') for i in range(2000)])
+            users = list(User.objects.filter(username__startswith=PREFIX))
+            Profile.objects.bulk_create([
+                Profile(user=user, role='student', college=colleges[i % len(colleges)] if i % 7 else None)
+                for i, user in enumerate(users)
+            ])
+        pcs = list(models.PC.objects.filter(name__startswith=PREFIX))
+        users = list(User.objects.filter(username__startswith=PREFIX))
+
+        rng = random.Random(start)
+        now = timezone.now()
+        statuses = ['confirmed', 'confirmed', 'cancelled', None]
+        batch = []
+        for i in range(count):
+            began = now - timedelta(minutes=rng.randint(60, 90 * 24 * 60))
+            minutes = rng.choice([30, 60, 90, 120])
+            batch.append(models.Booking(
+                user=users[rng.randrange(len(users))],
+                pc=pcs[rng.randrange(len(pcs))],
+                status=statuses[i % len(statuses)],
+                start_time=began,
+                end_time=began + timedelta(minutes=minutes),
+                duration=timedelta(minutes=minutes) if i % 10 else None,
+                # Ended, so no live-slot conflicts
+                expiry=began + timedelta(minutes=minutes),
+            ))
+            if len(batch) == 5000:
+                models.Booking.objects.bulk_create(batch)
+                batch = []
+        models.Booking.objects.bulk_create(batch)
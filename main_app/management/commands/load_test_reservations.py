@@ -0,0 +1,124 @@
+"""
+Management command that fires many concurrent reservations and checks that no
+PC or student ends up with two live bookings.
+
+    python manage.py load_test_reservations --requests 200 --pcs 50
+
+Runs in a throw-away test database (created like the test runner does, as
+``test_<NAME>``, and destroyed afterwards), so it never writes to the real
+one. Creates one student per request and the PCs, releases all requests at
+once from a thread pool through booking_state.reserve(), then reports
+throughput, latency percentiles, outcomes and double assignments. Any
+request that fails with something other than SlotTaken fails the command.
+
+Run it with the production backend (MySQL). SQLite serializes every write,
+so it only shows the correctness half, and only with a file test database
+(DATABASES TEST NAME) and ``'transaction_mode': 'IMMEDIATE'``; otherwise the
+requests fail with "database table is locked".
+main_app.tests.ConcurrentReservationTests runs a smaller version of the same
+check with the test suite.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import Count
+from main_app import booking_state, models
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent reservations and report throughput, p95 latency and double assignments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Concurrent reservations (one student each)')
+        parser.add_argument('--pcs', type=int, default=50, help='PCs the reservations are spread across')
+        parser.add_argument('--workers', type=int, default=50, help='Threads issuing reservations')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        self.stdout.write('Creating a throw-away test database...')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            users, pcs = self.setup(options['requests'], options['pcs'])
+            run = self.run(users, pcs, options['workers'])
+            self.report(run, pcs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def setup(self, count, pc_count):
+        User.objects.bulk_create([User(username=f'student-{i}') for i in range(count)])
+        models.PC.objects.bulk_create([
+            models.PC(
+                name=f'PC-{i}', ip_address='127.0.0.1', status='connected',
+                system_condition='active', booking_status='available',
+            )
+            for i in range(pc_count)
+        ])
+        return list(User.objects.order_by('id')), list(models.PC.objects.order_by('id'))
+
+    def run(self, users, pcs, workers):
+        start = threading.Barrier(min(workers, len(users)))
+
+        def reserve(i):
+            user, pc = users[i], pcs[i % len(pcs)]
+            try:
+                start.wait(timeout=10)
+            except threading.BrokenBarrierError:
+                pass
+            began = time.perf_counter()
+            try:
+                booking_state.reserve(user, pc, timedelta(minutes=30))
+                outcome = 'reserved'
+            except booking_state.SlotTaken:
+                outcome = 'slot taken'
+            except Exception as e:
+                outcome = f'error: {type(e).__name__}: {e}'
+            finally:
+                # Each worker thread opens its own database connection
+                connection.close()
+            return outcome, time.perf_counter() - began
+
+        close_old_connections()
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(reserve, range(len(users))))
+        elapsed = time.perf_counter() - began
+        return {'results': results, 'elapsed': elapsed}
+
+    def report(self, run, pcs):
+        results, elapsed = run['results'], run['elapsed']
+        latencies = sorted(latency for _, latency in results)
+        outcomes = {}
+        for outcome, _ in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f"Requests:    {len(results)} across {len(pcs)} PCs ({connection.vendor})")
+        self.stdout.write(f"Throughput:  {len(results) / elapsed:.1f} reservations/s ({elapsed:.2f}s total)")
+        self.stdout.write(
+            f"Latency:     p50 {percentile(0.50):.1f} ms, p95 {percentile(0.95):.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+        )
+        for outcome, n in sorted(outcomes.items()):
+            self.stdout.write(f"  {outcome}: {n}")
+
+        live = models.Booking.objects.filter(models.LIVE_BOOKING)
+        double_pcs = live.values('pc').annotate(n=Count('id')).filter(n__gt=1).count()
+        double_users = live.values('user').annotate(n=Count('id')).filter(n__gt=1).count()
+        drifted = models.PC.objects.exclude(booking_status='in_queue').filter(booking__in=live).count()
+        errors = sum(n for outcome, n in outcomes.items() if outcome.startswith('error'))
+
+        self.stdout.write(f"Double-assigned PCs:    {double_pcs}")
+        self.stdout.write(f"Double-booked users:    {double_users}")
+        self.stdout.write(f"PCs not shown in queue: {drifted}")
+        self.stdout.write(f"Failed requests:        {errors}")
+        if double_pcs or double_users or drifted:
+            raise CommandError('Concurrent reservations produced inconsistent bookings')
+        if errors:
+            raise CommandError(f'{errors} reservation(s) failed with an error')
+        self.stdout.write(self.style.SUCCESS('No double assignments'))
@@ -0,0 +1,43 @@
+"""
+Management command that fills the hourly analytics rollups (main_app.rollups).
+
+    python manage.py rollup_analytics               # days changed since the last run
+    python manage.py rollup_analytics --backfill    # the whole history
+    python manage.py rollup_analytics --since 2025-06-01
+
+Run it once at deploy, so the first (whole-history) backfill does not wait
+for the analytics pages to start it in the background, then from cron every
+few minutes; the pages also refresh the rollups themselves when the last run
+is older than rollups.MAX_AGE. Backfill after importing or deleting
+bookings, violations or peripheral events.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from main_app import rollups
+
+
+class Command(BaseCommand):
+    help = 'Update the hourly analytics rollups from the last high-water mark, or backfill them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Rebuild every day from the oldest row')
+        parser.add_argument('--since', help='Rebuild every day from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        backfill_from = None
+        if options['since']:
+            try:
+                backfill_from = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        elif options['backfill']:
+            backfill_from = rollups.history_start()
+            if backfill_from is None:
+                self.stdout.write('Nothing to roll up yet')
+
+        result = rollups.refresh(backfill_from=backfill_from)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rebuilt {result['days']} day(s), {result['rows']} rollup row(s); "
+            f"high-water mark {result['mark'].isoformat()}"
+        ))
@@ -0,0 +1,30 @@
+"""
+Management command to run the background report worker as a long-running process.
+
+Builds queued report jobs (see main_app.report_jobs) into REPORTS_ROOT.
+Use it instead of the in-process worker (set RUN_REPORT_WORKER=False for the
+web process) to keep report building off the web server. Progress pushed to
+the staff alerts socket only reaches the browser with a shared channel layer;
+polling /report-jobs/<id>/ works either way.
+"""
+import threading
+
+from django.core.management.base import BaseCommand
+from main_app import report_jobs
+
+
+class Command(BaseCommand):
+    help = 'Build queued background report jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, default=report_jobs.POLL_SECONDS,
+                            help=f'Seconds between checks for new jobs (default {report_jobs.POLL_SECONDS})')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        self.stdout.write(self.style.SUCCESS('Report worker running, press Ctrl+C to stop'))
+        try:
+            report_jobs.work(stop, poll_seconds=options['poll'])
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write('Report worker stopped')
@@ -0,0 +1,58 @@
+"""
+Management command to run the deadline scheduler as a long-running daemon.
+
+Fires session warnings, session expiry and suspension releases at their exact
+time (see main_app.scheduler). Use it instead of the in-process scheduler
+(set RUN_DEADLINE_SCHEDULER=False for the web process) only with a shared
+channel layer and a shared cache: otherwise its notifications never reach
+the web server's sockets, and the lab version it bumps lives in its own
+cache, so the web server keeps serving stale snapshots and ETags.
+"""
+import time
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from main_app.scheduler import DeadlineScheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the session warning / expiry / suspension release scheduler'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resync',
+            type=int,
+            default=300,
+            help='Seconds between reloads of the deadlines from the database (default 300). '
+                 'The web process cannot reschedule deadlines in this process, so '
+                 'extended sessions and new suspensions are picked up on reload.',
+        )
+
+    def handle(self, *args, **options):
+        if isinstance(get_channel_layer(), InMemoryChannelLayer):
+            raise CommandError(
+                'The in-memory channel layer only reaches sockets of its own process; '
+                'configure a shared CHANNEL_LAYERS backend (e.g. Redis) or keep '
+                'RUN_DEADLINE_SCHEDULER on in the web process.'
+            )
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise CommandError(
+                'The default cache is private to each process, so the lab version this '
+                'process bumps never reaches the web server; configure a shared CACHES '
+                'backend (e.g. Redis or Memcached) or keep RUN_DEADLINE_SCHEDULER on in '
+                'the web process.'
+            )
+        scheduler = DeadlineScheduler()
+        scheduler.start()
+        self.stdout.write(self.style.SUCCESS('Deadline scheduler running, press Ctrl+C to stop'))
+        try:
+            while True:
+                time.sleep(options['resync'])
+                count = scheduler.rebuild(late_warnings=False)
+                self.stdout.write(f"Reloaded {count} deadline(s)")
+        except KeyboardInterrupt:
+            scheduler.stop()
+            self.stdout.write('Scheduler stopped')
@@ -1,30 +1,8 @@
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
 from django.utils.deprecation import MiddlewareMixin
 
 
-class BookingCleanupMiddleware(MiddlewareMixin):
-    """
-    Middleware to clean up expired bookings and sessions.
-    """
-    def process_request(self, request):
-        # Import here to avoid circular imports
-        from main_app.models import Booking
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Clean up expired bookings (run once per request, but only occasionally)
-        # This is a simple approach - in production, use a scheduled task
-        try:
-            expired_bookings = Booking.objects.filter(
-                status='approved',
-                end_time__lt=timezone.now() - timedelta(hours=1)
-            )
-            expired_bookings.update(status='completed')
-        except Exception:
-            pass  # Ignore errors in middleware
-        
-        return None
-
-
 class NgrokSkipWarningMiddleware(MiddlewareMixin):
     """
     Middleware to skip ngrok browser warning page.
@@ -34,3 +12,49 @@ class NgrokSkipWarningMiddleware(MiddlewareMixin):
         # Add header to skip ngrok warning page
         response['ngrok-skip-browser-warning'] = 'true'
         return response
+
+
+class LabStateNotModifiedMiddleware:
+    """
+    Answer status polls with 304 Not Modified before the view runs.
+
+    Only applies to views decorated with lab_state.conditional(). Must sit
+    below AuthenticationMiddleware: ``login_required`` views are only
+    short-circuited once request.user is authenticated, which loads the
+    session and the user. For other views the lazy session and user are
+    never touched, so an unchanged poll costs no database access.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and 'HTTP_IF_NONE_MATCH' in request.META:
+            response = self.not_modified(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def not_modified(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+
+        conditional = getattr(match.func, 'lab_state_etag', None)
+        if conditional is None:
+            return None
+        etag_func, login_required = conditional
+        # A stale or forged session cookie must not learn the lab version
+        if login_required and not request.user.is_authenticated:
+            return None
+
+        try:
+            etag = etag_func(request, *match.args, **match.kwargs)
+        except Exception:
+            return None  # Let the view answer normally
+        if not etag:
+            return None
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response.headers['ETag'] = etag
+        return response
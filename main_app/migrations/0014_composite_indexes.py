@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 19:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_pcstatuschange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['pc', 'status', 'end_time'], name='booking_pc_status_end'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='booking_user_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'created_at'], name='booking_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['expiry', 'end_time'], name='booking_expiry_end'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['chatroom', 'timestamp'], name='chat_room_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['recipient', 'status'], name='chat_recipient_status'),
+        ),
+        migrations.AddIndex(
+            model_name='facultybooking',
+            index=models.Index(fields=['faculty', 'created_at'], name='facultybooking_faculty_created'),
+        ),
+        migrations.AddIndex(
+            model_name='peripheralevent',
+            index=models.Index(fields=['pc', 'created_at'], name='peripheralevent_pc_created'),
+        ),
+        migrations.AddIndex(
+            model_name='violation',
+            index=models.Index(fields=['user', 'resolved', 'timestamp'], name='violation_user_resolved_ts'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-18 19:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+def release_duplicate_live_bookings(apps, schema_editor):
+    """
+    Make the data fit the one-live-booking constraints before adding them.
+
+    Expires confirmed bookings whose end time passed, then keeps one live
+    booking per PC and per student (the running one, otherwise the newest)
+    and cancels the rest.
+    """
+    Booking = apps.get_model("main_app", "Booking")
+    Booking.objects.filter(end_time__lt=timezone.now(), expiry__isnull=True).update(expiry=F('end_time'))
+
+    live = Booking.objects.filter(Q(status__isnull=True) | Q(status='confirmed'), expiry__isnull=True)
+    # Running sessions first, then newest first
+    rows = sorted(
+        live.values('id', 'pc_id', 'user_id', 'faculty_booking_id', 'status', 'created_at'),
+        key=lambda row: (row['status'] == 'confirmed', row['created_at'], row['id']),
+        reverse=True,
+    )
+    kept_pcs, kept_users, duplicates = set(), set(), []
+    for row in rows:
+        user_slot = row['user_id'] if row['faculty_booking_id'] is None else None
+        if (row['pc_id'] and row['pc_id'] in kept_pcs) or (user_slot and user_slot in kept_users):
+            duplicates.append(row['id'])
+            continue
+        kept_pcs.add(row['pc_id'])
+        kept_users.add(user_slot)
+
+    if duplicates:
+        Booking.objects.filter(pk__in=duplicates).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(release_duplicate_live_bookings, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='booking',
+            name='live_pc_slot',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(models.Q(('status__isnull', True), ('status', 'confirmed'), _connector='OR'), ('expiry__isnull', True)), then=models.F('pc')), default=None), output_field=models.BigIntegerField(null=True)),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='live_user_slot',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(models.Q(('status__isnull', True), ('status', 'confirmed'), _connector='OR'), ('expiry__isnull', True), ('faculty_booking__isnull', True)), then=models.F('user')), default=None), output_field=models.BigIntegerField(null=True)),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('live_pc_slot',), name='booking_live_pc_slot_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('live_user_slot',), name='booking_live_user_slot_unique'),
+        ),
+    ]
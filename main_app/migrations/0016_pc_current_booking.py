@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 19:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+
+def set_current_bookings(apps, schema_editor):
+    """Point every PC at its running booking, otherwise its newest pending one."""
+    PC = apps.get_model("main_app", "PC")
+    Booking = apps.get_model("main_app", "Booking")
+    now = timezone.now()
+    current = (
+        Booking.objects.filter(pc=OuterRef('pk'))
+        .filter(
+            Q(status__isnull=True)
+            | (Q(status='confirmed') & (Q(end_time__isnull=True) | Q(end_time__gt=now)))
+        )
+        .annotate(is_pending=Case(When(status='confirmed', then=Value(0)), default=Value(1)))
+        .order_by('is_pending', '-created_at')
+    )
+    PC.objects.update(current_booking=Subquery(current.values('id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_booking_live_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pc',
+            name='current_booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main_app.booking'),
+        ),
+        migrations.RunPython(set_current_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-18 19:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_pc_current_booking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('confirmed_bookings', models.PositiveIntegerField(default=0)),
+                ('cancelled_bookings', models.PositiveIntegerField(default=0)),
+                ('timed_bookings', models.PositiveIntegerField(default=0, help_text='Bookings with a duration')),
+                ('booked_minutes', models.FloatField(default=0)),
+                ('sessions_started', models.PositiveIntegerField(default=0, help_text='Confirmed bookings starting in this hour')),
+                ('minor_violations', models.PositiveIntegerField(default=0)),
+                ('moderate_violations', models.PositiveIntegerField(default=0)),
+                ('major_violations', models.PositiveIntegerField(default=0)),
+                ('peripheral_events', models.PositiveIntegerField(default=0)),
+                ('peripheral_attachments', models.PositiveIntegerField(default=0)),
+                ('peripheral_removals', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['updated_at'], name='booking_updated_at'),
+        ),
+        migrations.AddIndex(
+            model_name='peripheralevent',
+            index=models.Index(fields=['created_at'], name='peripheralevent_created'),
+        ),
+        migrations.AddIndex(
+            model_name='violation',
+            index=models.Index(fields=['timestamp'], name='violation_timestamp'),
+        ),
+        migrations.AddField(
+            model_name='usagerollup',
+            name='college',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main_app.college'),
+        ),
+        migrations.AddField(
+            model_name='usagerollup',
+            name='pc',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main_app.pc'),
+        ),
+        migrations.AddIndex(
+            model_name='usagerollup',
+            index=models.Index(fields=['date', 'hour'], name='usagerollup_date_hour'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0018_report_jobs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='reportjob',
+            name='file',
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='file_name',
+            field=models.CharField(blank=True, help_text='Random name of the built file in settings.REPORTS_ROOT', max_length=100),
+        ),
+    ]
@@ -80,18 +80,11 @@ class PC(models.Model):
     booking_status = models.CharField(
         max_length=20, null=True, choices=[('available', 'Available'), ('in_queue', 'In Queue'), ('in_use', 'In Use')], default='available'
     )
-    
-    def reserve(self):
-        self.booking_status = 'in_queue'
-        self.save()
-    
-    def approve(self):
-        self.booking_status = 'in_use'
-        self.save()
-    
-    def decline(self):
-        self.booking_status = 'available'
-        self.save()
+    # The running booking, otherwise the newest pending one. Kept up to date
+    # with booking_status by the booking state machine (see pc_status).
+    current_booking = models.ForeignKey(
+        'Booking', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
 
     def __str__(self):
         return self.name
@@ -112,6 +105,18 @@ class FacultyBooking(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['faculty', 'created_at'], name='facultybooking_faculty_created'),
+        ]
+
+
+# A booking that is pending (status NULL) or confirmed, and not expired yet.
+LIVE_BOOKING = (
+    (models.Q(status__isnull=True) | models.Q(status='confirmed'))
+    & models.Q(expiry__isnull=True)
+)
+
 
 class Booking(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -127,6 +132,46 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # "Live slot" columns: the PC / user id while the booking is pending or
+    # running (not cancelled, not expired), NULL otherwise. Unique, so the
+    # database allows one live booking per PC and per student; NULLs never
+    # collide. Faculty block bookings hold several PCs for one user and only
+    # take the PC slot.
+    live_pc_slot = models.GeneratedField(
+        expression=models.Case(
+            models.When(LIVE_BOOKING, then=models.F('pc')),
+            default=None,
+        ),
+        output_field=models.BigIntegerField(null=True),
+        db_persist=True,
+    )
+    live_user_slot = models.GeneratedField(
+        expression=models.Case(
+            models.When(LIVE_BOOKING & models.Q(faculty_booking__isnull=True), then=models.F('user')),
+            default=None,
+        ),
+        output_field=models.BigIntegerField(null=True),
+        db_persist=True,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['live_pc_slot'], name='booking_live_pc_slot_unique'),
+            models.UniqueConstraint(fields=['live_user_slot'], name='booking_live_user_slot_unique'),
+        ]
+        indexes = [
+            # A PC's current / pending booking (status pages, reconcile)
+            models.Index(fields=['pc', 'status', 'end_time'], name='booking_pc_status_end'),
+            # A user's bookings, newest first
+            models.Index(fields=['user', 'status', 'created_at'], name='booking_user_status_created'),
+            # Pending / confirmed lists and analytics over a period
+            models.Index(fields=['status', 'created_at'], name='booking_status_created'),
+            # Expiry sweep and running sessions
+            models.Index(fields=['expiry', 'end_time'], name='booking_expiry_end'),
+            # Analytics rollup high-water mark
+            models.Index(fields=['updated_at'], name='booking_updated_at'),
+        ]
+
 
 class Violation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -141,6 +186,12 @@ class Violation(models.Model):
     suspension_end_date = models.DateTimeField(null=True, blank=True, help_text="Date when suspension will be automatically released (for moderate violations)")
     violation_slip_received = models.BooleanField(default=False, help_text="Whether violation slip has been received (for major violations)")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'resolved', 'timestamp'], name='violation_user_resolved_ts'),
+            models.Index(fields=['timestamp'], name='violation_timestamp'),
+        ]
+
 
 class PeripheralEvent(models.Model):
     pc = models.ForeignKey(PC, null=True, on_delete=models.SET_NULL)
@@ -150,6 +201,12 @@ class PeripheralEvent(models.Model):
     metadata = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['pc', 'created_at'], name='peripheralevent_pc_created'),
+            models.Index(fields=['created_at'], name='peripheralevent_created'),
+        ]
+
     def __str__(self):
         return f"{self.pc} {self.action} {self.device_name or self.device_id}"
 
@@ -174,6 +231,95 @@ class WebFilterPolicy(models.Model):
     def __str__(self):
         return f"WebFilterPolicy({self.pc.name})"
 
+class PCStatusChange(models.Model):
+    """
+    Durable copy of the lab-state change log (see main_app.lab_state).
+    One row per version bump, listing the PCs whose state changed.
+    """
+    version = models.BigIntegerField(unique=True)
+    pc_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"PCStatusChange(v{self.version}: {self.pc_ids})"
+
+
+class UsageRollup(models.Model):
+    """
+    Analytics counters for one local hour, college and PC (see main_app.rollups).
+
+    Bookings are counted in the hour they were created, sessions in the hour
+    they started, violations and peripheral events in the hour they happened.
+    Rows are rebuilt a day at a time by ``manage.py rollup_analytics``.
+    """
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    college = models.ForeignKey(College, null=True, on_delete=models.SET_NULL, related_name='+')
+    pc = models.ForeignKey(PC, null=True, on_delete=models.SET_NULL, related_name='+')
+    bookings = models.PositiveIntegerField(default=0)
+    confirmed_bookings = models.PositiveIntegerField(default=0)
+    cancelled_bookings = models.PositiveIntegerField(default=0)
+    timed_bookings = models.PositiveIntegerField(default=0, help_text="Bookings with a duration")
+    booked_minutes = models.FloatField(default=0)
+    sessions_started = models.PositiveIntegerField(default=0, help_text="Confirmed bookings starting in this hour")
+    minor_violations = models.PositiveIntegerField(default=0)
+    moderate_violations = models.PositiveIntegerField(default=0)
+    major_violations = models.PositiveIntegerField(default=0)
+    peripheral_events = models.PositiveIntegerField(default=0)
+    peripheral_attachments = models.PositiveIntegerField(default=0)
+    peripheral_removals = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'hour'], name='usagerollup_date_hour'),
+        ]
+
+
+class RollupMark(models.Model):
+    """High-water mark of an incremental rollup: rows changed after ``value`` are not rolled up yet."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"RollupMark({self.name}: {self.value})"
+
+
+class ReportJob(models.Model):
+    """
+    A report built in the background (see main_app.report_jobs).
+
+    ``params_hash`` identifies the kind, format and parameters, so a repeated
+    request reuses a finished file until ``expires_at``.
+    """
+    kind = models.CharField(max_length=20, choices=[('bookings', 'Bookings export'), ('analytics', 'Analytics report')])
+    file_format = models.CharField(max_length=10, choices=[('csv', 'CSV'), ('xlsx', 'Excel')])
+    params = models.JSONField(default=dict, blank=True)
+    params_hash = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=20, default='queued',
+        choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+    )
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent done")
+    rows = models.PositiveIntegerField(null=True, blank=True)
+    file_name = models.CharField(max_length=100, blank=True, help_text="Random name of the built file in settings.REPORTS_ROOT")
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker building the job")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Until when the file is reused for the same parameters")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['params_hash', 'status'], name='reportjob_hash_status'),
+            models.Index(fields=['status', 'created_at'], name='reportjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f"ReportJob({self.pk}: {self.kind} {self.file_format} {self.status})"
+
+
 class ChatRoom(models.Model):
     initiator = models.ForeignKey(User, null=True, related_name='chat_room_initiator', on_delete=models.CASCADE)
     receiver = models.ForeignKey(User, null=True, related_name='chat_room_receiver', on_delete=models.CASCADE)
@@ -187,3 +333,9 @@ class Chat(models.Model):
     image = models.ImageField(upload_to='chat_images/', null=True, blank=True)
     status = models.CharField(max_length=20, choices=[('sent', 'Sent'), ('delivered', 'Delivered'), ('read', 'Read')])
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chatroom', 'timestamp'], name='chat_room_timestamp'),
+            models.Index(fields=['recipient', 'status'], name='chat_recipient_status'),
+        ]
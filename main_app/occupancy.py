@@ -0,0 +1,133 @@
+"""
+Lab occupancy counters.
+
+Keeps the number of available / connected / in-repair (etc.) PCs in the cache
+so pages can show them without a COUNT(*) per figure. The counters are
+adjusted from each PC's before/after state when a transition is broadcast
+(see broadcast), and rebuilt with one grouped aggregate query whenever they
+are missing, e.g. after a restart or after a PC was added, edited or deleted.
+
+The counters expire after COUNTS_TIMEOUT, so a change that was missed (a
+process killed between commit and broadcast, a direct SQL update) is only
+off until the next rebuild. A change broadcast after a rebuild that already
+read it is not applied twice: each rebuild records when it read the table
+(REBUILT_KEY), and apply_change compares that with when the change was made.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db.models import Count
+from .models import PC
+
+KEY_PREFIX = 'pcheck:occupancy:'
+
+# Counters are recounted from the table at least this often.
+COUNTS_TIMEOUT = 5 * 60
+
+# (started, finished) time.time() of the query behind the current counters
+REBUILT_KEY = KEY_PREFIX + 'rebuilt'
+
+COUNTERS = (
+    'total',         # every PC
+    'connected',     # status connected
+    'disconnected',  # status disconnected
+    'active',        # connected and not in repair
+    'in_repair',     # system_condition repair
+    'unbooked',      # booking_status available, whatever the PC's condition
+    'available',     # unbooked, connected and not in repair: can be reserved now
+    'in_use',
+    'in_queue',
+)
+
+
+def classify(booking_status, status, system_condition):
+    """Return the counters a PC in this state contributes 1 to."""
+    booking_status = booking_status or 'available'
+    keys = ['total', 'connected' if status == 'connected' else 'disconnected']
+    if system_condition == 'repair':
+        keys.append('in_repair')
+    active = system_condition == 'active' and status == 'connected'
+    if active:
+        keys.append('active')
+    if booking_status == 'available':
+        keys.append('unbooked')
+        if active:
+            keys.append('available')
+    elif booking_status in ('in_use', 'in_queue'):
+        keys.append(booking_status)
+    return keys
+
+
+def rebuild():
+    """Recount every counter with one grouped query and store the result."""
+    counts = dict.fromkeys(COUNTERS, 0)
+    started = time.time()
+    groups = list(PC.objects.values('booking_status', 'status', 'system_condition').annotate(n=Count('id')))
+    finished = time.time()
+    for group in groups:
+        for key in classify(group['booking_status'], group['status'], group['system_condition']):
+            counts[key] += group['n']
+    values = {KEY_PREFIX + key: value for key, value in counts.items()}
+    values[REBUILT_KEY] = (started, finished)
+    cache.set_many(values, timeout=COUNTS_TIMEOUT)
+    return counts
+
+
+def get_counts():
+    """
+    Return all occupancy counters, e.g. ``get_counts()['available']``.
+
+    One cache read; the counters are rebuilt if any of them is missing.
+    """
+    cached = cache.get_many([KEY_PREFIX + key for key in COUNTERS])
+    if len(cached) != len(COUNTERS):
+        return rebuild()
+    return {key: cached[KEY_PREFIX + key] for key in COUNTERS}
+
+
+def apply_change(before, after, started=None, committed=None):
+    """
+    Move one PC between counters.
+
+    ``before`` and ``after`` are (booking_status, status, system_condition)
+    tuples; pass None for a PC that did not exist before / no longer exists.
+    ``started`` and ``committed`` (time.time()) bracket the transaction that
+    made the change: before its first write and after its commit. A rebuild
+    that started after the commit already counted the change, so it is
+    skipped; one that overlapped the transaction may or may not have, so the
+    counters are dropped and recounted.
+    """
+    deltas = dict.fromkeys(COUNTERS, 0)
+    for key in classify(*before) if before else ():
+        deltas[key] -= 1
+    for key in classify(*after) if after else ():
+        deltas[key] += 1
+    if not any(deltas.values()):
+        return
+
+    if started is not None and committed is not None:
+        rebuilt = cache.get(REBUILT_KEY)
+        if rebuilt is not None:
+            read_started, read_finished = rebuilt
+            if read_started >= committed:
+                return
+            if read_finished >= started:
+                invalidate()
+                return
+
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(KEY_PREFIX + key, delta)
+        except ValueError:
+            # Not cached: the next read rebuilds from the table, which already
+            # includes this change
+            invalidate()
+            return
+
+
+def invalidate():
+    """Drop the counters so the next read rebuilds them."""
+    cache.delete_many([KEY_PREFIX + key for key in COUNTERS] + [REBUILT_KEY])
@@ -0,0 +1,107 @@
+"""
+PC booking status reconciliation.
+
+Works out every PC's booking state (available / in_queue / in_use) and current
+booking from its bookings in a single annotated query, instead of issuing
+several Booking lookups per PC, and writes back only the rows that drifted.
+"""
+
+from django.db.models import Case, Exists, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+from .models import Booking, PC
+
+
+def annotate_booking_state(queryset=None, now=None):
+    """
+    Annotate a PC queryset with ``has_pending_booking`` and ``has_active_booking``.
+
+    - pending: a booking waiting for approval (status is NULL)
+    - active: a confirmed booking that has not reached its end time yet
+      (a confirmed booking without an end time is treated as active)
+    """
+    if queryset is None:
+        queryset = PC.objects.all()
+    if now is None:
+        now = timezone.now()
+
+    pending_bookings = Booking.objects.filter(
+        pc=OuterRef('pk'),
+        status__isnull=True,
+    )
+    active_bookings = Booking.objects.filter(
+        pc=OuterRef('pk'),
+        status='confirmed',
+    ).filter(Q(end_time__isnull=True) | Q(end_time__gt=now))
+
+    return queryset.annotate(
+        has_pending_booking=Exists(pending_bookings),
+        has_active_booking=Exists(active_bookings),
+    )
+
+
+def current_booking_subquery(now=None):
+    """
+    Subquery for the id of a PC's current booking, for ``PC.current_booking``.
+
+    That is its active confirmed booking (see annotate_booking_state),
+    otherwise its newest pending one, otherwise NULL.
+    """
+    if now is None:
+        now = timezone.now()
+    bookings = (
+        Booking.objects.filter(pc=OuterRef('pk'))
+        .filter(
+            Q(status__isnull=True)
+            | (Q(status='confirmed') & (Q(end_time__isnull=True) | Q(end_time__gt=now)))
+        )
+        .annotate(is_pending=Case(When(status='confirmed', then=Value(0)), default=Value(1)))
+        .order_by('is_pending', '-created_at')
+    )
+    return Subquery(bookings.values('id')[:1])
+
+
+def expected_booking_status(pc):
+    """Return the booking_status a PC annotated by annotate_booking_state() should have."""
+    if pc.has_active_booking:
+        return 'in_use'
+    if pc.has_pending_booking:
+        return 'in_queue'
+    return 'available'
+
+
+def reconcile_pc_statuses(queryset=None, now=None):
+    """
+    Bring PC.booking_status and PC.current_booking in line with the bookings table.
+
+    Runs one SELECT for all PCs and at most one UPDATE (bulk_update) for the
+    rows that changed, so the query count does not grow with the lab size.
+
+    Every returned PC carries ``previous_booking_status``, the value it had
+    before reconciling.
+
+    Returns:
+        tuple: (pcs: list of PC, changed: list of PC whose booking_status was fixed)
+    """
+    if queryset is None:
+        queryset = PC.objects.order_by('sort_number')
+
+    pcs = list(
+        annotate_booking_state(queryset, now=now)
+        .annotate(expected_booking_id=current_booking_subquery(now))
+    )
+    changed = []
+    to_save = []
+    for pc in pcs:
+        pc.previous_booking_status = pc.booking_status
+        expected = expected_booking_status(pc)
+        if pc.booking_status != expected or pc.current_booking_id != pc.expected_booking_id:
+            to_save.append(pc)
+        if pc.booking_status != expected:
+            pc.booking_status = expected
+            changed.append(pc)
+        pc.current_booking_id = pc.expected_booking_id
+
+    if to_save:
+        PC.objects.bulk_update(to_save, ['booking_status', 'current_booking'])
+
+    return pcs, changed
@@ -0,0 +1,219 @@
+"""
+Cached analytics report sections with stale-while-revalidate.
+
+Each section of AnalyticsSummary.SECTIONS is cached on its own, keyed by the
+report period (7/14/30/60/90 days; sections with their own window share one
+entry) and the section name. A request is answered from the cache right
+away:
+
+- fresh (younger than FRESH_SECONDS and not invalidated): served as is
+- stale: served as is, and one background thread recomputes it
+- missing (never computed, or older than STALE_SECONDS): computed in the
+  request
+
+At most one recompute per key runs at a time in the process; concurrent
+requests for a missing section wait for it instead of recomputing.
+
+invalidate() marks every entry stale after a large data change (a rollup
+backfill, deleted PCs), so the next view triggers a refresh.
+
+Entries live in Django's cache; the single-flight bookkeeping is per process,
+which matches the single daphne process the lab runs.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from .analytics import AnalyticsSummary
+
+FRESH_SECONDS = 5 * 60
+STALE_SECONDS = 60 * 60
+
+# Longest a request waits for another request's recompute of the same key.
+COMPUTE_WAIT_SECONDS = 60
+
+SECTION_KEY = 'pcheck:report:{period}:{group}.{name}'
+GENERATION_KEY = 'pcheck:report:generation'
+
+_inflight = {}  # cache key -> threading.Event set when the recompute ends
+_inflight_lock = threading.Lock()
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 0, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """Mark every cached section stale; call after a large data change."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+        cache.incr(GENERATION_KEY)
+
+
+def section_key(group, name, days):
+    for section_group, section_name, uses_period, _ in AnalyticsSummary.SECTIONS:
+        if (section_group, section_name) == (group, name):
+            return SECTION_KEY.format(period=days if uses_period else 'all', group=group, name=name)
+    raise KeyError(f"Unknown analytics section: {group}.{name}")
+
+
+def get_section(group, name, days=30, generation=None):
+    """
+    Return the cache entry of one report section, computing it if missing.
+
+    Returns:
+        dict: ``value`` (the section), ``computed_at`` (epoch seconds),
+        ``seconds`` (how long it took to compute) and ``generation``
+    """
+    key = section_key(group, name, days)
+    if generation is None:
+        generation = get_generation()
+    entry = _cached(key, group, name, days, generation)
+    if entry is not None:
+        return entry
+
+    event = _claim(key)
+    if event is None:
+        # Someone else is computing it; use their result
+        return _wait_for(key, group, name, days)
+    try:
+        started = time.perf_counter()
+        value = AnalyticsSummary.get_section(group, name, days)
+        return _store(key, value, time.perf_counter() - started, generation)
+    finally:
+        _release(key, event)
+
+
+def get_report(days=30, groups=('descriptive', 'predictive')):
+    """
+    Return the comprehensive report for ``days`` from cached sections.
+
+    Same shape as AnalyticsSummary.get_comprehensive_report; ``report_date``
+    is when the oldest section was computed. Missing sections are computed
+    together on the section pool, so a cold report takes about as long as
+    its slowest section. ``section_timings`` gives each section's compute
+    time and whether it came from the cache. ``groups`` limits the report to
+    the descriptive and/or predictive half.
+    """
+    generation = get_generation()
+    sections = [(group, name) for group, name, _, _ in AnalyticsSummary.SECTIONS if group in groups]
+    keys = {section: section_key(*section, days) for section in sections}
+    entries = {}
+    cached = set()
+    for section in sections:
+        entry = _cached(keys[section], *section, days, generation)
+        if entry is not None:
+            entries[section] = entry
+            cached.add(section)
+
+    missing = [section for section in sections if section not in entries]
+    claimed = {}
+    for section in missing:
+        event = _claim(keys[section])
+        if event is not None:
+            claimed[section] = event
+    try:
+        if claimed:
+            computed = AnalyticsSummary.evaluate_sections(list(claimed), days)
+            for section, (value, seconds) in computed.items():
+                entries[section] = _store(keys[section], value, seconds, generation)
+    finally:
+        for section, event in claimed.items():
+            _release(keys[section], event)
+    for section in missing:
+        if section not in entries:
+            entries[section] = _wait_for(keys[section], *section, days)
+
+    report = {'report_date': None, 'period_days': days}
+    for group, name in sections:
+        report.setdefault(group, {})[name] = entries[(group, name)]['value']
+    report['section_timings'] = {
+        f'{group}.{name}': {'seconds': entries[(group, name)]['seconds'], 'cached': (group, name) in cached}
+        for group, name in sections
+    }
+
+    oldest = min((entry['computed_at'] for entry in entries.values()), default=None)
+    computed_at = timezone.now() if oldest is None else datetime.fromtimestamp(oldest, tz=dt_timezone.utc)
+    report['report_date'] = timezone.localtime(computed_at).isoformat()
+    return report
+
+
+def _cached(key, group, name, days, generation):
+    """Return the cached entry (scheduling a refresh when stale), or None when missing."""
+    entry = cache.get(key)
+    if entry is not None:
+        stale = time.time() - entry['computed_at'] >= FRESH_SECONDS or entry['generation'] != generation
+        if stale:
+            _refresh_in_background(key, group, name, days)
+    return entry
+
+
+def _store(key, value, seconds, generation):
+    entry = {
+        'value': value,
+        'computed_at': time.time(),
+        'seconds': round(seconds, 4),
+        'generation': generation,
+    }
+    cache.set(key, entry, STALE_SECONDS)
+    return entry
+
+
+def _wait_for(key, group, name, days):
+    """Wait for another thread's recompute of ``key``; compute it here if that failed."""
+    with _inflight_lock:
+        event = _inflight.get(key)
+    if event is not None:
+        event.wait(COMPUTE_WAIT_SECONDS)
+    entry = cache.get(key)
+    if entry is None:
+        started = time.perf_counter()
+        value = AnalyticsSummary.get_section(group, name, days)
+        entry = _store(key, value, time.perf_counter() - started, get_generation())
+    return entry
+
+
+def _claim(key):
+    """Mark ``key`` as being recomputed. Returns the Event to release, or None if already claimed."""
+    with _inflight_lock:
+        if key in _inflight:
+            return None
+        event = _inflight[key] = threading.Event()
+        return event
+
+
+def _release(key, event):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    event.set()
+
+
+def _refresh_in_background(key, group, name, days):
+    event = _claim(key)
+    if event is None:
+        return
+
+    def refresh():
+        try:
+            generation = get_generation()
+            started = time.perf_counter()
+            value = AnalyticsSummary.get_section(group, name, days)
+            _store(key, value, time.perf_counter() - started, generation)
+        except Exception as e:
+            print(f"❌ Could not refresh analytics section {group}.{name}: {e}")
+        finally:
+            _release(key, event)
+            # This thread's own database connection
+            connections.close_all()
+
+    threading.Thread(target=refresh, name=f'report-refresh-{group}.{name}', daemon=True).start()
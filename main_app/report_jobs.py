@@ -0,0 +1,482 @@
+"""
+Background report jobs.
+
+Big exports and full-period reports take longer than nginx / ngrok wait for
+a response, so staff submit them as ReportJob rows and a worker builds the
+file into settings.REPORTS_ROOT while the page polls the job (or listens on
+the staff alerts socket, see notify). Finished files are served from disk by
+the staff-only download view; REPORTS_ROOT is outside MEDIA_ROOT, which is
+served to anyone, and files get random names.
+
+Jobs are keyed by a hash of their kind, format and parameters: submitting
+the same report again returns the queued or running job, or the finished
+one until its file expires (RESULT_MINUTES when the range reaches the
+present, KEEP_DAYS for a closed past range).
+
+The worker is one daemon thread in the ASGI process (RUN_REPORT_WORKER), or
+``manage.py run_report_worker`` as a separate process. Jobs are claimed
+with a conditional UPDATE, so several workers never build the same job.
+A running job's ``heartbeat_at`` is refreshed while it is built; a job
+whose heartbeat stopped belongs to a dead worker and is queued again.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from . import exports
+from .broadcast import group_send
+from .models import ReportJob
+
+FORMATS = ('csv', 'xlsx')
+ANALYTICS_PERIODS = (7, 14, 30, 60, 90)
+
+# Finished files are reused this long when their range reaches the present,
+# and kept this long when it is entirely in the past.
+RESULT_MINUTES = 15
+KEEP_DAYS = 7
+
+# Idle workers look for jobs queued by other processes this often.
+POLL_SECONDS = 5
+
+# A running job without a heartbeat for this long belongs to a dead worker.
+STALE_JOB_MINUTES = 10
+
+# Progress updates are saved and pushed at most this often.
+PROGRESS_INTERVAL_SECONDS = 1
+
+# A running job's heartbeat is refreshed this often, whatever its builder does.
+HEARTBEAT_SECONDS = 60
+
+# Excel sheets hold at most this many rows (including the header).
+XLSX_MAX_ROWS = 1048576
+
+EXPORT_PARAMS = ('period', 'from', 'to', 'status', 'college', 'pc', 'user')
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class InvalidJob(ValueError):
+    """Raised for a job that cannot be submitted."""
+
+
+def normalize_params(kind, file_format, params):
+    """
+    Validate a job's parameters and return them in canonical form.
+
+    ``bookings``: the export parameters of exports.parse_params;
+    ``analytics``: ``period`` (7/14/30/60/90 days).
+    """
+    if file_format not in FORMATS:
+        raise InvalidJob(f"format must be one of {', '.join(FORMATS)}")
+    if kind == 'bookings':
+        normalized = {
+            name: str(params[name]).strip() for name in EXPORT_PARAMS if str(params.get(name, '')).strip()
+        }
+        if normalized.get('status'):
+            normalized['status'] = ','.join(sorted({
+                status.strip().lower() for status in normalized['status'].split(',') if status.strip()
+            }))
+        if not normalized.get('from') and not normalized.get('to'):
+            normalized.setdefault('period', 'daily')
+        try:
+            exports.parse_params(normalized)
+        except exports.InvalidExport as e:
+            raise InvalidJob(str(e))
+        return normalized
+    if kind == 'analytics':
+        try:
+            period = int(params.get('period', 30))
+        except (TypeError, ValueError):
+            period = None
+        if period not in ANALYTICS_PERIODS:
+            raise InvalidJob(f"period must be one of {', '.join(map(str, ANALYTICS_PERIODS))}")
+        return {'period': period}
+    raise InvalidJob("kind must be bookings or analytics")
+
+
+def params_hash(kind, file_format, params):
+    text = json.dumps([kind, file_format, params], sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def submit(kind, file_format, params, user=None, now=None):
+    """
+    Queue a report, or return the job already answering the same parameters.
+
+    Returns:
+        tuple: (ReportJob, reused) where ``reused`` is True for an existing job
+    """
+    if now is None:
+        now = timezone.now()
+    params = normalize_params(kind, file_format, params)
+    digest = params_hash(kind, file_format, params)
+
+    existing = ReportJob.objects.filter(params_hash=digest).filter(
+        status__in=['queued', 'running']
+    ).order_by('-created_at').first() or ReportJob.objects.filter(
+        params_hash=digest, status='done', expires_at__gt=now
+    ).order_by('-finished_at').first()
+    if existing is not None and (existing.status != 'done' or _file_exists(existing)):
+        return existing, True
+
+    job = ReportJob.objects.create(
+        kind=kind, file_format=file_format, params=params, params_hash=digest, requested_by=user
+    )
+    _wakeup.set()
+    return job, False
+
+
+def file_path(job):
+    """Absolute path of a job's built file, or None before it is built."""
+    if not job.file_name:
+        return None
+    return os.path.join(settings.REPORTS_ROOT, job.file_name)
+
+
+def _file_exists(job):
+    path = file_path(job)
+    return path is not None and os.path.exists(path)
+
+
+def job_status(job):
+    """JSON-ready state of a job, as polled by the pages and pushed to the alerts socket."""
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'format': job.file_format,
+        'params': job.params,
+        'status': job.status,
+        'progress': job.progress,
+        'rows': job.rows,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'download_url': reverse('main_app:report-job-download', args=[job.pk]) if job.status == 'done' else None,
+    }
+
+
+def notify(job):
+    """Push the job's state to the staff alerts socket (AlertsConsumer), through the server loop."""
+    try:
+        group_send(
+            'alerts_staff',
+            {
+                'type': 'alert_message',
+                'title': 'Report job',
+                'message': f"Report {job.pk} ({job.get_kind_display()}, {job.file_format.upper()}): {job.status}",
+                'payload': {'report_job': job_status(job)},
+            }
+        )
+    except Exception as e:
+        print(f"⚠️ Could not push report job {job.pk} progress: {e}")
+
+
+def claim_next():
+    """Claim the oldest queued job for this worker. Returns it, or None when there is none."""
+    while True:
+        job = ReportJob.objects.filter(status='queued').order_by('created_at', 'pk').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = ReportJob.objects.filter(pk=job.pk, status='queued').update(
+            status='running', started_at=now, heartbeat_at=now, progress=0
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_stale(now=None):
+    """Put jobs whose worker stopped sending heartbeats back in the queue."""
+    if now is None:
+        now = timezone.now()
+    cutoff = now - timedelta(minutes=STALE_JOB_MINUTES)
+    return ReportJob.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ).update(status='queued', progress=0)
+
+
+def run(job):
+    """Build one claimed job's file and record the outcome."""
+    notify(job)
+    started = time.perf_counter()
+    progress = _Progress(job)
+    # Builders can block for long without reporting progress (build_analytics
+    # waits on the whole report), so the heartbeat has its own thread
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_keep_alive, args=(job, stop_heartbeat), name=f'report-heartbeat-{job.pk}', daemon=True
+    )
+    heartbeat.start()
+    try:
+        file_name, rows, closed_range = BUILDERS[job.kind](job, progress)
+    except Exception as e:
+        print(f"❌ Report job {job.pk} failed: {e}")
+        return fail(job, e)
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    job.status = 'done'
+    job.progress = 100
+    job.rows = rows
+    job.file_name = file_name
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + (timedelta(days=KEEP_DAYS) if closed_range else timedelta(minutes=RESULT_MINUTES))
+    job.save(update_fields=['status', 'progress', 'rows', 'file_name', 'finished_at', 'expires_at'])
+    print(f"✅ Report job {job.pk} built {rows} row(s) in {time.perf_counter() - started:.1f}s")
+    notify(job)
+    return job
+
+
+def fail(job, error):
+    """Record a job as failed with ``error`` and push its state."""
+    job.status = 'failed'
+    job.error = str(error)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    notify(job)
+    return job
+
+
+def _keep_alive(job, stop):
+    """Refresh a running job's heartbeat_at every HEARTBEAT_SECONDS until ``stop`` is set."""
+    try:
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                ReportJob.objects.filter(pk=job.pk, status='running').update(heartbeat_at=timezone.now())
+            except Exception as e:
+                print(f"⚠️ Could not refresh report job {job.pk} heartbeat: {e}")
+    finally:
+        connection.close()
+
+
+class _Progress:
+    """Saves and pushes a job's percent done, at most every PROGRESS_INTERVAL_SECONDS."""
+
+    def __init__(self, job):
+        self.job = job
+        self.last = 0
+
+    def __call__(self, done, total):
+        percent = min(99, int(done * 100 / total)) if total else 0
+        if percent <= self.job.progress or time.monotonic() - self.last < PROGRESS_INTERVAL_SECONDS:
+            return
+        self.last = time.monotonic()
+        self.job.progress = percent
+        ReportJob.objects.filter(pk=self.job.pk).update(progress=percent)
+        notify(self.job)
+
+
+def _output_path(job):
+    """(random file name, absolute path under REPORTS_ROOT) for a job's file."""
+    name = f'{secrets.token_urlsafe(24)}.{job.file_format}'
+    os.makedirs(settings.REPORTS_ROOT, exist_ok=True)
+    return name, os.path.join(settings.REPORTS_ROOT, name)
+
+
+def _write_atomically(absolute, write):
+    """Run ``write(path)`` on a temporary name and move the result in place."""
+    # Keep the extension: pandas picks the Excel writer by it
+    root, extension = os.path.splitext(absolute)
+    partial = f'{root}.part{extension}'
+    try:
+        write(partial)
+        os.replace(partial, absolute)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def build_bookings(job, progress):
+    params = exports.parse_params(job.params, now=job.created_at)
+    queryset = exports.bookings(params['start'], params['end'], params['filters'])
+    total = queryset.count()
+    if job.file_format == 'xlsx' and total + 1 > XLSX_MAX_ROWS:
+        raise ValueError(f"{total} bookings do not fit in one Excel sheet; export them as CSV")
+
+    relative, absolute = _output_path(job)
+    written = 0
+
+    def chunks():
+        nonlocal written
+        rows = []
+        for row in exports.booking_rows(queryset):
+            rows.append(row)
+            if len(rows) == exports.CHUNK_SIZE:
+                written += len(rows)
+                yield pd.DataFrame(rows, columns=exports.HEADER)
+                progress(written, total)
+                rows = []
+        written += len(rows)
+        yield pd.DataFrame(rows, columns=exports.HEADER)
+
+    def write(path):
+        if job.file_format == 'csv':
+            with open(path, 'w', newline='', encoding='utf-8') as handle:
+                for i, frame in enumerate(chunks()):
+                    frame.to_csv(handle, header=i == 0, index=False)
+        else:
+            with pd.ExcelWriter(path, engine='openpyxl') as writer:
+                startrow = 0
+                for frame in chunks():
+                    frame.to_excel(writer, sheet_name='Bookings', startrow=startrow, header=startrow == 0, index=False)
+                    startrow += len(frame) + (1 if startrow == 0 else 0)
+
+    _write_atomically(absolute, write)
+    # A range with an explicit end in the past will not change any more
+    return relative, written, bool(job.params.get('to')) and params['end'] <= job.created_at
+
+
+def build_analytics(job, progress):
+    from . import report_cache
+
+    days = job.params['period']
+    progress(1, 10)
+    report = report_cache.get_report(days=days)
+    progress(8, 10)
+    frames = analytics_frames(report)
+
+    relative, absolute = _output_path(job)
+
+    def write(path):
+        if job.file_format == 'csv':
+            # One long table: section, row, metric, value
+            pd.DataFrame([
+                (name, row, metric, value)
+                for name, frame in frames.items()
+                for row, record in enumerate(frame.to_dict('records'))
+                for metric, value in record.items()
+                if not pd.isna(value)
+            ], columns=['section', 'row', 'metric', 'value']).to_csv(path, index=False)
+        else:
+            with pd.ExcelWriter(path, engine='openpyxl') as writer:
+                sheets = set()
+                for name, frame in frames.items():
+                    # Excel limits sheet names to 31 characters
+                    sheet = name[:31]
+                    while sheet in sheets:
+                        sheet = f'{sheet[:28]}~{len(sheets)}'
+                    sheets.add(sheet)
+                    frame.to_excel(writer, sheet_name=sheet, index=False)
+
+    _write_atomically(absolute, write)
+    return relative, sum(len(frame) for frame in frames.values()), False
+
+
+def analytics_frames(report):
+    """
+    Tables of an analytics report: one per section with its single values,
+    plus one per list of records inside a section.
+
+    Returns:
+        dict: sheet name -> DataFrame
+    """
+    frames = {'summary': pd.DataFrame([{
+        'report_date': report['report_date'], 'period_days': report['period_days'],
+    }])}
+    for group in ('descriptive', 'predictive'):
+        for section, value in report.get(group, {}).items():
+            if not isinstance(value, dict):
+                frames[section] = pd.DataFrame({'value': [_cell(value)]})
+                continue
+            single = {}
+            for key, item in value.items():
+                if isinstance(item, list) and item and all(isinstance(entry, dict) for entry in item):
+                    frames[f'{section}.{key}'] = pd.DataFrame([
+                        {name: _cell(cell) for name, cell in entry.items()} for entry in item
+                    ])
+                else:
+                    single[key] = _cell(item)
+            if single:
+                frames[section] = pd.DataFrame([single])
+    return frames
+
+
+def _cell(value):
+    """Spreadsheet-friendly form of a report value: nested data as JSON text."""
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+BUILDERS = {
+    'bookings': build_bookings,
+    'analytics': build_analytics,
+}
+
+
+def cleanup(now=None):
+    """Delete report files and jobs older than KEEP_DAYS. Returns the number of jobs removed."""
+    if now is None:
+        now = timezone.now()
+    old = ReportJob.objects.filter(created_at__lt=now - timedelta(days=KEEP_DAYS)).exclude(status='running')
+    count = 0
+    for job in old:
+        if _file_exists(job):
+            os.remove(file_path(job))
+        job.delete()
+        count += 1
+    return count
+
+
+def work(stop=None, poll_seconds=POLL_SECONDS):
+    """Worker loop: build queued jobs one at a time until ``stop`` (an Event) is set."""
+    stop = stop or threading.Event()
+    last_requeue = last_cleanup = 0
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            if time.monotonic() - last_requeue > STALE_JOB_MINUTES * 60:
+                requeue_stale()
+                last_requeue = time.monotonic()
+            if time.monotonic() - last_cleanup > 60 * 60:
+                cleanup()
+                last_cleanup = time.monotonic()
+            job = claim_next()
+        except Exception as e:
+            print(f"❌ Report worker could not read the queue: {e}")
+            job = None
+        if job is not None:
+            # An error outside the builder (e.g. the database going away while
+            # the result is saved) must not end the only worker thread
+            try:
+                run(job)
+            except Exception as e:
+                print(f"❌ Report job {job.pk} could not be recorded: {e}")
+                try:
+                    close_old_connections()
+                    fail(job, e)
+                except Exception as e:
+                    # Left running: requeue_stale picks it up once its heartbeat is stale
+                    print(f"❌ Report job {job.pk} could not be marked failed: {e}")
+            continue
+        _wakeup.wait(poll_seconds)
+        _wakeup.clear()
+    close_old_connections()
+
+
+def start():
+    """Start the in-process worker thread once."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=work, name='report-worker', daemon=True)
+            _worker.start()
+    return _worker
@@ -0,0 +1,248 @@
+"""
+Incremental analytics rollups.
+
+UsageRollup holds hourly counters per (local date, hour, college, PC), so the
+analytics reports add up a few rows per day instead of rescanning every
+booking, violation and peripheral event in their period.
+
+refresh() rebuilds only the days touched since the previous run: days holding
+a booking whose updated_at, a violation whose timestamp or a peripheral event
+whose created_at is after the high-water mark (RollupMark ``usage``). A
+touched day is recomputed from its raw rows, so re-running is harmless and a
+booking confirmed or cancelled days after it was made moves its day's
+counters. Deleted rows are only noticed by a backfill
+(``manage.py rollup_analytics --backfill``).
+
+Reports keep the rollups current through ensure_fresh(). Before the first
+backfill there is no mark and the whole history has to be rolled up, which
+is too long for a request: ensure_fresh() then starts it in a background
+thread (or run ``manage.py rollup_analytics`` at deploy) and the reports
+serve the rows that exist meanwhile.
+"""
+
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from .models import Booking, PeripheralEvent, RollupMark, UsageRollup, Violation
+
+MARK_NAME = 'usage'
+
+# Re-read this much before the mark, for rows stamped just before the previous
+# run started that committed after it read them.
+MARK_OVERLAP = timedelta(minutes=5)
+
+# Reports refresh the rollups themselves when the last run is older than this.
+MAX_AGE = timedelta(minutes=5)
+FRESH_KEY = 'pcheck:rollups:fresh'
+REFRESH_LOCK_KEY = 'pcheck:rollups:refresh'
+
+# Longest a refresh holds the lock: an incremental run, and the first backfill.
+REFRESH_LOCK_SECONDS = 10 * 60
+BACKFILL_LOCK_SECONDS = 2 * 60 * 60
+
+# A refresh rebuilding at least this many days marks the cached reports stale.
+LARGE_CHANGE_DAYS = 7
+
+
+def local_bucket(dt):
+    """Return the (local date, hour) rollup bucket of an aware datetime."""
+    local = timezone.localtime(dt)
+    return local.date(), local.hour
+
+
+def day_bounds(day):
+    """Return the aware [start, end) datetimes of a local date."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def rebuild_day(day):
+    """Recompute every rollup row of one local date. Returns the number of rows written."""
+    start, end = day_bounds(day)
+    counters = defaultdict(Counter)  # (hour, college id, pc id) -> counts
+
+    bookings = Booking.objects.filter(created_at__gte=start, created_at__lt=end).values_list(
+        'created_at', 'pc_id', 'user__profile__college_id', 'status', 'duration'
+    )
+    for created_at, pc_id, college_id, status, duration in bookings.iterator():
+        row = counters[(local_bucket(created_at)[1], college_id, pc_id)]
+        row['bookings'] += 1
+        if status == 'confirmed':
+            row['confirmed_bookings'] += 1
+        elif status == 'cancelled':
+            row['cancelled_bookings'] += 1
+        if duration is not None:
+            row['timed_bookings'] += 1
+            row['booked_minutes'] += duration.total_seconds() / 60
+
+    sessions = Booking.objects.filter(
+        status='confirmed', start_time__gte=start, start_time__lt=end
+    ).values_list('start_time', 'pc_id', 'user__profile__college_id')
+    for start_time, pc_id, college_id in sessions.iterator():
+        counters[(local_bucket(start_time)[1], college_id, pc_id)]['sessions_started'] += 1
+
+    violations = Violation.objects.filter(timestamp__gte=start, timestamp__lt=end).values_list(
+        'timestamp', 'pc_id', 'user__profile__college_id', 'level'
+    )
+    for timestamp, pc_id, college_id, level in violations.iterator():
+        if level in ('minor', 'moderate', 'major'):
+            counters[(local_bucket(timestamp)[1], college_id, pc_id)][f'{level}_violations'] += 1
+
+    events = PeripheralEvent.objects.filter(created_at__gte=start, created_at__lt=end).values_list(
+        'created_at', 'pc_id', 'action'
+    )
+    for created_at, pc_id, action in events.iterator():
+        row = counters[(local_bucket(created_at)[1], None, pc_id)]
+        row['peripheral_events'] += 1
+        if action == 'attached':
+            row['peripheral_attachments'] += 1
+        elif action == 'removed':
+            row['peripheral_removals'] += 1
+
+    with transaction.atomic():
+        UsageRollup.objects.filter(date=day).delete()
+        UsageRollup.objects.bulk_create([
+            UsageRollup(date=day, hour=hour, college_id=college_id, pc_id=pc_id, **counts)
+            for (hour, college_id, pc_id), counts in counters.items()
+        ], batch_size=1000)
+    return len(counters)
+
+
+def touched_days(since):
+    """Local dates holding a booking, violation or peripheral event changed after ``since``."""
+    days = set()
+    changed = Booking.objects.filter(updated_at__gt=since).values_list('created_at', 'start_time')
+    for created_at, start_time in changed.iterator():
+        days.add(local_bucket(created_at)[0])
+        if start_time:
+            days.add(local_bucket(start_time)[0])
+    for stamp in Violation.objects.filter(timestamp__gt=since).values_list('timestamp', flat=True).iterator():
+        days.add(local_bucket(stamp)[0])
+    for stamp in PeripheralEvent.objects.filter(created_at__gt=since).values_list('created_at', flat=True).iterator():
+        days.add(local_bucket(stamp)[0])
+    return days
+
+
+def history_start():
+    """Local date of the oldest booking, violation or peripheral event, or None."""
+    stamps = [
+        Booking.objects.aggregate(first=Min('created_at'))['first'],
+        Booking.objects.aggregate(first=Min('start_time'))['first'],
+        Violation.objects.aggregate(first=Min('timestamp'))['first'],
+        PeripheralEvent.objects.aggregate(first=Min('created_at'))['first'],
+    ]
+    stamps = [stamp for stamp in stamps if stamp]
+    return local_bucket(min(stamps))[0] if stamps else None
+
+
+def refresh(backfill_from=None, now=None):
+    """
+    Bring the rollups up to date.
+
+    Rebuilds the days touched since the high-water mark, or every day from
+    ``backfill_from`` (a date) to today. The first run, with no mark yet,
+    backfills the whole history.
+
+    Returns:
+        dict: ``days`` rebuilt, ``rows`` written and the new ``mark``
+    """
+    if now is None:
+        now = timezone.now()
+    mark = RollupMark.objects.filter(name=MARK_NAME).values_list('value', flat=True).first()
+    if mark is None and backfill_from is None:
+        backfill_from = history_start()
+
+    if backfill_from is not None:
+        today = local_bucket(now)[0]
+        days = {backfill_from + timedelta(days=i) for i in range((today - backfill_from).days + 1)}
+    elif mark is not None:
+        days = touched_days(mark - MARK_OVERLAP)
+    else:
+        days = set()
+
+    rows = sum(rebuild_day(day) for day in sorted(days))
+    RollupMark.objects.update_or_create(name=MARK_NAME, defaults={'value': now})
+    cache.set(FRESH_KEY, True, MAX_AGE.total_seconds())
+    if backfill_from is not None or len(days) >= LARGE_CHANGE_DAYS:
+        from . import report_cache
+        report_cache.invalidate()
+    return {'days': len(days), 'rows': rows, 'mark': now}
+
+
+def ensure_fresh():
+    """
+    Run an incremental refresh if the last one is older than MAX_AGE (one caller at a time).
+
+    Without a mark yet, starts the first backfill in the background instead
+    (start_backfill) and returns at once.
+    """
+    if cache.get(FRESH_KEY):
+        return False
+    mark = RollupMark.objects.filter(name=MARK_NAME).values_list('value', flat=True).first()
+    if mark is None:
+        start_backfill()
+        return False
+    if timezone.now() - mark < MAX_AGE:
+        cache.set(FRESH_KEY, True, (MAX_AGE - (timezone.now() - mark)).total_seconds())
+        return False
+    if not cache.add(REFRESH_LOCK_KEY, True, timeout=REFRESH_LOCK_SECONDS):
+        # Another request is refreshing; read what is there
+        return False
+    try:
+        refresh()
+    except Exception as e:
+        print(f"❌ Analytics rollup refresh failed: {e}")
+        return False
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+    return True
+
+
+def start_backfill():
+    """
+    Run the first, whole-history refresh in a daemon thread unless a refresh is running.
+
+    Returns:
+        Thread or None: the started thread
+    """
+    if not cache.add(REFRESH_LOCK_KEY, True, timeout=BACKFILL_LOCK_SECONDS):
+        return None
+
+    def backfill():
+        close_old_connections()
+        try:
+            result = refresh()
+            print(f"✅ Analytics rollup backfill: {result['days']} day(s), {result['rows']} row(s)")
+        except Exception as e:
+            print(f"❌ Analytics rollup backfill failed: {e}")
+        finally:
+            cache.delete(REFRESH_LOCK_KEY)
+            close_old_connections()
+
+    thread = threading.Thread(target=backfill, name='rollup-backfill', daemon=True)
+    thread.start()
+    return thread
+
+
+def window(start, end):
+    """Q selecting the rollup hours that overlap ``start`` .. ``end``."""
+    start_day, start_hour = local_bucket(start)
+    end_day, end_hour = local_bucket(end)
+    return (
+        (Q(date__gt=start_day) | Q(date=start_day, hour__gte=start_hour))
+        & (Q(date__lt=end_day) | Q(date=end_day, hour__lte=end_hour))
+    )
+
+
+def rows(start=None, end=None):
+    """Fresh UsageRollup rows, limited to the hours overlapping ``start`` .. ``end`` when given."""
+    ensure_fresh()
+    queryset = UsageRollup.objects.all()
+    if start is not None:
+        queryset = queryset.filter(window(start, end or timezone.now()))
+    return queryset
@@ -0,0 +1,265 @@
+"""
+Deadline scheduler for session warnings, session expiry and suspension release.
+
+Keeps a heap of upcoming deadlines instead of scanning tables every minute:
+
+- ``warning``: a confirmed booking's end_time minus WARNING_WINDOW, sends the
+  "session ends in 5 minutes" popup to the PC
+- ``expire``: a confirmed booking's end_time, runs the expiry sweep
+- ``release``: a moderate violation's suspension_end_date, lifts the suspension
+
+One daemon thread sleeps until the earliest deadline and fires it. The heap
+is rebuilt from the database when the scheduler starts, and booking /
+violation changes reschedule their entries (schedule_booking,
+schedule_violation). Each handler re-reads its row before acting, so an entry
+that went stale (session ended early, suspension lifted by staff) fires as a
+no-op.
+
+It runs inside the ASGI process (started from PCheckMain.asgi, see
+RUN_DEADLINE_SCHEDULER), where broadcast.group_send hands its messages to
+the server's event loop, which owns the in-memory channel layer.
+``manage.py run_scheduler`` runs it as a separate daemon instead, which needs
+a shared channel layer.
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+from .broadcast import group_send
+from .models import Booking, Violation
+
+WARNING_WINDOW = timedelta(minutes=5)
+
+# Longest sleep between wake-ups, so a changed system clock is noticed.
+MAX_SLEEP_SECONDS = 60
+
+
+class DeadlineScheduler:
+    """Heap of (when, seq, kind, object id) entries fired by one daemon thread."""
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # (kind, object id) -> live heap entry
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.handlers = {
+            'warning': send_session_warning,
+            'expire': expire_session,
+            'release': release_violation,
+        }
+
+    def schedule(self, kind, object_id, when):
+        """Schedule (or move) the ``kind`` deadline of one object; ``when`` None cancels it."""
+        with self._condition:
+            old = self._entries.pop((kind, object_id), None)
+            if old is not None:
+                old[-1] = False  # Lazily dropped when it reaches the top of the heap
+            if when is None:
+                return
+            entry = [when, next(self._seq), kind, object_id, True]
+            self._entries[(kind, object_id)] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def rebuild(self, now=None, late_warnings=True):
+        """
+        Reload every upcoming deadline from the database.
+
+        ``late_warnings`` also sends the warning for sessions already inside
+        their last WARNING_WINDOW (right after a restart); a periodic reload
+        passes False so those sessions are not warned twice.
+        """
+        if now is None:
+            now = timezone.now()
+        with self._condition:
+            self._heap = []
+            self._entries = {}
+
+        bookings = Booking.objects.filter(
+            status='confirmed', expiry__isnull=True, end_time__isnull=False
+        ).values_list('id', 'end_time')
+        for booking_id, end_time in bookings:
+            self._schedule_booking(booking_id, end_time, now, late_warnings)
+
+        violations = Violation.objects.filter(
+            level='moderate', status='suspended', resolved=False, suspension_end_date__isnull=False
+        ).values_list('id', 'suspension_end_date')
+        for violation_id, suspension_end_date in violations:
+            self.schedule('release', violation_id, suspension_end_date)
+
+        with self._condition:
+            self._condition.notify()
+        return len(self._entries)
+
+    def _schedule_booking(self, booking_id, end_time, now, late_warning=True):
+        warn_at = end_time - WARNING_WINDOW if end_time else None
+        # A warning whose time already passed is only worth sending while the
+        # session is still running (e.g. approved for less than 5 minutes)
+        if warn_at and (warn_at <= now) and not (late_warning and end_time > now):
+            warn_at = None
+        self.schedule('warning', booking_id, warn_at)
+        self.schedule('expire', booking_id, end_time)
+
+    def start(self):
+        """Rebuild from the database and start the daemon thread (once)."""
+        if self._thread is not None:
+            return
+        try:
+            count = self.rebuild()
+        except Exception as e:
+            # Keep serving; deadlines scheduled from now on still fire
+            print(f"❌ Could not load scheduler deadlines: {e}")
+            count = 0
+        self._thread = threading.Thread(target=self.run, name='deadline-scheduler', daemon=True)
+        self._thread.start()
+        print(f"⏰ Deadline scheduler started with {count} deadline(s)")
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            kind, object_id = due
+            close_old_connections()
+            try:
+                self.handlers[kind](object_id)
+            except Exception as e:
+                print(f"❌ Scheduler {kind} for {object_id} failed: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                close_old_connections()
+
+    def _next_due(self):
+        """Block until a deadline is due and return (kind, object id), or None when stopping."""
+        with self._condition:
+            while not self._stopping:
+                while self._heap and not self._heap[0][-1]:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    wait = (self._heap[0][0] - timezone.now()).total_seconds()
+                    if wait <= 0:
+                        when, _, kind, object_id, _ = heapq.heappop(self._heap)
+                        self._entries.pop((kind, object_id), None)
+                        return kind, object_id
+                else:
+                    wait = MAX_SLEEP_SECONDS
+                self._condition.wait(min(wait, MAX_SLEEP_SECONDS))
+        return None
+
+
+_scheduler = None
+
+
+def start():
+    """Start the process-wide scheduler; later calls are no-ops."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = DeadlineScheduler()
+    _scheduler.start()
+    return _scheduler
+
+
+def schedule_booking(booking):
+    """
+    Reschedule a booking's warning and expiry after it changed.
+
+    Call after approving, extending or ending a session. Does nothing when
+    the scheduler is not running in this process.
+    """
+    if _scheduler is None:
+        return
+    running = booking.status == 'confirmed' and booking.expiry is None and booking.end_time
+    _scheduler._schedule_booking(booking.id, booking.end_time if running else None, timezone.now())
+
+
+def schedule_violation(violation):
+    """Reschedule a violation's automatic release after it was created or changed."""
+    if _scheduler is None:
+        return
+    releasable = (
+        violation.level == 'moderate' and violation.status == 'suspended'
+        and not violation.resolved and violation.suspension_end_date
+    )
+    _scheduler.schedule('release', violation.id, violation.suspension_end_date if releasable else None)
+
+
+def send_session_warning(booking_id, now=None):
+    """Send the "session ends soon" popup to the booking's PC. Returns True if sent."""
+    if now is None:
+        now = timezone.now()
+    booking = Booking.objects.select_related('pc').filter(
+        pk=booking_id, status='confirmed', expiry__isnull=True, end_time__gt=now
+    ).first()
+    if not booking or not booking.pc or not booking.pc.name:
+        return False
+
+    minutes_left = max(1, int((booking.end_time - now).total_seconds() / 60))
+    sent = group_send(
+        f'pc_notifications_{booking.pc.name}',
+        {
+            'type': 'session_warning',
+            'message': f'Your session will end in {minutes_left} minutes. Please save your work!',
+            'minutes_left': minutes_left,
+            'end_time': booking.end_time.isoformat(),
+            'booking_id': booking.id,
+            'pc_name': booking.pc.name,
+            'show_popup': True,
+        }
+    )
+    if not sent:
+        return False
+    print(f"⚠️ Warning sent to PC: {booking.pc.name} (Booking ID: {booking.id}, {minutes_left} min left)")
+    return True
+
+
+def expire_session(booking_id):
+    """A session reached its end_time: run the expiry sweep, which frees its PC."""
+    from . import booking_state
+    booking_state.expire_ended_bookings(force=True)
+
+
+def release_violation(violation_id, now=None):
+    """Lift a moderate suspension whose end date passed. Returns True if released."""
+    if now is None:
+        now = timezone.now()
+    released = Violation.objects.filter(
+        pk=violation_id,
+        level='moderate',
+        status='suspended',
+        resolved=False,
+        suspension_end_date__lte=now,
+    ).update(status='active', resolved=True)
+    if not released:
+        return False
+
+    violation = Violation.objects.select_related('user').get(pk=violation_id)
+    try:
+        group_send(
+            f'booking_updates_{violation.user.id}',
+            {
+                'type': 'violation_notification',
+                'violation_id': violation.id,
+                'level': violation.level,
+                'reason': violation.reason,
+                'message': "✅ Your suspension has been automatically lifted. Your account is now active again.",
+                'status': 'active',
+                'suspension_end_date': None,
+            }
+        )
+    except Exception as e:
+        print(f"⚠️ Error sending notification for violation {violation.id}: {e}")
+    print(f"✅ Released violation {violation.id} for user {violation.user.username}")
+    return True
@@ -1,3 +1,1366 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account.models import Profile
+from . import (
+    analytics, analytics_engine, booking_state, broadcast, exports, forecasting, lab_state, models, pc_status, routing, occupancy, report_cache, report_jobs, rollups,
+    utilization,
+)
+from .models import ReportJob
+
+
+class GroupSendTests(SimpleTestCase):
+    """Background threads reach sockets through the server's event loop."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.loop.call_soon_threadsafe, self.loop.stop)
+        previous = broadcast._server_loop
+        broadcast.capture_server_loop(self.loop)
+        self.addCleanup(setattr, broadcast, '_server_loop', previous)
+
+    def on_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def subscribe(self, group):
+        layer = get_channel_layer()
+
+        async def add():
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            return channel
+
+        channel = self.on_loop(add())
+        return lambda: self.on_loop(asyncio.wait_for(layer.receive(channel), 1))
+
+    def send_from_thread(self, target, *args):
+        sender = threading.Thread(target=target, args=args)
+        sender.start()
+        sender.join()
+
+    def test_send_from_thread_is_received_on_server_loop(self):
+        receive = self.subscribe('test_group')
+        self.send_from_thread(broadcast.group_send, 'test_group', {'type': 'ping'})
+        self.assertEqual(receive()['type'], 'ping')
+
+    def test_report_job_progress_reaches_staff_alerts(self):
+        receive = self.subscribe('alerts_staff')
+        job = ReportJob(pk=7, kind='bookings', file_format='csv', params={}, status='running', progress=40)
+        self.send_from_thread(report_jobs.notify, job)
+
+        message = receive()
+        self.assertEqual(message['type'], 'alert_message')
+        self.assertEqual(message['payload']['report_job']['progress'], 40)
+
+
+class BroadcastBatchTests(TestCase):
+    """PC changes of one transaction go out as one batch, once it commits."""
+
+    def setUp(self):
+        self.pcs = models.PC.objects.bulk_create([
+            models.PC(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in range(3)
+        ])
+
+    def test_changes_of_a_transaction_share_one_batch(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                broadcast.queue_pc_change(self.pcs[0], 'first')
+                broadcast.queue_pc_change(self.pcs[1])
+                broadcast.queue_pc_change(self.pcs[0], 'again')
+
+        self.assertEqual(len(callbacks), 1)
+        batch = callbacks[0].__self__
+        self.assertEqual(list(batch.changes), [self.pcs[0].pk, self.pcs[1].pk])
+        self.assertEqual(batch.changes[self.pcs[0].pk]['message'], 'again')
+
+    def test_rolled_back_changes_are_not_sent(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    broadcast.queue_pc_change(self.pcs[0])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                broadcast.queue_pc_change(self.pcs[1])
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(list(callbacks[0].__self__.changes), [self.pcs[1].pk])
+
+    def test_next_transaction_starts_a_new_batch(self):
+        with self.captureOnCommitCallbacks(execute=True) as first:
+            broadcast.queue_pc_change(self.pcs[0])
+        with self.captureOnCommitCallbacks() as second:
+            broadcast.queue_pc_change(self.pcs[2])
+
+        self.assertEqual(list(second[0].__self__.changes), [self.pcs[2].pk])
+        self.assertIsNot(first[0].__self__, second[0].__self__)
+
+
+class RunSchedulerCommandTests(SimpleTestCase):
+    """The standalone scheduler refuses settings that keep its effects in its own process."""
+
+    def test_refuses_in_memory_channel_layer(self):
+        with self.assertRaisesMessage(CommandError, 'channel layer'):
+            call_command('run_scheduler')
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.BaseChannelLayer'}})
+    def test_refuses_process_local_cache(self):
+        with self.assertRaisesMessage(CommandError, 'CACHES'):
+            call_command('run_scheduler')
+
+
+class ReportJobFileTests(TestCase):
+    """Built report files are private: only the staff download view serves them."""
+
+    def setUp(self):
+        self.reports_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.reports_root, ignore_errors=True)
+        override = override_settings(REPORTS_ROOT=self.reports_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.staff = User.objects.create_superuser('staff', 'staff@example.com', 'pw')
+        self.student = User.objects.create_user('student', 'student@example.com', 'pw')
+        self.student.profile.role = 'student'
+        self.student.profile.save()
+
+    def build(self):
+        job, _ = report_jobs.submit('bookings', 'csv', {'period': 'daily'}, user=self.staff)
+        job = report_jobs.claim_next()
+        report_jobs.run(job)
+        job.refresh_from_db()
+        return job
+
+    def test_file_is_written_outside_media_root_with_random_name(self):
+        job = self.build()
+        path = report_jobs.file_path(job)
+
+        self.assertEqual(job.status, 'done')
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.path.dirname(path), self.reports_root)
+        self.assertFalse(os.path.abspath(path).startswith(os.path.abspath(settings.MEDIA_ROOT)))
+        self.assertNotIn(job.kind, job.file_name)
+        self.assertNotIn(job.params_hash[:12], job.file_name)
+
+    def test_download_needs_staff(self):
+        job = self.build()
+        url = f'/report-jobs/{job.pk}/download/'
+
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(f'/media/reports/{job.file_name}').status_code, 404)
+        self.assertEqual(self.client.get(f'/media/{job.file_name}').status_code, 404)
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'Date,Time,User'))
+
+
+class ReportWorkerTests(TransactionTestCase):
+    """The report worker outlives a job it cannot record, and only requeues jobs gone silent."""
+
+    def submit(self):
+        job, _ = report_jobs.submit('bookings', 'csv', {'period': 'daily'})
+        return job
+
+    def test_requeue_uses_heartbeat_not_run_time(self):
+        now = timezone.now()
+        alive = self.submit()
+        ReportJob.objects.filter(pk=alive.pk).update(
+            status='running', started_at=now - timedelta(hours=2), heartbeat_at=now - timedelta(minutes=1)
+        )
+        dead = report_jobs.submit('bookings', 'xlsx', {'period': 'daily'})[0]
+        ReportJob.objects.filter(pk=dead.pk).update(
+            status='running', started_at=now - timedelta(minutes=30),
+            heartbeat_at=now - timedelta(minutes=report_jobs.STALE_JOB_MINUTES + 1),
+        )
+
+        self.assertEqual(report_jobs.requeue_stale(now=now), 1)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((alive.status, dead.status), ('running', 'queued'))
+
+    def test_heartbeat_continues_while_builder_blocks(self):
+        self.submit()
+        job = report_jobs.claim_next()
+        claimed_heartbeat = job.heartbeat_at
+        seen = []
+
+        def slow_builder(job, progress):
+            # Like build_analytics waiting on get_report(): no progress calls
+            time.sleep(0.5)
+            seen.append(ReportJob.objects.get(pk=job.pk).heartbeat_at)
+            raise ValueError('stop here')
+
+        with mock.patch.object(report_jobs, 'HEARTBEAT_SECONDS', 0.05), \
+                mock.patch.dict(report_jobs.BUILDERS, {'bookings': slow_builder}):
+            report_jobs.run(job)
+
+        self.assertGreater(seen[0], claimed_heartbeat)
+        self.assertFalse(any(thread.name.startswith('report-heartbeat-') for thread in threading.enumerate()))
+
+    def test_worker_marks_job_failed_and_keeps_running(self):
+        job = self.submit()
+        stop = threading.Event()
+
+        def run(claimed):
+            stop.set()
+            raise DatabaseError('connection lost')
+
+        with mock.patch.object(report_jobs, 'run', side_effect=run):
+            report_jobs.work(stop=stop, poll_seconds=0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'connection lost')
+
+
+class ReservationTests(TestCase):
+    """A reservation takes the PC and the student's live slot; a second one for either fails."""
+
+    def setUp(self):
+        self.students = [User.objects.create_user(f'student{i}', f'student{i}@example.com', 'pw') for i in range(2)]
+        self.pcs = [
+            models.PC.objects.create(
+                name=f'PC-{i}', ip_address='127.0.0.1', status='connected',
+                system_condition='active', booking_status='available',
+            )
+            for i in range(2)
+        ]
+
+    def test_second_reservation_for_the_same_pc_fails(self):
+        booking_state.reserve(self.students[0], self.pcs[0], timedelta(minutes=30))
+
+        with self.assertRaises(booking_state.SlotTaken) as raised:
+            booking_state.reserve(self.students[1], self.pcs[0], timedelta(minutes=30))
+        self.assertEqual(raised.exception.slot, 'pc')
+        self.assertEqual(models.Booking.objects.filter(pc=self.pcs[0]).count(), 1)
+        self.pcs[0].refresh_from_db()
+        self.assertEqual(self.pcs[0].booking_status, 'in_queue')
+
+    def test_second_reservation_by_the_same_student_fails(self):
+        booking_state.reserve(self.students[0], self.pcs[0], timedelta(minutes=30))
+
+        with self.assertRaises(booking_state.SlotTaken) as raised:
+            booking_state.reserve(self.students[0], self.pcs[1], timedelta(minutes=30))
+        self.assertEqual(raised.exception.slot, 'user')
+        self.pcs[1].refresh_from_db()
+        self.assertEqual(self.pcs[1].booking_status, 'available')
+
+    def test_transitions_move_the_pc(self):
+        booking = booking_state.reserve(self.students[0], self.pcs[0], timedelta(minutes=30))
+        booking_state.approve(booking)
+        self.pcs[0].refresh_from_db()
+        self.assertEqual(self.pcs[0].booking_status, 'in_use')
+
+        booking_state.end_session(booking)
+        self.pcs[0].refresh_from_db()
+        self.assertEqual(self.pcs[0].booking_status, 'available')
+
+        declined = booking_state.reserve(self.students[1], self.pcs[1], timedelta(minutes=30))
+        booking_state.decline(declined)
+        self.pcs[1].refresh_from_db()
+        self.assertEqual(self.pcs[1].booking_status, 'available')
+
+    def test_unreachable_transitions_are_refused(self):
+        booking = booking_state.reserve(self.students[0], self.pcs[0], timedelta(minutes=30))
+        booking_state.decline(booking)
+        with self.assertRaises(booking_state.InvalidTransition):
+            booking_state.approve(booking)
+        with self.assertRaises(booking_state.InvalidTransition):
+            booking_state.decline(booking)
+
+    def test_status_reads_never_write(self):
+        booking = booking_state.reserve(self.students[0], self.pcs[0], timedelta(minutes=30))
+        # Drifted row: only a transition (or the expiry sweep) may repair it
+        models.PC.objects.filter(pk=self.pcs[0].pk).update(booking_status='available')
+        self.students[1].profile.role = 'student'
+        self.students[1].profile.save()
+        self.client.force_login(self.students[1])
+
+        with CaptureQueriesContext(connection) as queries:
+            for url in ('/ajax/get-all-pc-status/', f'/ajax/get-pc-booking/{self.pcs[0].pk}/', '/pc-reservation/'):
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+        writes = [
+            query['sql'] for query in queries
+            if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+        self.pcs[0].refresh_from_db()
+        self.assertEqual((self.pcs[0].booking_status, self.pcs[0].current_booking_id), ('available', booking.pk))
+
+    def test_reserve_page_queries_do_not_grow_with_the_lab(self):
+        self.students[0].profile.role = 'student'
+        self.students[0].profile.save()
+        self.client.force_login(self.students[0])
+        counts = []
+        for size in (5, 40):
+            existing = models.PC.objects.count()
+            pcs = models.PC.objects.bulk_create([
+                models.PC(
+                    name=f'PC-{i}', ip_address='127.0.0.1', status='connected',
+                    system_condition='active', sort_number=i,
+                )
+                for i in range(existing, size)
+            ])
+            users = User.objects.bulk_create([User(username=f'queued-{pc.name}') for pc in pcs])
+            models.Booking.objects.bulk_create([
+                models.Booking(user=user, pc=pc, start_time=timezone.now(), duration=timedelta(minutes=30))
+                for user, pc in zip(users, pcs)
+            ])
+            pc_status.reconcile_pc_statuses()
+            occupancy.invalidate()
+            # Warm the occupancy counters, then count a steady-state request
+            self.client.get('/pc-reservation/')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/pc-reservation/')
+            self.assertEqual(len(response.context['available_pcs']), min(size, 12))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_expiry_sweep_is_set_based_and_rate_limited(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        counts = []
+        for size in (3, 30):
+            models.Booking.objects.all().delete()
+            existing = models.PC.objects.count()
+            models.PC.objects.bulk_create([
+                models.PC(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+                for i in range(existing, size)
+            ])
+            pcs = list(models.PC.objects.order_by('pk'))
+            users = User.objects.bulk_create([User(username=f'ended-{size}-{pc.pk}') for pc in pcs])
+            ended = timezone.now() - timedelta(minutes=5)
+            models.Booking.objects.bulk_create([
+                models.Booking(
+                    user=user, pc=pc, status='confirmed', start_time=ended - timedelta(minutes=30),
+                    end_time=ended, duration=timedelta(minutes=30),
+                )
+                for user, pc in zip(users, pcs)
+            ])
+            models.PC.objects.update(booking_status='in_use')
+
+            with CaptureQueriesContext(connection) as queries:
+                result = booking_state.expire_ended_bookings(force=True)
+            self.assertEqual((result['expired'], result['released']), (size, size))
+            self.assertFalse(models.PC.objects.exclude(booking_status='available').exists())
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        # Inside SWEEP_INTERVAL other callers get the last result without touching the database
+        with self.assertNumQueries(0):
+            again = booking_state.expire_ended_bookings()
+        self.assertFalse(again['ran'])
+        self.assertEqual(again['expired'], 30)
+
+    def test_current_booking_follows_transitions(self):
+        def current(pc):
+            return models.PC.objects.values_list('current_booking', flat=True).get(pk=pc.pk)
+
+        booking = booking_state.reserve(self.students[0], self.pcs[0], timedelta(minutes=30))
+        self.assertEqual(current(self.pcs[0]), booking.pk)
+        booking_state.approve(booking)
+        self.assertEqual(current(self.pcs[0]), booking.pk)
+        booking_state.end_session(booking)
+        self.assertIsNone(current(self.pcs[0]))
+
+        running = booking_state.approve(booking_state.reserve(self.students[1], self.pcs[1], timedelta(minutes=30)))
+        booking_state.expire_ended_bookings(now=running.end_time + timedelta(minutes=1), force=True)
+        self.assertIsNone(current(self.pcs[1]))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReservationTests(TransactionTestCase):
+    """
+    Reservations released at once never leave a PC or a student with two
+    live bookings. Needs row locks (MySQL, PostgreSQL); SQLite locks the
+    whole database instead.
+    """
+
+    STUDENTS = 40
+    PCS = 10
+
+    def setUp(self):
+        User.objects.bulk_create([User(username=f'student-{i}') for i in range(self.STUDENTS)])
+        models.PC.objects.bulk_create([
+            models.PC(
+                name=f'PC-{i}', ip_address='127.0.0.1', status='connected',
+                system_condition='active', booking_status='available',
+            )
+            for i in range(self.PCS)
+        ])
+        self.users = list(User.objects.order_by('id'))
+        self.pcs = list(models.PC.objects.order_by('id'))
+
+    def reserve_all(self):
+        start = threading.Barrier(len(self.users))
+
+        def reserve(i):
+            try:
+                start.wait(timeout=10)
+                booking_state.reserve(self.users[i], self.pcs[i % len(self.pcs)], timedelta(minutes=30))
+                return 'reserved'
+            except booking_state.SlotTaken:
+                return 'slot taken'
+            except Exception as e:
+                return f'error: {type(e).__name__}: {e}'
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=len(self.users)) as pool:
+            return list(pool.map(reserve, range(len(self.users))))
+
+    def test_no_double_assignments(self):
+        outcomes = self.reserve_all()
+
+        self.assertEqual([outcome for outcome in outcomes if outcome.startswith('error')], [])
+        self.assertEqual(outcomes.count('reserved'), len(self.pcs))
+
+        live = models.Booking.objects.filter(models.LIVE_BOOKING)
+        self.assertFalse(live.values('pc').annotate(n=Count('id')).filter(n__gt=1).exists())
+        self.assertFalse(live.values('user').annotate(n=Count('id')).filter(n__gt=1).exists())
+        self.assertEqual(
+            set(models.PC.objects.values_list('booking_status', flat=True)), {'in_queue'}
+        )
+
+
+class LiveSlotConstraintTests(TestCase):
+    """The database keeps one live booking per PC and per student, on every backend."""
+
+    def setUp(self):
+        self.students = [User.objects.create_user(f'student{i}', f'student{i}@example.com', 'pw') for i in range(2)]
+        self.pcs = [
+            models.PC.objects.create(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in range(2)
+        ]
+        self.now = timezone.now()
+
+    def book(self, user, pc, **fields):
+        fields.setdefault('start_time', self.now)
+        fields.setdefault('duration', timedelta(minutes=30))
+        with transaction.atomic():
+            return models.Booking.objects.create(user=user, pc=pc, **fields)
+
+    def test_second_live_booking_for_a_pc_is_rejected(self):
+        self.book(self.students[0], self.pcs[0])
+        with self.assertRaisesMessage(IntegrityError, 'live_pc_slot'):
+            self.book(self.students[1], self.pcs[0], status='confirmed')
+
+    def test_second_live_booking_for_a_student_is_rejected(self):
+        self.book(self.students[0], self.pcs[0], status='confirmed')
+        with self.assertRaisesMessage(IntegrityError, 'live_user_slot'):
+            self.book(self.students[0], self.pcs[1])
+
+    def test_ended_and_declined_bookings_free_the_slot(self):
+        self.book(self.students[0], self.pcs[0], status='confirmed', expiry=self.now)
+        self.book(self.students[1], self.pcs[0], status='cancelled')
+        self.book(self.students[0], self.pcs[0])
+        self.assertEqual(models.Booking.objects.filter(models.LIVE_BOOKING).count(), 1)
+
+
+def full_scan(queryset, table):
+    """Return the plan text if ``queryset`` scans all of ``table``, else None (MySQL, PostgreSQL, SQLite)."""
+    vendor = connection.vendor
+    if vendor == 'mysql':
+        plan = queryset.explain(format='json')
+        if any(node.get('table_name') == table and node.get('access_type') == 'ALL'
+               for node in _json_nodes(json.loads(plan))):
+            return plan
+        return None
+
+    plan = queryset.explain()
+    for line in plan.splitlines():
+        if vendor == 'sqlite':
+            # "SCAN main_app_booking" reads the table; "SCAN ... USING INDEX" does not
+            if f'SCAN {table}' in line and 'INDEX' not in line:
+                return plan
+        elif vendor == 'postgresql':
+            if f'Seq Scan on {table}' in line:
+                return plan
+    return None
+
+
+def _json_nodes(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _json_nodes(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _json_nodes(value)
+
+
+class QueryPlanTests(TestCase):
+    """The hot booking / chat / violation / peripheral queries never fall back to a full table scan."""
+
+    ROWS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # bulk_create does not return primary keys on MySQL, so re-read the rows
+        User.objects.bulk_create([User(username=f'user-{i}') for i in range(cls.ROWS // 50)])
+        users = list(User.objects.order_by('id'))
+        models.PC.objects.bulk_create([
+            models.PC(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in range(50)
+        ])
+        pcs = list(models.PC.objects.order_by('id'))
+        room = models.ChatRoom.objects.create(initiator=users[0], receiver=users[-1])
+        models.ChatRoom.objects.bulk_create(
+            [models.ChatRoom(initiator=users[i % len(users)]) for i in range(cls.ROWS // 20)]
+        )
+        rooms = list(models.ChatRoom.objects.order_by('id'))
+        statuses = [None, 'confirmed', 'cancelled', 'confirmed']
+        # The live slot constraints allow one pending / running booking per
+        # user and per PC: the first rows pair distinct users and PCs and stay
+        # live, every other booking is expired.
+        live_rows = min(len(users), len(pcs))
+
+        models.Booking.objects.bulk_create([
+            models.Booking(
+                user=users[i % len(users)],
+                pc=pcs[i % len(pcs)],
+                status=statuses[i % len(statuses)],
+                start_time=now - timedelta(hours=i % 500),
+                end_time=now - timedelta(hours=i % 500) + timedelta(hours=1),
+                expiry=None if i < live_rows else now - timedelta(hours=i % 500),
+            )
+            for i in range(cls.ROWS)
+        ], batch_size=1000)
+        models.Violation.objects.bulk_create([
+            models.Violation(user=users[i % len(users)], level='minor', reason='plan check', resolved=i % 3 != 0)
+            for i in range(cls.ROWS)
+        ], batch_size=1000)
+        models.Chat.objects.bulk_create([
+            models.Chat(
+                chatroom=rooms[i % len(rooms)],
+                sender=users[i % len(users)],
+                recipient=users[(i + 1) % len(users)],
+                message='plan check',
+                status=['sent', 'delivered', 'read'][i % 3],
+            )
+            for i in range(cls.ROWS)
+        ], batch_size=1000)
+        models.PeripheralEvent.objects.bulk_create([
+            models.PeripheralEvent(pc=pcs[i % len(pcs)], action='attached')
+            for i in range(cls.ROWS)
+        ], batch_size=1000)
+        models.FacultyBooking.objects.bulk_create([
+            models.FacultyBooking(faculty=users[i % len(users)])
+            for i in range(cls.ROWS)
+        ], batch_size=1000)
+
+        # MySQL's ANALYZE TABLE would commit the test transaction; InnoDB
+        # refreshes its statistics on its own after a bulk insert.
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        cls.user_id, cls.pc_id, cls.chatroom_id = users[0].pk, pcs[0].pk, room.pk
+
+    def hot_queries(self, now):
+        """(label, table, queryset) for every query the composite indexes are meant to serve."""
+        user_id, pc_id, chatroom_id = self.user_id, self.pc_id, self.chatroom_id
+        return [
+            ('Booking by PC, status and end time', models.Booking._meta.db_table,
+             models.Booking.objects.filter(pc_id=pc_id, status='confirmed', end_time__gt=now)),
+            ("User's bookings, newest first", models.Booking._meta.db_table,
+             models.Booking.objects.filter(user_id=user_id, status='confirmed').order_by('-created_at')),
+            ('Bookings by status over a period', models.Booking._meta.db_table,
+             models.Booking.objects.filter(status='confirmed', created_at__gte=now - timedelta(days=7))),
+            ('Expiry sweep', models.Booking._meta.db_table,
+             models.Booking.objects.filter(expiry__isnull=True, end_time__lt=now)),
+            ("User's unresolved violations", models.Violation._meta.db_table,
+             models.Violation.objects.filter(user_id=user_id, resolved=False).order_by('-timestamp')),
+            ('Chat room history', models.Chat._meta.db_table,
+             models.Chat.objects.filter(chatroom_id=chatroom_id).order_by('timestamp')),
+            ('Unread chats for a recipient', models.Chat._meta.db_table,
+             models.Chat.objects.filter(recipient_id=user_id, status='sent')),
+            ('Peripheral events for a PC', models.PeripheralEvent._meta.db_table,
+             models.PeripheralEvent.objects.filter(pc_id=pc_id).order_by('-created_at')),
+            ("Faculty's block bookings", models.FacultyBooking._meta.db_table,
+             models.FacultyBooking.objects.filter(faculty_id=user_id).order_by('-created_at')),
+        ]
+
+    def test_hot_queries_use_an_index(self):
+        for label, table, queryset in self.hot_queries(timezone.now()):
+            with self.subTest(label):
+                self.assertIsNone(full_scan(queryset, table), f'{label}: full scan of {table}')
+
+
+class AnalyticsEngineTests(TestCase):
+    """The vectorized engine and the SQL bucketing agree with plain Python over the same bookings."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        models.College.objects.bulk_create([models.College(name=f'College {i}') for i in range(3)])
+        colleges = list(models.College.objects.order_by('id'))
+        User.objects.bulk_create([User(username=f'student-{i}') for i in range(12)])
+        users = list(User.objects.order_by('id'))
+        # Every fourth student has no college
+        Profile.objects.bulk_create([
+            Profile(user=user, role='student', college=colleges[i % 3] if i % 4 else None)
+            for i, user in enumerate(users)
+        ])
+        pc = models.PC.objects.create(name='PC-1', ip_address='127.0.0.1', status='connected', system_condition='active')
+
+        statuses = [None, 'confirmed', 'cancelled', 'confirmed']
+        lengths = [5, 30, 45, 60, 61, 90, 120, 150, 180, 240]
+        models.Booking.objects.bulk_create([
+            models.Booking(
+                user=users[i % len(users)],
+                pc=pc,
+                status=statuses[i % len(statuses)],
+                start_time=now - timedelta(hours=i),
+                end_time=now - timedelta(hours=i) + timedelta(minutes=30),
+                duration=timedelta(minutes=lengths[i % len(lengths)]) if i % 7 else None,
+                expiry=now - timedelta(hours=i),
+            )
+            for i in range(120)
+        ])
+        cls.bookings = list(models.Booking.objects.select_related('user__profile__college'))
+
+    def test_booking_statistics(self):
+        frame = analytics_engine.load_bookings(chunk_size=50)
+        stats = analytics_engine.booking_statistics(frame)
+
+        minutes = [b.duration.total_seconds() / 60 for b in self.bookings if b.duration is not None]
+        by_college = {}
+        for booking in self.bookings:
+            college = booking.user.profile.college
+            if college is not None:
+                by_college[college.name] = by_college.get(college.name, 0) + 1
+
+        self.assertEqual(stats['total_bookings'], len(self.bookings))
+        self.assertEqual(stats['confirmed_bookings'], sum(b.status == 'confirmed' for b in self.bookings))
+        self.assertEqual(stats['cancelled_bookings'], sum(b.status == 'cancelled' for b in self.bookings))
+        self.assertEqual(stats['avg_duration_minutes'], round(statistics.mean(minutes), 2))
+        self.assertAlmostEqual(stats['total_pc_hours'], sum(minutes) / 60, places=3)
+        self.assertEqual(stats['bookings_by_college'], by_college)
+
+    def test_session_duration_section(self):
+        stats = analytics.AnalyticsSummary.get_section('descriptive', 'session_durations', 30)
+
+        minutes = sorted(b.duration.total_seconds() / 60 for b in self.bookings if b.duration is not None)
+        self.assertEqual(stats['timed_bookings'], len(minutes))
+        self.assertEqual(stats['avg_minutes'], round(statistics.mean(minutes), 2))
+        self.assertEqual(stats['median_minutes'], round(statistics.median(minutes), 2))
+        self.assertEqual(stats['p90_minutes'], round(statistics.quantiles(minutes, n=10, method='inclusive')[-1], 2))
+        self.assertEqual(stats['longest_minutes'], max(minutes))
+        self.assertEqual(
+            [bucket['bookings'] for bucket in stats['histogram']],
+            [
+                sum(low <= value < high for value in minutes)
+                for low, high in zip([0, 30, 60, 90, 120, 180], [30, 60, 90, 120, 180, float('inf')])
+            ],
+        )
+
+        by_college = {}
+        for booking in self.bookings:
+            college = booking.user.profile.college
+            if booking.duration is not None and college is not None:
+                by_college.setdefault(college.name, []).append(booking.duration.total_seconds() / 60)
+        self.assertEqual(
+            {row['college']: (row['bookings'], row['avg_minutes'], row['median_minutes']) for row in stats['by_college']},
+            {
+                name: (len(values), round(statistics.mean(values), 2), round(statistics.median(values), 2))
+                for name, values in by_college.items()
+            },
+        )
+        counts = [row['bookings'] for row in stats['by_college']]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+    def test_empty_period(self):
+        stats = analytics.DescriptiveAnalytics.get_session_duration_statistics(
+            timezone.now() - timedelta(days=400), timezone.now() - timedelta(days=399)
+        )
+        self.assertEqual(stats['timed_bookings'], 0)
+        self.assertIsNone(stats['median_minutes'])
+        self.assertEqual(stats['by_college'], [])
+
+    def test_bucket_series_groups_local_times_in_one_query(self):
+        local = [timezone.localtime(booking.start_time) for booking in self.bookings]
+        queryset = models.Booking.objects.all()
+
+        with self.assertNumQueries(1):
+            hours = analytics.bucket_series(queryset, 'start_time', 'hour')
+        expected = {hour: sum(1 for at in local if at.hour == hour) for hour in range(24)}
+        self.assertEqual(hours, sorted(expected.items()))
+
+        with self.assertNumQueries(1):
+            weekdays = analytics.bucket_series(queryset, 'start_time', 'weekday')
+        self.assertEqual(dict(weekdays), {day: sum(1 for at in local if at.isoweekday() == day) for day in range(1, 8)})
+
+        # Dense from start to end, including days without bookings
+        first, last = min(local).date(), max(local).date()
+        days = analytics.bucket_series(queryset, 'start_time', 'day', start=first - timedelta(days=2), end=last)
+        self.assertEqual(days[0], (first - timedelta(days=2), 0))
+        self.assertEqual(days[-1][0], last)
+        self.assertEqual(sum(count for _, count in days), len(self.bookings))
+        self.assertEqual(dict(days)[first], sum(1 for at in local if at.date() == first))
+
+    def test_weeks_are_keyed_by_their_monday_across_years(self):
+        user = User.objects.first()
+        # Manila is UTC+8: 2025-12-31 23:30 there is still 15:30 UTC
+        times = [datetime(2025, 12, 31, 23, 30), datetime(2026, 1, 2, 9), datetime(2026, 1, 5, 0, 30)]
+        bookings = models.Booking.objects.bulk_create([
+            models.Booking(user=user, status='cancelled', start_time=timezone.make_aware(at), duration=timedelta(minutes=30))
+            for at in times
+        ])
+        queryset = models.Booking.objects.filter(pk__in=[booking.pk for booking in bookings])
+
+        self.assertEqual(
+            analytics.bucket_series(queryset, 'start_time', 'week'),
+            [(date(2025, 12, 29), 2), (date(2026, 1, 5), 1)],
+        )
+        self.assertEqual(
+            analytics.bucket_series(queryset, 'start_time', 'day')[0],
+            (date(2025, 12, 31), 1),
+        )
+
+    def test_report_sections_are_served_from_the_cache(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        rollups.refresh()
+        computed = []
+        compute = analytics.AnalyticsSummary.get_section
+
+        def counted(group, name, days=30):
+            computed.append((group, name))
+            return compute(group, name, days)
+
+        with mock.patch.object(analytics.AnalyticsSummary, 'get_section', side_effect=counted):
+            sections = [(group, name) for group, name, _, _ in analytics.AnalyticsSummary.SECTIONS]
+            first = {section: report_cache.get_section(*section, 30) for section in sections}
+            self.assertEqual(len(computed), len(sections))
+
+            # Warm: no queries and no recomputes, whole report included
+            with self.assertNumQueries(0):
+                report = report_cache.get_report(30)
+            self.assertEqual(len(computed), len(sections))
+            self.assertTrue(all(timing['cached'] for timing in report['section_timings'].values()))
+            self.assertEqual(
+                report['descriptive']['session_durations'],
+                first[('descriptive', 'session_durations')]['value'],
+            )
+
+            # Sections with their own window share one entry across periods
+            report_cache.get_section('predictive', 'anomalies', 7)
+            self.assertEqual(len(computed), len(sections))
+
+            # Stale after invalidate(): still served as is, each read asking for a background refresh
+            report_cache.invalidate()
+            with mock.patch.object(report_cache, '_refresh_in_background') as refresh, self.assertNumQueries(0):
+                entry = report_cache.get_section('descriptive', 'bookings', 30)
+                report_cache.get_section('descriptive', 'bookings', 30)
+            self.assertEqual(entry, first[('descriptive', 'bookings')])
+            self.assertEqual(len(computed), len(sections))
+            self.assertEqual(refresh.call_count, 2)
+            refresh.assert_called_with(
+                report_cache.section_key('descriptive', 'bookings', 30), 'descriptive', 'bookings', 30
+            )
+
+
+class RollupBackfillTests(TransactionTestCase):
+    """
+    The first rollup backfill runs in the background; reports do not wait for
+    it. Sections computed together on the section pool (their own connections,
+    so committed data) match computing them one by one.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user('student', 'student@example.com', 'pw')
+        pc = models.PC.objects.create(name='PC-1', ip_address='127.0.0.1', status='connected', system_condition='active')
+        now = timezone.now()
+        models.Booking.objects.bulk_create([
+            models.Booking(
+                user=user, pc=pc, status='confirmed', start_time=now - timedelta(days=i),
+                end_time=now - timedelta(days=i) + timedelta(minutes=30),
+                duration=timedelta(minutes=30), expiry=now - timedelta(days=i),
+            )
+            for i in range(1, 6)
+        ])
+        # Spread over five days of history
+        for i, booking in enumerate(models.Booking.objects.order_by('id'), start=1):
+            booking.created_at = now - timedelta(days=i)
+        models.Booking.objects.bulk_update(models.Booking.objects.all(), ['created_at'])
+
+    def backfill_thread(self):
+        return next((thread for thread in threading.enumerate() if thread.name == 'rollup-backfill'), None)
+
+    def test_first_use_backfills_in_background(self):
+        # Reads the mark and returns: the backfill is not run in the request
+        with self.assertNumQueries(1):
+            self.assertFalse(rollups.ensure_fresh())
+
+        thread = self.backfill_thread()
+        if thread is not None:
+            thread.join(timeout=30)
+        self.assertTrue(models.RollupMark.objects.filter(name=rollups.MARK_NAME).exists())
+        self.assertEqual(sum(models.UsageRollup.objects.values_list('bookings', flat=True)), 5)
+
+    def test_one_backfill_at_a_time(self):
+        cache.add(rollups.REFRESH_LOCK_KEY, True)
+        self.assertIsNone(rollups.start_backfill())
+        self.assertFalse(rollups.ensure_fresh())
+        self.assertFalse(models.RollupMark.objects.exists())
+
+    def test_parallel_sections_match_sequential(self):
+        rollups.refresh()
+        sections = [(group, name) for group, name, _, _ in analytics.AnalyticsSummary.SECTIONS]
+        sequential = {section: analytics.AnalyticsSummary.get_section(*section, 30) for section in sections}
+
+        parallel = analytics.AnalyticsSummary.evaluate_sections(sections, 30)
+        self.assertEqual({section: value for section, (value, _) in parallel.items()}, sequential)
+        self.assertEqual(sequential[('descriptive', 'bookings')]['total_bookings'], 5)
+
+        report = analytics.AnalyticsSummary.get_comprehensive_report(30)
+        for group, name in sections:
+            self.assertEqual(report[group][name], sequential[(group, name)])
+        self.assertEqual(len(report['section_timings']), len(sections))
+
+
+class OccupancyCounterTests(TestCase):
+    """The cached PC counters match the table after transitions and rebuilds."""
+
+    def setUp(self):
+        occupancy.invalidate()
+        self.addCleanup(occupancy.invalidate)
+        models.PC.objects.bulk_create([
+            models.PC(
+                name=f'PC-{i}', ip_address='127.0.0.1', status='connected',
+                system_condition='active', booking_status='available',
+            )
+            for i in range(4)
+        ])
+        self.pc = models.PC.objects.order_by('id').first()
+        self.student = User.objects.create_user('student', 'student@example.com', 'pw')
+
+    def test_rebuild_before_broadcast_is_not_double_counted(self):
+        self.assertEqual(occupancy.get_counts()['available'], 4)
+        with self.captureOnCommitCallbacks() as callbacks:
+            booking_state.reserve(self.student, self.pc, timedelta(minutes=30))
+            # Another request recounts after the reservation was written,
+            # before its broadcast applies the change
+            occupancy.rebuild()
+        for callback in callbacks:
+            callback()
+
+        counts = occupancy.get_counts()
+        self.assertEqual((counts['available'], counts['in_queue']), (3, 1))
+
+    def test_rebuild_after_commit_skips_the_change(self):
+        started = time.time()
+        models.PC.objects.filter(pk=self.pc.pk).update(booking_status='in_use')
+        committed = time.time()
+        occupancy.rebuild()
+
+        occupancy.apply_change(
+            ('available', 'connected', 'active'), ('in_use', 'connected', 'active'), started, committed
+        )
+        counts = occupancy.get_counts()
+        self.assertEqual((counts['available'], counts['in_use']), (3, 1))
+
+    def test_change_after_rebuild_is_applied(self):
+        occupancy.rebuild()
+        started = time.time()
+        models.PC.objects.filter(pk=self.pc.pk).update(booking_status='in_use')
+        occupancy.apply_change(
+            ('available', 'connected', 'active'), ('in_use', 'connected', 'active'), started, time.time()
+        )
+
+        with self.assertNumQueries(0):
+            counts = occupancy.get_counts()
+        self.assertEqual((counts['available'], counts['in_use']), (3, 1))
+
+
+class SweepDayTests(SimpleTestCase):
+    """sweep_day merges each PC's sessions, splits them by hour and counts concurrent PCs."""
+
+    def setUp(self):
+        self.day_start = timezone.make_aware(datetime(2026, 3, 2))
+
+    def at(self, hour, minute=0):
+        return self.day_start + timedelta(hours=hour, minutes=minute)
+
+    def test_overlapping_sessions_on_one_pc_are_merged(self):
+        result = utilization.sweep_day([
+            (1, self.at(9), self.at(10)),
+            (1, self.at(9, 30), self.at(10, 30)),
+        ], self.day_start)
+
+        self.assertEqual(result['pcs'][1][9:11], [60, 30])
+        self.assertEqual(sum(result['pcs'][1]), 90)
+        self.assertEqual(result['peak_pcs'][9:11], [1, 1])
+
+    def test_session_is_split_at_hour_boundaries(self):
+        result = utilization.sweep_day([(1, self.at(9, 45), self.at(11, 15))], self.day_start)
+
+        self.assertEqual(result['pcs'][1][9:12], [15, 60, 15])
+        self.assertEqual(result['peak_pcs'][8:13], [0, 1, 1, 1, 0])
+
+    def test_session_until_midnight_stays_in_the_day(self):
+        result = utilization.sweep_day([(1, self.at(23, 30), self.at(24))], self.day_start)
+
+        self.assertEqual(len(result['pcs'][1]), 24)
+        self.assertEqual(result['pcs'][1][23], 30)
+        self.assertEqual(result['peak_pcs'][23], 1)
+
+    def test_peak_counts_concurrent_pcs(self):
+        result = utilization.sweep_day([
+            (1, self.at(9), self.at(10)),
+            (2, self.at(9, 30), self.at(11)),
+            (3, self.at(9, 45), self.at(9, 50)),
+            # Starts as PC 1 ends: not concurrent with it
+            (4, self.at(10), self.at(10, 30)),
+        ], self.day_start)
+
+        self.assertEqual(result['peak_pcs'][9:12], [3, 2, 0])
+        self.assertEqual(max(result['peak_pcs']), 3)
+
+
+class OccupancyTests(TestCase):
+    """get_occupancy clips sessions to days and booking hours and counts idle days."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('student', 'student@example.com', 'pw')
+        self.pc = models.PC.objects.create(name='PC-1', ip_address='127.0.0.1', status='connected', system_condition='active')
+        self.now = timezone.make_aware(datetime(2026, 3, 10, 12))
+
+    def session(self, start, end):
+        start, end = timezone.make_aware(start), timezone.make_aware(end)
+        models.Booking.objects.create(
+            user=self.user, pc=self.pc, status='confirmed', start_time=start, end_time=end,
+            duration=end - start, expiry=end,
+        )
+
+    def test_session_across_midnight_is_split_between_days(self):
+        self.session(datetime(2026, 3, 2, 23, 30), datetime(2026, 3, 3, 0, 45))
+
+        first = utilization.day_occupancy(date(2026, 3, 2), self.now)
+        second = utilization.day_occupancy(date(2026, 3, 3), self.now)
+        self.assertEqual(first['pcs'][self.pc.pk][23], 30)
+        self.assertEqual(second['pcs'][self.pc.pk][0], 45)
+
+    def test_only_booking_hours_count_towards_utilization(self):
+        # 07:00-09:00: one hour before opening, one hour within booking hours
+        self.session(datetime(2026, 3, 2, 7), datetime(2026, 3, 2, 9))
+
+        occupancy = utilization.get_occupancy(date(2026, 3, 2), date(2026, 3, 2), self.now)
+        self.assertEqual(occupancy['daily'][0]['occupied_minutes'], 120)
+        self.assertEqual(occupancy['daily'][0]['open_hours_minutes'], 60)
+        open_minutes = (utilization.CLOSE_HOUR - utilization.OPEN_HOUR) * 60
+        self.assertEqual(occupancy['utilization_percent'], round(60 / open_minutes * 100, 2))
+
+    def test_idle_days_count_towards_utilization(self):
+        # Busy for all booking hours on the first day, idle on the second
+        self.session(
+            datetime(2026, 3, 2, utilization.OPEN_HOUR), datetime(2026, 3, 2, utilization.CLOSE_HOUR)
+        )
+
+        occupancy = utilization.get_occupancy(date(2026, 3, 2), date(2026, 3, 3), self.now)
+        self.assertEqual(occupancy['utilization_percent'], 50)
+        self.assertEqual([day['occupancy_percent'] for day in occupancy['daily']], [100, 0])
+
+
+class ForecasterTests(SimpleTestCase):
+    """The demand forecaster fits a small history, predicts sane counts and survives a save/load."""
+
+    def setUp(self):
+        self.first_day = date(2026, 2, 2)  # a Monday
+        # Four weeks: busy weekday mornings, quiet afternoons, empty weekends
+        day = [0] * 8 + [6, 9, 7, 5, 3, 4, 3, 2, 1] + [0] * 7
+        weekend = [0] * 24
+        self.counts = np.array(([day] * 5 + [weekend] * 2) * 4, dtype=float)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(DEMAND_FORECAST_MODEL_PATH=os.path.join(directory, 'demand.joblib'))
+        override.enable()
+        self.addCleanup(override.disable)
+        forecasting._loaded.update(mtime=None, model=None)
+        forecasting._forecasts.clear()
+        self.addCleanup(forecasting._forecasts.clear)
+        self.addCleanup(forecasting._loaded.update, mtime=None, model=None)
+
+    def test_predictions_have_the_horizon_shape_and_are_not_negative(self):
+        fitted = forecasting.fit(self.counts, self.first_day)
+        start = self.first_day + timedelta(days=len(self.counts))
+        mu, lower, upper = forecasting.predict(fitted, start, 7)
+
+        for array in (mu, lower, upper):
+            self.assertEqual(array.shape, (7, 24))
+            self.assertTrue((array >= 0).all())
+        self.assertTrue((lower <= upper).all())
+        # The weekly pattern is learned: Monday 09:00 is busier than Saturday 09:00
+        self.assertGreater(mu[0, 9], 4 * mu[5, 9])
+
+    def test_saved_model_is_loaded_and_forecasts(self):
+        self.assertIsNone(forecasting.load())
+        with self.assertRaises(forecasting.NotTrained):
+            forecasting.get_forecast()
+
+        fitted = forecasting.fit(self.counts, self.first_day)
+        fitted.update({
+            'trained_at': timezone.now(),
+            'first_day': self.first_day,
+            'last_day': self.first_day + timedelta(days=len(self.counts) - 1),
+            'bookings': int(self.counts.sum()),
+            'backtest': None,
+            'sklearn_version': forecasting.sklearn_version,
+        })
+        forecasting.save(fitted)
+
+        loaded = forecasting.load()
+        self.assertEqual(loaded['dispersion'], fitted['dispersion'])
+        start = self.first_day + timedelta(days=len(self.counts))
+        expected = forecasting.predict(fitted, start, 3)[0]
+        actual = forecasting.predict(loaded, start, 3)[0]
+        self.assertTrue(np.allclose(expected, actual))
+
+        forecast = forecasting.get_forecast(start)
+        self.assertEqual(len(forecast['daily']), forecasting.HORIZON_DAYS)
+        self.assertEqual(len(forecast['hourly']), forecasting.HORIZON_DAYS * 24)
+        self.assertTrue(all(hour['predicted'] >= 0 and hour['lower'] >= 0 for hour in forecast['hourly']))
+        self.assertIs(forecasting.get_forecast(start), forecast)
+
+
+class ExportTests(TestCase):
+    """The booking CSV export pages by primary key, filters, compresses and rejects bad ranges."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'pw')
+        cls.colleges = [models.College.objects.create(name=name) for name in ('CCS', 'CBA')]
+        cls.students = []
+        for i, college in enumerate(cls.colleges):
+            student = User.objects.create_user(f'student{i}', f'student{i}@example.com', 'pw', first_name=f'Student{i}')
+            student.profile.college = college
+            student.profile.save()
+            cls.students.append(student)
+        cls.pcs = [
+            models.PC.objects.create(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in range(2)
+        ]
+        now = timezone.now()
+        # Ended sessions (expiry set), so none of them holds a live slot
+        models.Booking.objects.bulk_create([
+            models.Booking(
+                user=cls.students[i % 2], pc=cls.pcs[i % 2], status=['confirmed', 'cancelled'][i % 3 == 0],
+                start_time=now, end_time=now + timedelta(minutes=30), duration=timedelta(minutes=30), expiry=now,
+            )
+            for i in range(exports.CHUNK_SIZE + 5)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, **params):
+        response = self.client.get('/ajax/export-report/', params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        return response, content
+
+    def rows(self, content):
+        return list(csv.reader(content.decode('utf-8').splitlines()))
+
+    def test_rows_are_paged_by_primary_key(self):
+        queryset = exports.bookings()
+        # One query per CHUNK_SIZE bookings
+        with self.assertNumQueries(2):
+            rows = list(exports.booking_rows(queryset))
+        self.assertEqual(len(rows), exports.CHUNK_SIZE + 5)
+
+        with self.assertNumQueries(3):
+            small_pages = list(exports.booking_rows(queryset, chunk_size=1000))
+        self.assertEqual(small_pages, rows)
+
+    def test_whole_export_is_streamed(self):
+        response, content = self.export()
+        rows = self.rows(content)
+        self.assertEqual(rows[0], exports.HEADER)
+        self.assertEqual(len(rows) - 1, exports.CHUNK_SIZE + 5)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+    def test_status_college_and_pc_filters(self):
+        _, content = self.export(status='cancelled')
+        self.assertEqual({row[5] for row in self.rows(content)[1:]}, {'cancelled'})
+
+        college = self.colleges[1]
+        _, content = self.export(college=college.pk)
+        self.assertEqual({row[4] for row in self.rows(content)[1:]}, {college.name})
+
+        pc = self.pcs[0]
+        _, content = self.export(pc=pc.pk, status='confirmed')
+        rows = self.rows(content)[1:]
+        self.assertEqual({(row[3], row[5]) for row in rows}, {(pc.name, 'confirmed')})
+        expected = models.Booking.objects.filter(pc=pc, status='confirmed').count()
+        self.assertEqual(len(rows), expected)
+
+    def test_gzip_download(self):
+        _, plain = self.export(status='cancelled')
+        response, compressed = self.export(status='cancelled', gzip='1')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_invalid_range_is_rejected(self):
+        for params in ({'from': 'yesterday'}, {'to': '2026-13-01'}, {'from': '2026-03-02', 'to': '2026-03-01'}):
+            with self.subTest(params=params):
+                response = self.client.get('/ajax/export-report/', params)
+                self.assertEqual(response.status_code, 400)
+
+
+class LabStatePollTests(TestCase):
+    """
+    get_all_pc_status answers an unchanged poll with 304, but only to a
+    logged-in user, and ``?since=N`` with the PCs changed after version N.
+    """
+
+    url = '/ajax/get-all-pc-status/'
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        lab_state._change_log.clear()
+        self.pc = models.PC.objects.create(name='PC-1', ip_address='127.0.0.1', status='connected', system_condition='active')
+        self.student = User.objects.create_user('student', 'student@example.com', 'pw')
+        self.student.profile.role = 'student'
+        self.student.profile.save()
+
+    def test_unchanged_poll_is_not_modified(self):
+        self.client.force_login(self.student)
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_poll_after_a_change_gets_the_new_state(self):
+        self.client.force_login(self.student)
+        etag = self.client.get(self.url)['ETag']
+        lab_state.bump_version([self.pc.pk])
+
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([pc['id'] for pc in response.json()['pcs']], [self.pc.pk])
+
+    def test_anonymous_or_invalid_session_is_redirected(self):
+        self.client.force_login(self.student)
+        etag = self.client.get(self.url)['ETag']
+        self.client.logout()
+
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 302)
+
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'forged-session-key'
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('ETag', response)
+
+    def since(self, version):
+        response = self.client.get(self.url, {'since': version})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_delta_holds_only_the_changed_pcs(self):
+        others = [
+            models.PC.objects.create(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in (2, 3)
+        ]
+        self.client.force_login(self.student)
+        version = self.client.get(self.url).json()['version']
+
+        models.PC.objects.filter(pk=others[0].pk).update(booking_status='in_use')
+        lab_state.bump_version([others[0].pk])
+        removed = others[1].pk
+        others[1].delete()
+        lab_state.bump_version([removed])
+
+        delta = self.since(version)
+        self.assertFalse(delta['full'])
+        self.assertEqual([(pc['id'], pc['booking_status']) for pc in delta['pcs']], [(others[0].pk, 'in_use')])
+        self.assertEqual(delta['removed'], [removed])
+
+        # After a restart the in-memory log is empty; the PCStatusChange table answers
+        lab_state._change_log.clear()
+        self.assertEqual([pc['id'] for pc in self.since(version)['pcs']], [others[0].pk])
+
+        self.assertEqual(self.since(delta['version']), {'version': delta['version'], 'full': False, 'pcs': [], 'removed': []})
+
+    def test_version_older_than_the_change_log_gets_a_full_resync(self):
+        self.client.force_login(self.student)
+        version = self.client.get(self.url).json()['version']
+        lab_state.bump_version([self.pc.pk])
+
+        delta = self.since(version - lab_state.DURABLE_LOG_SIZE)
+        self.assertTrue(delta['full'])
+        self.assertEqual([pc['id'] for pc in delta['pcs']], [self.pc.pk])
+
+        # Versions the log never recorded (another process, before a restart)
+        lab_state._change_log.clear()
+        models.PCStatusChange.objects.all().delete()
+        self.assertTrue(self.since(version)['full'])
+
+    def test_since_must_be_a_version_number(self):
+        self.client.force_login(self.student)
+        for since in ('abc', '1.5', ''):
+            with self.subTest(since=since):
+                response = self.client.get(self.url, {'since': since})
+                self.assertEqual(response.status_code, 400)
+
+    def test_pc_session_polls_are_answered_from_memory(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = booking_state.reserve(self.student, self.pc, timedelta(minutes=3))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking_state.approve(booking)
+        url = '/api/pc-session-status/'
+
+        first = self.client.get(url, {'pc_name': 'pc-1'}).json()
+        self.assertEqual((first['status'], first['booking_id'], first['should_warn']), ('warning', booking.pk, True))
+        with self.assertNumQueries(0):
+            again = self.client.get(url, {'pc_name': 'PC-1'}).json()
+        self.assertEqual((again['status'], again['booking_id']), ('warning', booking.pk))
+
+        # A transition bumps the version, and the next poll sees it
+        with self.captureOnCommitCallbacks(execute=True):
+            booking_state.end_session(booking)
+        self.assertEqual(self.client.get(url, {'pc_name': 'PC-1'}).json()['status'], 'idle')
+        self.assertEqual(self.client.get(url, {'pc_name': 'PC-9'}).status_code, 404)
+
+
+class PCStatusStreamTests(TransactionTestCase):
+    """A client that reconnects to the PC status socket with its last version only gets what it missed."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        lab_state._change_log.clear()
+        self.student = User.objects.create_user('student', 'student@example.com', 'pw')
+        self.pcs = [
+            models.PC.objects.create(name=f'PC-{i}', ip_address='127.0.0.1', status='connected', system_condition='active')
+            for i in range(3)
+        ]
+        self.application = URLRouter(routing.websocket_urlpatterns)
+
+    async def connect(self, query=''):
+        communicator = WebsocketCommunicator(self.application, f'/ws/pc-status-updates/{query}')
+        communicator.scope['user'] = self.student
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @database_sync_to_async
+    def change(self, pc, booking_status):
+        models.PC.objects.filter(pk=pc.pk).update(booking_status=booking_status)
+        lab_state.bump_version([pc.pk])
+
+    async def test_reconnect_receives_only_missed_changes(self):
+        communicator = await self.connect()
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual((snapshot['type'], snapshot['full']), ('pc_status_snapshot', True))
+        self.assertEqual(len(snapshot['pcs']), 3)
+        await communicator.disconnect()
+
+        # Missed while disconnected
+        await self.change(self.pcs[1], 'in_use')
+
+        communicator = await self.connect(f"?since={snapshot['version']}")
+        delta = await communicator.receive_json_from()
+        self.assertEqual(delta['type'], 'pc_status_snapshot')
+        self.assertFalse(delta['full'])
+        self.assertEqual([(pc['id'], pc['booking_status']) for pc in delta['pcs']], [(self.pcs[1].pk, 'in_use')])
+        self.assertGreater(delta['version'], snapshot['version'])
+
+        # A resume on the open socket asks for the same catch-up
+        await self.change(self.pcs[2], 'in_queue')
+        await communicator.send_json_to({'type': 'resume', 'since': delta['version']})
+        resumed = await communicator.receive_json_from()
+        self.assertEqual([pc['id'] for pc in resumed['pcs']], [self.pcs[2].pk])
+        await communicator.disconnect()
+
+
+class PCStatusReconcileTests(TestCase):
+    """reconcile_pc_statuses costs the same queries for a small and a large lab."""
+
+    def seed(self, size):
+        models.Booking.objects.all().delete()
+        models.PC.objects.all().delete()
+        User.objects.filter(username__startswith='student-').delete()
+        pcs = models.PC.objects.bulk_create([
+            models.PC(
+                name=f'PC-{i}', ip_address='127.0.0.1', status='connected',
+                system_condition='active', booking_status='available', sort_number=i,
+            )
+            for i in range(size)
+        ])
+        users = User.objects.bulk_create([User(username=f'student-{i}') for i in range(size)])
+        now = timezone.now()
+        # Half the lab in use, half in the queue, none of it recorded on the PCs yet
+        models.Booking.objects.bulk_create([
+            models.Booking(
+                user=user, pc=pc, status='confirmed' if i % 2 else None, start_time=now,
+                end_time=now + timedelta(hours=1) if i % 2 else None, duration=timedelta(hours=1),
+            )
+            for i, (user, pc) in enumerate(zip(users, pcs))
+        ])
+
+    def test_query_count_does_not_grow_with_the_lab(self):
+        for size in (5, 50):
+            with self.subTest(size=size):
+                self.seed(size)
+                # One SELECT, one bulk UPDATE for the drifted rows
+                with self.assertNumQueries(2):
+                    pcs, changed = pc_status.reconcile_pc_statuses()
+                self.assertEqual(len(changed), size)
+                self.assertEqual(
+                    models.PC.objects.filter(booking_status='in_use').count(), size // 2
+                )
+
+                # Nothing drifted: the SELECT only
+                with self.assertNumQueries(1):
+                    _, changed = pc_status.reconcile_pc_statuses()
+                self.assertEqual(changed, [])
@@ -79,6 +79,11 @@ urlpatterns = [
     # Analytics and Predictions
     path('analytics/', views.analytics_dashboard, name='analytics-dashboard'),
     path('analytics-api/', views.analytics_api, name='analytics-api'),
+    path('utilization-api/', views.utilization_api, name='utilization-api'),
+    path('demand-forecast-api/', views.demand_forecast_api, name='demand-forecast-api'),
+    path('report-jobs/', views.report_jobs, name='report-jobs'),
+    path('report-jobs/<int:pk>/', views.report_job_status, name='report-job-status'),
+    path('report-jobs/<int:pk>/download/', views.report_job_download, name='report-job-download'),
     path('booking-predictions/', views.booking_predictions, name='booking-predictions'),
     path('risk-analysis/', views.risk_analysis, name='risk-analysis'),
     path('resource-demand/', views.resource_demand_forecast, name='resource-demand'),
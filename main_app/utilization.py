@@ -0,0 +1,216 @@
+"""
+True PC occupancy from booking intervals.
+
+A session occupies its PC over [start_time, end), where end is the earliest
+of its end_time, its expiry, the moment it was ended early (updated_at of a
+cancelled session that had been approved) and now. Pending and declined
+bookings have no end_time and never occupy a PC.
+
+Per local day, one sweep over the intervals sorted by (PC, start) merges each
+PC's overlapping sessions and splits them at hour boundaries into occupied
+minutes per PC per hour; a second sweep over the sorted start/end points
+gives how many PCs were in use at once. Sorting dominates, so a day costs
+O(n log n) in its bookings.
+
+Days are cached: past days for DAY_CACHE_SECONDS, today for
+TODAY_CACHE_SECONDS. report_cache.invalidate() (rollup backfills, deleted
+PCs) drops them all.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Booking, PC
+from .rollups import day_bounds
+
+# Booking hours (see models.is_within_booking_hours): utilization percentages
+# are measured against these, occupancy curves cover the whole day.
+OPEN_HOUR = 8
+CLOSE_HOUR = 17
+
+DAY_CACHE_SECONDS = 24 * 60 * 60
+TODAY_CACHE_SECONDS = 5 * 60
+DAY_KEY = 'pcheck:utilization:{generation}:{day}'
+
+# Longest range the occupancy API computes in one request.
+MAX_DAYS = 366
+
+
+def occupied_intervals(start, end, now=None):
+    """
+    Sessions overlapping ``start`` .. ``end``, clipped to it.
+
+    Returns:
+        list: (pc id, start, end) tuples of aware datetimes
+    """
+    if now is None:
+        now = timezone.now()
+    end = min(end, now)
+    rows = Booking.objects.filter(
+        pc__isnull=False,
+        status__in=['confirmed', 'cancelled'],
+        start_time__lt=end,
+        end_time__gt=start,
+    ).values_list('pc_id', 'status', 'start_time', 'end_time', 'expiry', 'updated_at')
+
+    intervals = []
+    for pc_id, status, began, ended, expiry, updated_at in rows.iterator():
+        if expiry is not None:
+            ended = min(ended, expiry)
+        if status == 'cancelled':
+            ended = min(ended, updated_at)
+        began, ended = max(began, start), min(ended, end)
+        if began < ended:
+            intervals.append((pc_id, began, ended))
+    return intervals
+
+
+def sweep_day(intervals, day_start):
+    """
+    Occupied minutes per PC per hour and peak concurrent PCs per hour of one day.
+
+    Args:
+        intervals: (pc id, start, end) tuples within the day
+        day_start: aware start of the local day
+
+    Returns:
+        dict: ``pcs`` (pc id -> 24 occupied minutes) and ``peak_pcs`` (24 counts)
+    """
+    def minute(dt):
+        return (dt - day_start).total_seconds() / 60
+
+    pcs = {}
+    merged = []
+    current_pc = current_start = current_end = None
+    for pc_id, began, ended in sorted(intervals):
+        began, ended = minute(began), minute(ended)
+        if pc_id == current_pc and began <= current_end:
+            current_end = max(current_end, ended)
+            continue
+        if current_pc is not None:
+            merged.append((current_pc, current_start, current_end))
+        current_pc, current_start, current_end = pc_id, began, ended
+    if current_pc is not None:
+        merged.append((current_pc, current_start, current_end))
+
+    for pc_id, began, ended in merged:
+        hours = pcs.setdefault(pc_id, [0.0] * 24)
+        for hour in range(int(began // 60), min(int(-(-ended // 60)), 24)):
+            hours[hour] += min(ended, (hour + 1) * 60) - max(began, hour * 60)
+
+    # Ends sort before starts at the same minute, so back-to-back sessions on
+    # different PCs are not counted as overlapping
+    events = sorted([(began, 1) for _, began, _ in merged] + [(ended, -1) for _, _, ended in merged])
+    peak_pcs = [0] * 24
+    in_use = 0
+    for i, (at, delta) in enumerate(events):
+        in_use += delta
+        following = events[i + 1][0] if i + 1 < len(events) else at
+        if in_use and following > at:
+            for hour in range(int(at // 60), min(int(-(-following // 60)), 24)):
+                peak_pcs[hour] = max(peak_pcs[hour], in_use)
+
+    return {
+        'pcs': {pc_id: [round(minutes, 2) for minutes in hours] for pc_id, hours in pcs.items()},
+        'peak_pcs': peak_pcs,
+    }
+
+
+def day_occupancy(day, now=None):
+    """Cached sweep_day of one local date (see sweep_day)."""
+    from . import report_cache
+
+    if now is None:
+        now = timezone.now()
+    today = timezone.localtime(now).date()
+    key = DAY_KEY.format(generation=report_cache.get_generation(), day=day.isoformat())
+    result = cache.get(key)
+    if result is None:
+        start, end = day_bounds(day)
+        result = sweep_day(occupied_intervals(start, end, now), start)
+        if day <= today:
+            cache.set(key, result, TODAY_CACHE_SECONDS if day == today else DAY_CACHE_SECONDS)
+    return result
+
+
+def get_occupancy(start_day, end_day, now=None):
+    """
+    Lab occupancy from ``start_day`` to ``end_day`` (local dates, inclusive).
+
+    Percentages are occupied PC-minutes over the capacity of the current PCs:
+    per hour of day across the whole range, per day within booking hours, and
+    ``utilization_percent`` within booking hours over every day of the range,
+    idle days included.
+
+    Returns:
+        dict: ``curve`` (24 hours of day), ``daily``, ``heatmap`` (PC x hour
+        of day, in occupied minutes and percent of the range) and totals
+    """
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    pcs = list(PC.objects.order_by('sort_number', 'name').values_list('pk', 'name'))
+    pc_count = len(pcs)
+    open_minutes = (CLOSE_HOUR - OPEN_HOUR) * 60
+
+    heatmap = {pc_id: [0.0] * 24 for pc_id, _ in pcs}
+    curve_minutes = [0.0] * 24
+    curve_peak = [0] * 24
+    daily = []
+    for day in days:
+        occupancy = day_occupancy(day, now)
+        hours = [0.0] * 24
+        for pc_id, minutes in occupancy['pcs'].items():
+            for hour in range(24):
+                hours[hour] += minutes[hour]
+            if pc_id in heatmap:
+                heatmap[pc_id] = [total + extra for total, extra in zip(heatmap[pc_id], minutes)]
+        for hour in range(24):
+            curve_minutes[hour] += hours[hour]
+            curve_peak[hour] = max(curve_peak[hour], occupancy['peak_pcs'][hour])
+        daily.append({
+            'date': day.isoformat(),
+            'occupied_minutes': round(sum(hours), 2),
+            'open_hours_minutes': round(sum(hours[OPEN_HOUR:CLOSE_HOUR]), 2),
+            'occupancy_percent': _percent(sum(hours[OPEN_HOUR:CLOSE_HOUR]), pc_count * open_minutes),
+            'peak_pcs': max(occupancy['peak_pcs']),
+        })
+
+    return {
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'days': len(days),
+        'pc_count': pc_count,
+        'open_hours': [OPEN_HOUR, CLOSE_HOUR],
+        'occupied_pc_hours': round(sum(curve_minutes) / 60, 2),
+        'utilization_percent': _percent(
+            sum(entry['open_hours_minutes'] for entry in daily),
+            pc_count * open_minutes * len(days),
+        ),
+        'peak_pcs': max(curve_peak),
+        'curve': [
+            {
+                'hour': hour,
+                'occupied_minutes': round(curve_minutes[hour], 2),
+                'occupancy_percent': _percent(curve_minutes[hour], pc_count * 60 * len(days)),
+                'peak_pcs': curve_peak[hour],
+            }
+            for hour in range(24)
+        ],
+        'daily': daily,
+        'heatmap': {
+            'hours': list(range(24)),
+            'pcs': [
+                {
+                    'id': pc_id,
+                    'name': name,
+                    'minutes': [round(minutes, 2) for minutes in heatmap[pc_id]],
+                    'percent': [_percent(minutes, 60 * len(days)) for minutes in heatmap[pc_id]],
+                }
+                for pc_id, name in pcs
+            ],
+        },
+    }
+
+
+def _percent(part, whole):
+    return round(part / whole * 100, 2) if whole else 0
@@ -17,6 +17,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import never_cache
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_GET
 from django.views.generic import TemplateView, CreateView, ListView, UpdateView, DetailView
 from django.views.generic.edit import FormMixin
@@ -31,52 +32,13 @@ from functools import wraps
 from django.core.exceptions import PermissionDenied
 from django.core.mail import EmailMessage, send_mail
 from email.mime.image import MIMEImage
-from . import forms, models, ping_address
+from . import booking_state, broadcast, forms, lab_state, models, occupancy, pc_status, ping_address, scheduler
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 
 today = timezone.now()
 
-def broadcast_pc_status_update(pc, message=""):
-    """Helper function to broadcast PC status updates to all connected users"""
-    try:
-        channel_layer = get_channel_layer()
-        if channel_layer:
-            # Refresh PC from database to ensure we have the latest status
-            pc.refresh_from_db()
-            
-            # Count available PCs
-            available_pcs_count = models.PC.objects.filter(
-                booking_status='available',
-                system_condition='active',
-                status='connected'
-            ).count()
-            
-            # Get the current booking_status (should be in_queue, in_use, or available)
-            booking_status = pc.booking_status or 'available'
-            
-            print(f"📤 Broadcasting PC status update: {pc.name} -> booking_status: {booking_status}")
-            
-            async_to_sync(channel_layer.group_send)(
-                'pc_status_updates',
-                {
-                    'type': 'pc_status_update',
-                    'pc_id': pc.id,
-                    'pc_name': pc.name,
-                    'booking_status': booking_status,
-                    'status': pc.status,
-                    'system_condition': pc.system_condition,
-                    'message': message,
-                    'available_pcs_count': available_pcs_count,
-                }
-            )
-            print(f"✅ Broadcasted PC status update: {pc.name} -> {booking_status}")
-    except Exception as e:
-        print(f"❌ Error broadcasting PC status update: {e}")
-        import traceback
-        traceback.print_exc()
-
 def get_pcheck_support_user():
     """Get or create the PCheck Support system account."""
     username = 'pcheck_support'
@@ -132,15 +94,8 @@ def webfilter_policy(request):
 
 @login_required
 def clearup_pcs(request):
-    today = timezone.now()
-    bookings = models.Booking.objects.filter(end_time__lt=today,expiry__isnull=True)
-    for booking in bookings:
-        pc = booking.pc
-        pc.booking_status = 'available'
-        pc.save()
-        booking.expiry = booking.end_time
-        booking.save()
-    data = {"message": "All PC have been cleared."}
+    result = booking_state.expire_ended_bookings()
+    data = {"message": "All PC have been cleared.", **result}
     return JsonResponse(data)
 
 
@@ -272,120 +227,28 @@ def get_pc_details(request, pk):
 
 
 @login_required
+@lab_state.conditional(lab_state.pc_status_etag, login_required=True)
 def get_all_pc_status(request):
-    """Get status of all PCs for dashboard auto-refresh"""
+    """
+    Get status of all PCs for dashboard auto-refresh (read-only, served from the lab-state snapshot).
+
+    With ``?since=<version>`` only the PCs that changed after that version are
+    returned, or every PC with ``full: true`` when the version is too old.
+    """
     try:
-        from django.utils import timezone
-        pcs = models.PC.objects.all().order_by('sort_number')
-        pc_statuses = []
-        for pc in pcs:
-            # Sync booking_status with actual bookings to ensure accuracy
-            # Check for confirmed bookings first
-            confirmed_booking = models.Booking.objects.filter(
-                pc=pc,
-                status='confirmed'
-            ).exclude(status='cancelled').order_by('-created_at').first()
-            
-            if confirmed_booking and confirmed_booking.end_time:
-                now = timezone.now()
-                if confirmed_booking.end_time > now:
-                    # Booking is still active
-                    if pc.booking_status != 'in_use':
-                        pc.booking_status = 'in_use'
-                        pc.save(update_fields=['booking_status'])
-                else:
-                    # Booking expired, check for pending
-                    pending_booking = models.Booking.objects.filter(
-                        pc=pc,
-                        status__isnull=True
-                    ).exclude(status='cancelled').order_by('-created_at').first()
-                    if pending_booking:
-                        if pc.booking_status != 'in_queue':
-                            pc.booking_status = 'in_queue'
-                            pc.save(update_fields=['booking_status'])
-                    elif pc.booking_status != 'available':
-                        pc.booking_status = 'available'
-                        pc.save(update_fields=['booking_status'])
-            else:
-                # Check for pending bookings (status is None or not set)
-                # Important: Don't exclude cancelled here - we want to check ALL pending bookings
-                pending_booking = models.Booking.objects.filter(
-                    pc=pc,
-                    status__isnull=True
-                ).exclude(status='cancelled').order_by('-created_at').first()
-                
-                # Also check if there's a cancelled pending booking that might interfere
-                # We only care about non-cancelled pending bookings
-                if pending_booking:
-                    # There's a pending booking - PC should be in_queue
-                    if pc.booking_status != 'in_queue':
-                        pc.booking_status = 'in_queue'
-                        pc.save(update_fields=['booking_status'])
-                elif pc.booking_status in ['in_use', 'in_queue']:
-                    # No active or pending bookings, but status says otherwise
-                    # Double-check: look for any non-cancelled bookings
-                    has_any_active_booking = models.Booking.objects.filter(
-                        pc=pc
-                    ).exclude(status='cancelled').filter(
-                        Q(status='confirmed') | Q(status__isnull=True)
-                    ).exists()
-                    
-                    if not has_any_active_booking:
-                        # No bookings at all - set to available
-                        if pc.booking_status != 'available':
-                            pc.booking_status = 'available'
-                            pc.save(update_fields=['booking_status'])
-            
-            # Ensure booking_status is correctly set before returning
-            # Double-check pending bookings one more time - THIS IS CRITICAL FOR ALL USERS
-            if pc.booking_status != 'in_use':
-                # Check for ANY pending booking (status is None/null)
-                pending_check = models.Booking.objects.filter(
-                    pc=pc,
-                    status__isnull=True
-                ).exclude(status='cancelled').order_by('-created_at').first()
-                
-                if pending_check:
-                    # Force status to in_queue if there's a pending booking
-                    if pc.booking_status != 'in_queue':
-                        pc.booking_status = 'in_queue'
-                        pc.save(update_fields=['booking_status'])
-                        print(f"✅ FIXED: PC {pc.name} (ID: {pc.id}) status set to in_queue (found pending booking ID: {pending_check.id})")
-                else:
-                    # No pending booking - verify status is correct
-                    if pc.booking_status == 'in_queue':
-                        # Status says in_queue but no pending booking - this shouldn't happen
-                        # But don't change it here, let the logic above handle it
-                        pass
-            
-            # Debug logging for in_queue status
-            if pc.booking_status == 'in_queue':
-                # Verify there's actually a pending booking
-                verify_pending = models.Booking.objects.filter(
-                    pc=pc,
-                    status__isnull=True
-                ).exclude(status='cancelled').exists()
-                if verify_pending:
-                    print(f"✅ CONFIRMED: PC {pc.name} (ID: {pc.id}) is in_queue with pending booking - RETURNING TO USER")
-                else:
-                    print(f"⚠️ WARNING: PC {pc.name} (ID: {pc.id}) status is in_queue but NO pending booking found!")
-            
-            # IMPORTANT: Always return the actual booking_status from the database
-            # Don't filter or modify it based on user permissions
-            final_booking_status = pc.booking_status or 'available'
-            
-            pc_statuses.append({
-                'id': pc.id,
-                'name': pc.name,
-                'status': pc.status,
-                'system_condition': pc.system_condition,
-                'booking_status': final_booking_status  # Always return the actual status
-            })
-            
-            # Debug: Log if this PC is in_queue
-            if final_booking_status == 'in_queue':
-                print(f"📤 API Response: PC {pc.name} (ID: {pc.id}) -> booking_status: 'in_queue' (returning to user {request.user.username})")
-        return JsonResponse({'pcs': pc_statuses})
+        snapshot = lab_state.get_snapshot()
+        since = request.GET.get('since')
+        if since is None:
+            response = HttpResponse(snapshot['pcs_json'], content_type='application/json')
+        else:
+            try:
+                since = int(since)
+            except ValueError:
+                return JsonResponse({'error': 'since must be a version number'}, status=400)
+            response = JsonResponse(lab_state.delta_since(snapshot, since))
+        # Let browsers keep the body and revalidate it with If-None-Match
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -600,13 +463,14 @@ def add_pc_from_form(request):
         sort_number = f"{prefix_zero}{sort_num}"
 
         # If no errors, create PC
-        models.PC.objects.create(
+        pc = models.PC.objects.create(
             name=name,
             ip_address=ip_address,
             status='connected',
             system_condition='active',
             sort_number=sort_number
         )
+        broadcast.pc_record_changed([pc.pk])
         messages.success(request, "PC added successfully.")
         return HttpResponseRedirect(reverse_lazy('main_app:pc-list'))
 
@@ -686,11 +550,7 @@ def submit_block_booking(request):
             return HttpResponseRedirect(reverse_lazy('main_app:reserve-pc'))
         
         # Check if requested number exceeds available PCs
-        available_pcs_count = models.PC.objects.filter(
-            status='connected',
-            system_condition='active',
-            booking_status__in=['available', None]
-        ).count()
+        available_pcs_count = occupancy.get_counts()['available']
         
         if num_of_devices > available_pcs_count:
             messages.error(
@@ -768,6 +628,10 @@ def submit_block_booking(request):
 @staff_required
 def delete_pc(request, pk):
     models.PC.objects.filter(pk=pk).delete()
+    broadcast.pc_record_changed([pk])
+    # Its bookings, violations and events went with it
+    from . import report_cache
+    report_cache.invalidate()
     messages.success(request, "PC deleted successfully.")
     return HttpResponseRedirect(reverse_lazy('main_app:pc-list'))
 
@@ -777,12 +641,11 @@ def get_pc_booking(request, pk):
     """Get booking information for a specific PC"""
     try:
         from django.utils import timezone
-        pc = models.PC.objects.get(pk=pk)
-        # Get the most recent active booking for this PC
-        booking = models.Booking.objects.filter(
-            pc=pc,
-            status__in=['confirmed', None]
-        ).exclude(status='cancelled').order_by('-created_at').first()
+        pc = models.PC.objects.select_related(
+            'current_booking__user__profile__college'
+        ).get(pk=pk)
+        # The running booking, otherwise the pending one
+        booking = pc.current_booking
         
         data = {
             'pc_name': pc.name,
@@ -821,10 +684,6 @@ def get_pc_booking(request, pk):
                     hours = int(remaining.total_seconds() // 3600)
                     minutes = int((remaining.total_seconds() % 3600) // 60)
                     data['time_remaining'] = f"{hours}h {minutes}m"
-                    # Also update PC booking_status if it's wrong
-                    if pc.booking_status != 'in_use':
-                        pc.booking_status = 'in_use'
-                        pc.save(update_fields=['booking_status'])
                 else:
                     data['time_remaining'] = 'Expired'
             elif pc.booking_status == 'in_use' and booking.end_time:
@@ -1028,15 +887,7 @@ def end_session(request, booking_id):
                 return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
             
             if booking:
-                pc = booking.pc
-                pc.booking_status = 'available'
-                pc.save()
-                
-                booking.status = 'cancelled'
-                booking.save()
-                
-                # Broadcast PC status update to all users
-                broadcast_pc_status_update(pc, f"PC {pc.name} is now available")
+                booking_state.end_session(booking)
                 
                 return JsonResponse({'success': True, 'message': 'Session ended successfully'})
             else:
@@ -1064,6 +915,8 @@ def extend_session(request, booking_id):
                 # Extend the end time
                 booking.end_time = booking.end_time + timedelta(minutes=minutes)
                 booking.save()
+                lab_state.bump_version([booking.pc_id])
+                scheduler.schedule_booking(booking)
                 
                 # Get user information
                 user_name = booking.user.get_full_name() or booking.user.username
@@ -1093,7 +946,7 @@ def extend_session(request, booking_id):
 @staff_required
 def analytics_dashboard(request):
     """Comprehensive analytics dashboard with descriptive and predictive analytics"""
-    from . import analytics
+    from . import report_cache
     
     period = request.GET.get('period', '30')
     try:
@@ -1103,7 +956,7 @@ def analytics_dashboard(request):
     except (ValueError, TypeError):
         period = 30
     
-    report = analytics.AnalyticsSummary.get_comprehensive_report(days=period)
+    report = report_cache.get_report(days=period)
     
     context = {
         'report': report,
@@ -1117,8 +970,7 @@ def analytics_dashboard(request):
 @staff_required
 def analytics_api(request):
     """API endpoint for analytics data (JSON)"""
-    from . import analytics
-    import json
+    from . import report_cache
     
     period = request.GET.get('period', '30')
     section = request.GET.get('section', 'all')  # all, descriptive, predictive
@@ -1130,14 +982,15 @@ def analytics_api(request):
     except (ValueError, TypeError):
         period = 30
     
-    report = analytics.AnalyticsSummary.get_comprehensive_report(days=period)
-    
-    # Filter by section if requested
+    # Filter by section if requested (only that half is computed)
     if section == 'descriptive':
+        report = report_cache.get_report(days=period, groups=('descriptive',))
         response_data = report['descriptive']
     elif section == 'predictive':
+        report = report_cache.get_report(days=period, groups=('predictive',))
         response_data = report['predictive']
     else:
+        report = report_cache.get_report(days=period)
         response_data = report
     
     # Convert datetime objects to ISO format strings for JSON serialization
@@ -1152,20 +1005,122 @@ def analytics_api(request):
     
     response_data = serialize_datetime(response_data)
     
-    return JsonResponse(response_data, safe=False)
+    response = JsonResponse(response_data, safe=False)
+    # Per-section compute times (also in the body as section_timings for section=all)
+    response['Server-Timing'] = ', '.join(
+        f"{name};dur={timing['seconds'] * 1000:.1f};desc=\"{'cached' if timing['cached'] else 'computed'}\""
+        for name, timing in report['section_timings'].items()
+    )
+    return response
+
+
+@login_required
+@staff_required
+def utilization_api(request):
+    """
+    PC occupancy from booking intervals (JSON): lab curve, daily series and
+    PC x hour heatmap. ``from``/``to`` (YYYY-MM-DD, inclusive) or ``days``
+    (7/14/30/60/90, ending today; default 7).
+    """
+    from . import utilization
+
+    today = timezone.localdate()
+    if request.GET.get('from') or request.GET.get('to'):
+        try:
+            start_day = datetime.strptime(request.GET.get('from', ''), '%Y-%m-%d').date()
+            end_day = datetime.strptime(request.GET.get('to') or today.isoformat(), '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'error': 'from and to must be dates (YYYY-MM-DD)'}, status=400)
+        if end_day < start_day:
+            return JsonResponse({'error': 'to must not be before from'}, status=400)
+        if (end_day - start_day).days >= utilization.MAX_DAYS:
+            return JsonResponse({'error': f'At most {utilization.MAX_DAYS} days per request'}, status=400)
+    else:
+        try:
+            days = int(request.GET.get('days', '7'))
+            if days not in [7, 14, 30, 60, 90]:
+                days = 7
+        except (ValueError, TypeError):
+            days = 7
+        start_day, end_day = today - timedelta(days=days - 1), today
+
+    return JsonResponse(utilization.get_occupancy(start_day, end_day))
+
+
+@login_required
+@staff_required
+def demand_forecast_api(request):
+    """Hourly and daily booking demand for the next 14 days with confidence bands (JSON)"""
+    from . import forecasting
+
+    try:
+        forecast = forecasting.get_forecast()
+    except forecasting.NotTrained as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    return JsonResponse(forecast)
+
+
+@login_required
+@staff_required
+def report_jobs(request):
+    """
+    GET: the latest report jobs. POST: submit one (``kind`` bookings or
+    analytics, ``format`` csv or xlsx, plus the export filters or ``period``);
+    an identical queued, running or still fresh job is returned instead.
+    """
+    from . import report_jobs as jobs
+
+    if request.method == 'POST':
+        try:
+            job, reused = jobs.submit(
+                request.POST.get('kind', ''),
+                request.POST.get('format', 'csv'),
+                request.POST,
+                user=request.user,
+            )
+        except jobs.InvalidJob as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return JsonResponse({'success': True, 'reused': reused, 'job': jobs.job_status(job)}, status=200 if reused else 202)
+
+    latest = models.ReportJob.objects.order_by('-created_at')[:20]
+    return JsonResponse({'jobs': [jobs.job_status(job) for job in latest]})
+
+
+@login_required
+@staff_required
+def report_job_status(request, pk):
+    """Progress of one report job (JSON), for polling"""
+    from . import report_jobs as jobs
+
+    job = get_object_or_404(models.ReportJob, pk=pk)
+    return JsonResponse(jobs.job_status(job))
+
+
+@login_required
+@staff_required
+def report_job_download(request, pk):
+    """Serve a finished report job's file from disk"""
+    from . import report_jobs as jobs
+
+    job = get_object_or_404(models.ReportJob, pk=pk, status='done')
+    path = jobs.file_path(job)
+    if path is None or not os.path.exists(path):
+        raise Http404("Report file no longer exists")
+    stamp = timezone.localtime(job.finished_at).strftime('%Y%m%d_%H%M')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{job.kind}_report_{stamp}.{job.file_format}')
 
 
 @login_required
 @staff_required
 def booking_predictions(request):
     """View booking trends and predictions"""
-    from . import analytics
+    from . import report_cache
     
     predictions = {
-        'peak_hours': analytics.PredictiveAnalytics.predict_peak_usage_hours(),
-        'peak_days': analytics.PredictiveAnalytics.predict_peak_usage_days(),
-        'booking_trends': analytics.PredictiveAnalytics.predict_booking_trends(),
-        'user_behavior': analytics.PredictiveAnalytics.predict_user_behavior_change(),
+        'peak_hours': report_cache.get_section('predictive', 'peak_usage_hours')['value'],
+        'peak_days': report_cache.get_section('predictive', 'peak_usage_days')['value'],
+        'booking_trends': report_cache.get_section('predictive', 'booking_trends')['value'],
+        'user_behavior': report_cache.get_section('predictive', 'user_behavior_changes')['value'],
     }
     
     context = {
@@ -1179,12 +1134,12 @@ def booking_predictions(request):
 @staff_required
 def risk_analysis(request):
     """View risk analysis - violation patterns and maintenance needs"""
-    from . import analytics
+    from . import report_cache
     
     risk_data = {
-        'high_risk_users': analytics.PredictiveAnalytics.predict_user_violation_risk(),
-        'maintenance_needs': analytics.PredictiveAnalytics.predict_pc_maintenance_needs(),
-        'anomalies': analytics.PredictiveAnalytics.anomaly_detection(),
+        'high_risk_users': report_cache.get_section('predictive', 'user_violation_risks')['value'],
+        'maintenance_needs': report_cache.get_section('predictive', 'pc_maintenance_needs')['value'],
+        'anomalies': report_cache.get_section('predictive', 'anomalies')['value'],
     }
     
     context = {
@@ -1198,8 +1153,8 @@ def risk_analysis(request):
 @staff_required
 def resource_demand_forecast(request):
     """View resource demand forecast for upcoming faculty bookings"""
-    from . import analytics
-    demand = analytics.PredictiveAnalytics.predict_resource_demand()
+    from . import report_cache
+    demand = report_cache.get_section('predictive', 'resource_demand')['value']
 
     # Pre-compute average daily demand for template (avoid complex math filters)
     upcoming = demand.get('upcoming_resource_demand') or []
@@ -1224,17 +1179,15 @@ def resource_demand_forecast(request):
 @staff_required
 def quality_dashboard(request):
     """ISO/IEC 25010 product quality model overview for PCheck"""
-    from . import analytics
+    from . import report_cache
     from django.utils import timezone
-    from datetime import timedelta
 
-    # Use existing analytics for quality indicators
+    # Use existing (cached) analytics for quality indicators
     period = 30
-    start_date = timezone.now() - timedelta(days=period)
-    desc_bookings = analytics.DescriptiveAnalytics.get_booking_statistics(start_date, timezone.now())
-    desc_violations = analytics.DescriptiveAnalytics.get_violation_statistics(start_date, timezone.now())
-    desc_util = analytics.DescriptiveAnalytics.get_pc_utilization()
-    anomalies = analytics.PredictiveAnalytics.anomaly_detection()
+    desc_bookings = report_cache.get_section('descriptive', 'bookings', period)['value']
+    desc_violations = report_cache.get_section('descriptive', 'violations', period)['value']
+    desc_util = report_cache.get_section('descriptive', 'pc_utilization', period)['value']
+    anomalies = report_cache.get_section('predictive', 'anomalies')['value']
 
     # Map to ISO 25010 characteristics (summary indicators for the dashboard)
     quality_indicators = {
@@ -1413,62 +1366,32 @@ def quality_evaluation_export(request):
 @login_required
 @staff_required
 def export_report(request):
-    """Export analytics report as CSV"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime, timedelta
-    
-    period = request.GET.get('period', 'daily')
-    
-    # Determine date range based on period
-    today = datetime.now()
-    if period == 'daily':
-        start_date = today - timedelta(days=1)
-        filename = f'report_daily_{today.strftime("%Y%m%d")}.csv'
-    elif period == 'weekly':
-        start_date = today - timedelta(days=7)
-        filename = f'report_weekly_{today.strftime("%Y%m%d")}.csv'
-    elif period == 'monthly':
-        start_date = today - timedelta(days=30)
-        filename = f'report_monthly_{today.strftime("%Y%m%d")}.csv'
-    else:
-        start_date = today - timedelta(days=1)
-        filename = f'report_{today.strftime("%Y%m%d")}.csv'
-    
-    # Get booking data
-    bookings = models.Booking.objects.filter(created_at__gte=start_date)
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
+    """
+    Export bookings as CSV, streamed as it is written (see main_app.exports).
+
+    ``period`` (daily/weekly/monthly) or ``from``/``to``, optional ``status``,
+    ``college``, ``pc`` and ``user`` filters; ``gzip=1`` downloads a .csv.gz.
+    """
+    from . import exports
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+
+    try:
+        params = exports.parse_params(request.GET)
+    except exports.InvalidExport as e:
+        return HttpResponseBadRequest(str(e))
+
+    compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+    rows = exports.booking_rows(exports.bookings(params['start'], params['end'], params['filters']))
+    chunks = exports.stream_csv(rows, compress=compress)
+    if isinstance(request, ASGIRequest):
+        chunks = exports.async_chunks(chunks)
+    response = StreamingHttpResponse(
+        chunks,
+        content_type='application/gzip' if compress else 'text/csv',
+    )
+    filename = f"report_{params['label']}.csv" + ('.gz' if compress else '')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    writer = csv.writer(response)
-    
-    # Write header
-    writer.writerow(['Date', 'Time', 'User', 'PC Name', 'College', 'Status', 'Duration (minutes)'])
-    
-    # Write data rows
-    for booking in bookings:
-        duration_minutes = 0
-        if booking.duration:
-            duration_minutes = int(booking.duration.total_seconds() / 60)
-        
-        user_college = (
-            booking.user.profile.college.name
-            if hasattr(booking.user, 'profile') and booking.user.profile.college
-            else 'N/A'
-        )
-        
-        writer.writerow([
-            booking.created_at.strftime('%Y-%m-%d'),
-            booking.created_at.strftime('%H:%M:%S'),
-            booking.user.get_full_name(),
-            booking.pc.name if booking.pc else 'N/A',
-            user_college,
-            booking.status or 'Pending',
-            duration_minutes
-        ])
-    
     return response
 
 
@@ -1485,44 +1408,6 @@ def reserve_pc(request):
                     "error": "Missing pc_id or duration"
                 }, status=400)
 
-            # Check if user already has an active booking (confirmed or in queue)
-            # First check for pending bookings (in queue)
-            pending_booking = models.Booking.objects.filter(
-                user=request.user,
-                status__isnull=True
-            ).exclude(status='cancelled').first()
-            
-            if pending_booking:
-                return JsonResponse({
-                    "success": False,
-                    "error": "You already have a booking in queue. Please wait for approval or cancellation before booking another PC."
-                }, status=400)
-            
-            # Check for confirmed bookings that haven't expired
-            now = timezone.now()
-            confirmed_bookings = models.Booking.objects.filter(
-                user=request.user,
-                status='confirmed'
-            ).exclude(status='cancelled')
-            
-            for booking in confirmed_bookings:
-                if booking.end_time:
-                    if booking.end_time.tzinfo:
-                        remaining = booking.end_time - now
-                    else:
-                        remaining = booking.end_time - datetime.now()
-                    if remaining.total_seconds() > 0:
-                        return JsonResponse({
-                            "success": False,
-                            "error": "You already have an active booking. Please wait for your current booking to end before booking another PC."
-                        }, status=400)
-                else:
-                    # Confirmed booking without end_time, consider it active
-                    return JsonResponse({
-                        "success": False,
-                        "error": "You already have an active booking. Please wait for your current booking to end before booking another PC."
-                    }, status=400)
-
             # Check for active violations that prevent booking
             active_violation = models.Violation.objects.filter(
                 user=request.user,
@@ -1561,25 +1446,6 @@ def reserve_pc(request):
                     "error": f"PC {pc.name} is currently offline and not available for reservation."
                 }, status=400)
             
-            # Check if PC is already booked
-            # IMPORTANT: do NOT rely only on PC.booking_status (it can be stale on some pages).
-            # Block reservation if there is any active confirmed booking or any pending (in_queue) booking.
-            has_pending_booking = models.Booking.objects.filter(
-                pc=pc,
-                status__isnull=True
-            ).exclude(status='cancelled').exists()
-            has_active_confirmed_booking = models.Booking.objects.filter(
-                pc=pc,
-                status='confirmed',
-                end_time__gt=timezone.now()
-            ).exclude(status='cancelled').exists()
-
-            if has_pending_booking or has_active_confirmed_booking or pc.booking_status in ['in_use', 'in_queue']:
-                return JsonResponse({
-                    "success": False,
-                    "error": f"PC {pc.name} is already booked or in queue."
-                }, status=400)
-            
             # Convert duration (minutes) to DurationField (timedelta)
             duration_timedelta = timedelta(minutes=int(duration))
             
@@ -1595,59 +1461,19 @@ def reserve_pc(request):
                     "error": error_msg
                 }, status=400)
             
-            # Create the booking first
-            booking = models.Booking.objects.create(
-                user=request.user,
-                pc=pc,
-                start_time=timezone.now(),
-                duration=duration_timedelta,
-            )
-            
-            print(f"Booking created successfully: {booking.id}, status={booking.status}")
-            
-            # Verify the booking status is None (pending)
-            if booking.status is None:
-                print(f"✅ Booking {booking.id} has status=None (pending/in_queue)")
-            else:
-                print(f"⚠️ WARNING: Booking {booking.id} has status={booking.status}, expected None")
-            
-            # Now set PC to in_queue AFTER booking is created
-            pc.reserve()
-            # Force save to ensure it's persisted
-            pc.save(update_fields=['booking_status'])
-            
-            # Refresh PC from database to ensure we have the latest status
-            pc.refresh_from_db()
-            
-            print(f"PC {pc.name} booking_status after reserve: {pc.booking_status}")
-            
-            # Verify PC status is in_queue
-            if pc.booking_status == 'in_queue':
-                print(f"✅ PC {pc.name} status is correctly set to in_queue")
-            else:
-                print(f"⚠️ WARNING: PC {pc.name} status is {pc.booking_status}, expected in_queue")
-                # Force it to in_queue if it's not
-                pc.booking_status = 'in_queue'
-                pc.save(update_fields=['booking_status'])
-                pc.refresh_from_db()
-                print(f"🔧 FORCED: PC {pc.name} status set to in_queue")
-            
-            # Verify there's a pending booking for this PC
-            pending_check = models.Booking.objects.filter(
-                pc=pc,
-                status__isnull=True
-            ).exclude(status='cancelled').exists()
-            
-            if pending_check:
-                print(f"✅ Verified: Pending booking exists for PC {pc.name}")
-            else:
-                print(f"⚠️ WARNING: No pending booking found for PC {pc.name} even though booking was just created!")
-            
-            # Broadcast PC status update to all users - this should show in_queue status
-            print(f"📤 Broadcasting PC status update for {pc.name} with booking_status: {pc.booking_status}")
-            # Use a fresh PC object from database to ensure we have the latest status
-            pc_fresh = models.PC.objects.get(id=pc.id)
-            broadcast_pc_status_update(pc_fresh, f"PC {pc.name} is now in queue")
+            # Create the pending booking; the state machine puts the PC in the
+            # queue and broadcasts the change to all users. The live slot
+            # constraints reject it if the user or the PC already has a
+            # pending or running booking, even when two requests race.
+            try:
+                booking = booking_state.reserve(request.user, pc, duration_timedelta)
+            except booking_state.SlotTaken as e:
+                if e.slot == 'user':
+                    error = "You already have an active booking or a booking in queue. Please wait for it to end, be approved or be cancelled before booking another PC."
+                else:
+                    error = f"PC {pc.name} is already booked or in queue."
+                return JsonResponse({"success": False, "error": error}, status=400)
+            print(f"Booking created successfully: {booking.id}, PC {pc.name} is now in queue")
             
             scheme = 'https' if request.is_secure() else 'http'
             host = request.get_host()
@@ -2294,15 +2120,7 @@ def reservation_approved(request, pk):
             messages.error(request, "PC not found for this reservation.")
             return HttpResponseRedirect(reverse_lazy('main_app:bookings'))
         
-        pc.approve()
-        booking.start_time = timezone.now()
-        # booking.duration is already a timedelta, so use it directly
-        booking.end_time = booking.start_time + booking.duration
-        booking.status = 'confirmed'
-        booking.save()
-        
-        # Broadcast PC status update to all users
-        broadcast_pc_status_update(pc, f"PC {pc.name} is now in use")
+        booking_state.approve(booking)
         
         messages.success(request, f"Reservation for {pc.name} has been approved.")
         return HttpResponseRedirect(reverse_lazy('main_app:bookings'))
@@ -2324,13 +2142,7 @@ def reservation_declined(request, pk):
             messages.error(request, "PC not found for this reservation.")
             return HttpResponseRedirect(reverse_lazy('main_app:bookings'))
         
-        pc.decline()
-        booking.status = 'cancelled'
-        booking.start_time = timezone.now()
-        booking.save()
-        
-        # Broadcast PC status update to all users
-        broadcast_pc_status_update(pc, f"PC {pc.name} is now available")
+        booking_state.decline(booking)
         
         messages.success(request, f"Reservation for {pc.name} has been declined.")
         return HttpResponseRedirect(reverse_lazy('main_app:bookings'))
@@ -2534,52 +2346,29 @@ def faculty_booking_qr_access(request, pk):
             num_pcs_needed = booking.num_of_devices or 1
             
             # Get available PCs (not in repair, connected, and available)
-            available_pcs = models.PC.objects.filter(
+            available_pcs = list(models.PC.objects.filter(
                 system_condition='active',
                 status='connected',
                 booking_status='available'
-            ).order_by('sort_number', 'name')[:num_pcs_needed]
+            ).order_by('sort_number', 'name')[:num_pcs_needed])
             
-            if available_pcs.count() < num_pcs_needed:
-                messages.warning(request, f"Only {available_pcs.count()} PC(s) available out of {num_pcs_needed} requested.")
+            if len(available_pcs) < num_pcs_needed:
+                messages.warning(request, f"Only {len(available_pcs)} PC(s) available out of {num_pcs_needed} requested.")
             
-            # Create bookings and mark PCs as in_use
-            assigned_pcs = []
-            for pc in available_pcs:
-                # Mark PC as in_use
-                pc.booking_status = 'in_use'
-                pc.save(update_fields=['booking_status'])
-                
-                # Broadcast PC status update to all users
-                broadcast_pc_status_update(pc, f"PC {pc.name} is now in use (bulk booking)")
-                
-                # Create a booking record for tracking (linked to faculty booking)
-                # Use the faculty user as the booking user, or create a system booking
-                booking_user = booking.faculty if booking.faculty else request.user
-                
-                # Calculate end time if start and end datetime are set
-                end_time = None
-                if booking.start_datetime and booking.end_datetime:
-                    duration = booking.end_datetime - booking.start_datetime
-                    start_time = timezone.now()
-                    end_time = start_time + duration
-                elif booking.start_datetime:
-                    # If only start time is set, use a default duration (e.g., 2 hours)
-                    start_time = timezone.now()
-                    end_time = start_time + timedelta(hours=2)
-                else:
-                    start_time = timezone.now()
-                    end_time = start_time + timedelta(hours=2)
-                
-                booking_record = models.Booking.objects.create(
-                    user=booking_user,
-                    pc=pc,
-                    faculty_booking=booking,
-                    start_time=start_time,
-                    end_time=end_time,
-                    status='confirmed'
-                )
-                assigned_pcs.append(pc.name)
+            # Create a booking record per PC (linked to faculty booking) and mark PCs as in_use
+            # Use the faculty user as the booking user, or create a system booking
+            booking_user = booking.faculty if booking.faculty else request.user
+            
+            # Calculate end time if start and end datetime are set
+            start_time = timezone.now()
+            if booking.start_datetime and booking.end_datetime:
+                end_time = start_time + (booking.end_datetime - booking.start_datetime)
+            else:
+                # If the block has no end, use a default duration (e.g., 2 hours)
+                end_time = start_time + timedelta(hours=2)
+            
+            booking_state.assign_faculty_pcs(booking, booking_user, available_pcs, start_time, end_time)
+            assigned_pcs = [pc.name for pc in available_pcs]
             
             if assigned_pcs:
                 print(f"DEBUG: Assigned {len(assigned_pcs)} PC(s) to faculty booking {booking.id}: {', '.join(assigned_pcs)}")
@@ -2676,6 +2465,7 @@ def violation_create_user(request, user_id):
         suspension_end_date=suspension_end_date,
         violation_slip_received=False
     )
+    scheduler.schedule_violation(violation)
 
     # Send notification to user via WebSocket
     try:
@@ -2716,6 +2506,7 @@ def unsuspend(request, pk):
             violation.status = 'active'
             violation.resolved = True
             violation.save(update_fields=['status', 'resolved', 'violation_slip_received'])
+            scheduler.schedule_violation(violation)
             
             # Send notification to user
             try:
@@ -2743,6 +2534,7 @@ def unsuspend(request, pk):
             violation.status = 'active'
             violation.resolved = True
             violation.save(update_fields=['status', 'resolved'])
+            scheduler.schedule_violation(violation)
             
             # Send notification to user
             try:
@@ -2843,15 +2635,8 @@ def cancel_reservation(request):
                 else:
                     booking = get_object_or_404(models.Booking, pk=booking_id, user=request.user)
                 
-                booking.status = 'cancelled'
-                booking.save()
-                
-                # Free up the PC
-                if booking.pc:
-                    booking.pc.booking_status = 'available'
-                    booking.pc.save()
-                    # Broadcast PC status update to all users
-                    broadcast_pc_status_update(booking.pc, f"PC {booking.pc.name} is now available")
+                # Cancel the booking and free up the PC
+                booking_state.cancel(booking)
                     
                 return JsonResponse({
                     "success": True,
@@ -2860,21 +2645,9 @@ def cancel_reservation(request):
             # Fallback to old behavior if only pc_id provided
             elif pc_id:
                 pc = models.PC.objects.get(pk=pc_id)
-                pc.booking_status = 'available'
-                pc.save()
                 
-                # Broadcast PC status update to all users
-                broadcast_pc_status_update(pc, f"PC {pc.name} is now available")
-                
-                # Also cancel any pending booking for this user and PC
-                booking = models.Booking.objects.filter(
-                    user=request.user,
-                    pc=pc,
-                    status__isnull=True
-                ).first()
-                if booking:
-                    booking.status = 'cancelled'
-                    booking.save()
+                # Cancel any pending booking for this user and PC, then free the PC
+                booking_state.cancel_pending_for_pc(request.user, pc)
                 
                 return JsonResponse({
                     "success": True,
@@ -2929,7 +2702,7 @@ class PCListView(StaffRequiredMixin, LoginRequiredMixin, FormMixin, ListView):
             "form": self.get_form(),
             "pc_list": pc_list,
             "section": "pc_list",
-            "total_pcs": models.PC.objects.count(),
+            "total_pcs": occupancy.get_counts()['total'],
         }
         return context
 
@@ -2965,6 +2738,7 @@ class PCListView(StaffRequiredMixin, LoginRequiredMixin, FormMixin, ListView):
             sort_number = f"{prefix_zero}{sort_number}"
             f.sort_number = sort_number
             f.save()
+            broadcast.pc_record_changed([f.pk])
             messages.success(request, "PC saved successfully!")
             return redirect(self.get_success_url())
         else:
@@ -2998,14 +2772,7 @@ class ReservationApprovalDetailView(StaffRequiredMixin, LoginRequiredMixin, Temp
         try:
             reservation = models.Booking.objects.get(id=self.kwargs['pk'])
             pc = reservation.pc
-            pc.approve()  # Mark PC as in_use (green)
-            reservation.start_time = timezone.now()
-            reservation.end_time = reservation.start_time + reservation.duration
-            reservation.status = 'confirmed'
-            reservation.save()
-            
-            # Broadcast PC status update to all users
-            broadcast_pc_status_update(pc, f"PC {pc.name} is now in use")
+            booking_state.approve(reservation)  # Mark PC as in_use (green)
             
             # Send WebSocket notification to the user who made the booking
             try:
@@ -3061,6 +2828,11 @@ class PCUpdateView(StaffRequiredMixin, LoginRequiredMixin, SuccessMessageMixin,
     def get_queryset(self, **kwargs):
         return models.PC.objects.filter(pk=self.kwargs['pk'])
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        broadcast.pc_record_changed([self.object.pk])
+        return response
+
 
 class BookingListView(StaffRequiredMixin, LoginRequiredMixin, ListView):
     model = models.Booking
@@ -3127,6 +2899,13 @@ class ReservePCListView(LoginRequiredMixin, ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        counts = occupancy.get_counts()
+        context['total_pc'] = counts['total']  # total number of PCs in database
+        context['colleges'] = models.College.objects.all()
+        context['connected_pcs'] = counts['connected']
+        # Truly available PCs (not offline, not in repair, not booked)
+        context['available_count'] = counts['available']
+
         # Check for active violations
         active_violation = models.Violation.objects.filter(
             user=self.request.user,
@@ -3154,86 +2933,12 @@ class ReservePCListView(LoginRequiredMixin, ListView):
         return context
     
     def get_queryset(self):
-        from django.utils import timezone
-        qs = super().get_queryset()
-        
-        # Sync PC booking_status with actual confirmed bookings
-        # This ensures PCs with confirmed bookings show as 'in_use' not 'in_queue'
-        # Force evaluation of queryset to get all PCs
-        all_pcs = list(qs)
-        
-        for pc in all_pcs:
-            # Check if there's a confirmed booking for this PC that hasn't expired
-            confirmed_booking = models.Booking.objects.filter(
-                pc=pc,
-                status='confirmed'
-            ).exclude(status='cancelled').order_by('-created_at').first()
-            
-            if confirmed_booking:
-                # If booking is confirmed and not expired, PC should be 'in_use'
-                if confirmed_booking.end_time:
-                    now = timezone.now()
-                    if confirmed_booking.end_time > now:
-                        # Booking is still active - PC should be in_use
-                        if pc.booking_status != 'in_use':
-                            pc.booking_status = 'in_use'
-                            pc.save(update_fields=['booking_status'])
-                    else:
-                        # Booking has expired - PC should be available
-                        if pc.booking_status != 'available':
-                            pc.booking_status = 'available'
-                            pc.save(update_fields=['booking_status'])
-                else:
-                    # No end_time set, but booking is confirmed - PC should be in_use
-                    if pc.booking_status != 'in_use':
-                        pc.booking_status = 'in_use'
-                        pc.save(update_fields=['booking_status'])
-            else:
-                # Check if there's a pending booking (in_queue)
-                pending_booking = models.Booking.objects.filter(
-                    pc=pc,
-                    status__isnull=True
-                ).exclude(status='cancelled').order_by('-created_at').first()
-                
-                if pending_booking:
-                    # Booking exists but not confirmed yet - PC should be in_queue
-                    if pc.booking_status != 'in_queue':
-                        pc.booking_status = 'in_queue'
-                        pc.save(update_fields=['booking_status'])
-                elif pc.booking_status in ['in_use', 'in_queue']:
-                    # No active booking but PC status is not available
-                    # Check if there are any expired bookings
-                    expired_booking = models.Booking.objects.filter(
-                        pc=pc,
-                        status='confirmed',
-                        end_time__lt=timezone.now()
-                    ).order_by('-created_at').first()
-                    
-                    if expired_booking or not models.Booking.objects.filter(
-                        pc=pc,
-                        status__in=['confirmed', None]
-                    ).exclude(status='cancelled').exists():
-                        # No active bookings, set to available
-                        if pc.booking_status != 'available':
-                            pc.booking_status = 'available'
-                            pc.save(update_fields=['booking_status'])
-        
-        # Return all PCs, not just connected ones
-        print(f"Total PCs in database: {len(all_pcs)}")
-        return models.PC.objects.all().order_by('sort_number')
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['total_pc'] = models.PC.objects.count()  # total number of PCs in database
-        context['colleges'] = models.College.objects.all()
-        context['connected_pcs'] = models.PC.objects.filter(status='connected').count()
-        # Calculate truly available PCs (not offline, not in repair, not booked)
-        context['available_count'] = models.PC.objects.filter(
-            status='connected',
-            system_condition='active',
-            booking_status__in=['available', None]
-        ).count()
-        return context
+        # Return all PCs, not just connected ones, each joined to its current
+        # booking and user. The queryset stays lazy, so the paginator only
+        # evaluates it for the 12 PCs on the requested page.
+        return pc_status.annotate_booking_state(
+            models.PC.objects.select_related('current_booking__user').order_by('sort_number')
+        )
     
 
 @login_required
@@ -3461,6 +3166,7 @@ def pc_notification_page(request):
 
 @never_cache
 @require_GET
+@lab_state.conditional(lab_state.pc_session_etag)
 def pc_session_status(request):
     """Return the active booking status for a PC for polling-based warnings."""
     now = timezone.now()
@@ -3480,14 +3186,16 @@ def pc_session_status(request):
             status=400,
         )
 
-    pc = models.PC.objects.filter(name__iexact=pc_name).first()
+    # Answered from the in-memory session table, without a database query
+    _, sessions = lab_state.session_table()
+    pc_found = pc_name.lower() in sessions
     response = {
         'pc_name': pc_name,
-        'pc_found': bool(pc),
+        'pc_found': pc_found,
         'has_booking': False,
         'should_warn': False,
-        'message': 'PC not registered.' if not pc else '',
-        'status': 'pc_not_found' if not pc else 'idle',
+        'message': 'PC not registered.' if not pc_found else '',
+        'status': 'pc_not_found' if not pc_found else 'idle',
         'minutes_left': None,
         'seconds_left': None,
         'booking_id': None,
@@ -3496,60 +3204,38 @@ def pc_session_status(request):
         'timestamp': now.isoformat(),
     }
 
-    if not pc:
+    if not pc_found:
         return JsonResponse(response, status=404)
 
-    booking = (
-        models.Booking.objects.filter(
-            pc=pc,
-            status='confirmed',
-            expiry__isnull=True,
-        )
-        .filter(Q(start_time__isnull=True) | Q(start_time__lte=now))
-        .filter(end_time__isnull=False, end_time__gte=now)
-        .order_by('end_time')
-        .first()
-    )
-
-    if not booking:
+    session = lab_state.current_session(sessions, pc_name, now)
+    if not session:
         response['message'] = 'No active booking for this PC.'
         return JsonResponse(response)
 
-    remaining = booking.end_time - now if booking.end_time else None
-    seconds_left = int(remaining.total_seconds()) if remaining is not None else None
-    if seconds_left is not None and seconds_left < 0:
-        seconds_left = 0
-
-    minutes_left = None
-    if seconds_left is not None:
-        minutes_left = max(0, (seconds_left + 59) // 60)
+    booking_id, _, end_time = session
+    seconds_left = max(0, int((end_time - now).total_seconds()))
+    minutes_left = (seconds_left + 59) // 60
 
     should_warn = False
     status_label = 'active'
 
-    if seconds_left is None:
-        message = 'Active booking detected.'
-    elif seconds_left == 0:
+    if seconds_left == 0:
         status_label = 'expired'
         message = 'Booking has reached its end time.'
     elif seconds_left <= 5 * 60:
         should_warn = True
         status_label = 'warning'
-        display_minutes = max(1, minutes_left or 0)
+        display_minutes = max(1, minutes_left)
         plural = '' if display_minutes == 1 else 's'
         message = f'Your session will end in {display_minutes} minute{plural}. Please save your work!'
     else:
-        status_label = 'active'
-        if minutes_left is not None:
-            plural = '' if minutes_left == 1 else 's'
-            message = f'Session in progress. {minutes_left} minute{plural} remaining.'
-        else:
-            message = 'Session in progress.'
+        plural = '' if minutes_left == 1 else 's'
+        message = f'Session in progress. {minutes_left} minute{plural} remaining.'
 
     warning_signature = None
     if should_warn:
         # Include seconds in warning signature to allow refreshed messaging as time decreases
-        warning_signature = f'{booking.id}:{minutes_left}:{seconds_left}'
+        warning_signature = f'{booking_id}:{minutes_left}:{seconds_left}'
 
     response.update(
         {
@@ -3560,8 +3246,8 @@ def pc_session_status(request):
             'status': status_label,
             'minutes_left': minutes_left,
             'seconds_left': seconds_left,
-            'booking_id': booking.id,
-            'end_time': booking.end_time.isoformat() if booking.end_time else None,
+            'booking_id': booking_id,
+            'end_time': end_time.isoformat(),
             'warning_signature': warning_signature,
         }
     )
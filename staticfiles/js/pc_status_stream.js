@@ -0,0 +1,161 @@
+// Live PC status stream (ws/pc-status-updates/).
+//
+// One WebSocket per page, shared by every subscriber. The server sends a
+// `pc_status_snapshot` on connect and then one `pc_status_batch` per committed
+// transaction (every PC it changed), stamped with the lab-state `version`. On reconnect, on a version gap, or when a heartbeat
+// reports a newer version, we ask for the changes since the last version we
+// applied, so nothing is missed and no status polling is needed.
+(function () {
+  if (window.PCStatusStream) {
+    return;
+  }
+
+  var HEARTBEAT_MS = 30000;
+  var subscribers = [];
+  var socket = null;
+  var version = null;
+  var heartbeatTimer = null;
+  var reconnectTimer = null;
+  var reconnectAttempts = 0;
+
+  function notify(kind, data) {
+    subscribers.forEach(function (handlers) {
+      var handler = handlers[kind];
+      if (typeof handler === 'function') {
+        try {
+          handler(data);
+        } catch (e) {
+          console.error('PC status subscriber failed:', e);
+        }
+      }
+    });
+  }
+
+  function changed(data) {
+    document.dispatchEvent(new CustomEvent('pcstatus:changed', { detail: data }));
+  }
+
+  function send(message) {
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(message));
+    }
+  }
+
+  function resume() {
+    if (version === null) {
+      send({ type: 'resume' });
+    } else {
+      send({ type: 'resume', since: version });
+    }
+  }
+
+  function handleMessage(data) {
+    if (data.type === 'pc_status_snapshot') {
+      version = data.version;
+      notify('onSnapshot', data);
+      changed(data);
+    } else if (data.type === 'pc_status_batch' || data.type === 'pc_status_update') {
+      if (version !== null && data.version < version) {
+        return; // Already covered by a newer snapshot
+      }
+      if (version !== null && data.version > version + 1) {
+        resume(); // Missed changes (e.g. PC edits that are not broadcast)
+        return;
+      }
+      version = data.version;
+      // A batch carries every PC changed by one transaction; hand them to
+      // subscribers one at a time, with the batch's version and count
+      var updates = data.type === 'pc_status_batch' ? data.pcs : [data];
+      updates.forEach(function (update) {
+        notify('onUpdate', Object.assign({}, update, {
+          type: 'pc_status_update',
+          version: data.version,
+          available_pcs_count: data.available_pcs_count
+        }));
+      });
+      changed(data);
+    } else if (data.type === 'heartbeat_ack') {
+      if (version !== null && data.version > version) {
+        resume();
+      }
+    }
+  }
+
+  function connect() {
+    var protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    var url = protocol + '//' + window.location.host + '/ws/pc-status-updates/';
+    if (version !== null) {
+      url += '?since=' + encodeURIComponent(version);
+    }
+
+    try {
+      socket = new WebSocket(url);
+    } catch (e) {
+      console.error('Error creating PC Status WebSocket:', e);
+      scheduleReconnect();
+      return;
+    }
+
+    socket.onopen = function () {
+      console.log('✅ PC Status WebSocket connected');
+      reconnectAttempts = 0;
+      clearInterval(heartbeatTimer);
+      heartbeatTimer = setInterval(function () {
+        send({ type: 'heartbeat' });
+      }, HEARTBEAT_MS);
+    };
+
+    socket.onmessage = function (event) {
+      try {
+        handleMessage(JSON.parse(event.data));
+      } catch (e) {
+        console.error('Error parsing PC status message:', e);
+      }
+    };
+
+    socket.onclose = function () {
+      console.log('❌ PC Status WebSocket closed, reconnecting...');
+      clearInterval(heartbeatTimer);
+      heartbeatTimer = null;
+      scheduleReconnect();
+    };
+  }
+
+  function scheduleReconnect() {
+    if (reconnectTimer) {
+      return;
+    }
+    reconnectAttempts += 1;
+    var delay = Math.min(1000 * Math.pow(2, reconnectAttempts - 1), 30000);
+    reconnectTimer = setTimeout(function () {
+      reconnectTimer = null;
+      connect();
+    }, delay);
+  }
+
+  document.addEventListener('visibilitychange', function () {
+    if (document.hidden || !socket) {
+      return;
+    }
+    if (socket.readyState === WebSocket.CLOSED) {
+      clearTimeout(reconnectTimer);
+      reconnectTimer = null;
+      connect();
+    } else {
+      resume();
+    }
+  });
+
+  window.PCStatusStream = {
+    // handlers: { onSnapshot(data), onUpdate(data) }
+    subscribe: function (handlers) {
+      subscribers.push(handlers);
+      if (!socket) {
+        connect();
+      } else if (version !== null) {
+        send({ type: 'resume' }); // Late subscriber: everyone gets a full snapshot
+      }
+    },
+    resume: resume,
+  };
+})();
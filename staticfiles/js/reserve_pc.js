@@ -1999,20 +1999,16 @@ function initReservePC() {
   // Check and show floating booking button
   checkAndShowFloatingBookingButton();
   
-  // Periodically check and update PC selection state (every 5 seconds for faculty, 10 for student)
-  setInterval(function() {
+  // Re-check PC selection state and the floating booking button whenever a PC
+  // changes state (pushed by PCStatusStream); the floating countdown ticks locally
+  document.addEventListener('pcstatus:changed', function() {
     checkAndDisablePCSelection();
-  }, 10000);
-  
-  // Check faculty booking status more frequently to catch status changes
-  setInterval(function() {
     checkAndDisableFacultyPCSelection();
-  }, 5000);
-  
-  // Periodically update floating booking button (every second for countdown)
-  setInterval(function() {
     updateFloatingBookingButton();
-  }, 1000);
+  });
+  if (window.PCStatusStream) {
+    window.PCStatusStream.subscribe({});
+  }
   });
 }
 